@@ -0,0 +1,170 @@
+"""
+Асинхронный режим Telegram бота на AsyncTeleBot
+"""
+
+import asyncio
+import logging
+
+from telebot import asyncio_helper
+
+from bot_client import AsyncBotClient
+from broadcaster import AsyncBroadcaster
+from chat_cache import AsyncChatCache
+from config import BOT_TOKEN, BOT_MODE, ASYNC_REQUEST_LIMIT, WEBHOOK_URL, WEBHOOK_WORKERS
+from database import AsyncDatabase, create_database
+from async_handlers import AsyncBotHandlers
+from async_scheduler import AsyncMessageScheduler
+from health import AsyncChannelHealthChecker
+from media import AsyncMediaPublisher
+import metrics
+from outbox import AsyncOutbox
+from profiling import instrument_bot
+from rate_limiter import AsyncRateLimiter
+from webhook import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+class AsyncTelegramBot:
+    """Бот, у которого обработчики, рассылка и планировщик — корутины
+    на одном цикле событий с общим пулом соединений aiohttp."""
+
+    def __init__(self):
+        self.rate_limiter = AsyncRateLimiter()
+        self.bot = AsyncBotClient(BOT_TOKEN, self.rate_limiter)
+        self.database = AsyncDatabase(create_database())
+        self.broadcaster = AsyncBroadcaster()
+        self.chat_cache = AsyncChatCache(self.bot)
+        self.outbox = AsyncOutbox(self.bot, self.database, AsyncMediaPublisher(self.bot, self.broadcaster))
+        self.handlers = AsyncBotHandlers(self.bot, self.database, self.broadcaster, self.chat_cache, self.outbox)
+        self.health_checker = AsyncChannelHealthChecker(self.database, self.chat_cache)
+        self.scheduler = None
+        self.metrics_server = None
+
+    def _setup_metrics(self):
+        """Значения метрик, которые считываются при каждом запросе"""
+        # Метрики читаются из потока HTTP-сервера, поэтому обращаемся к хранилищу напрямую
+        metrics.PENDING_POSTS.set_function(self.database.database.count_scheduled_posts)
+        metrics.USER_STATES.set_function(lambda: len(self.handlers.user_states))
+        metrics.OUTBOX_PENDING.set_function(self.database.database.count_deliveries)
+        metrics.OUTBOX_DEAD.set_function(lambda: self.database.database.count_deliveries(dead=True))
+        self.metrics_server = metrics.start_metrics_server()
+
+    def _setup_handlers(self):
+        """Настройка обработчиков команд и сообщений"""
+
+        @self.bot.message_handler(commands=['start'])
+        async def start_handler(message):
+            await self.handlers.start_command(message)
+
+        @self.bot.message_handler(commands=['help'])
+        async def help_handler(message):
+            await self.handlers.help_command(message)
+
+        @self.bot.message_handler(commands=['post'])
+        async def post_handler(message):
+            await self.handlers.post_command(message)
+
+        @self.bot.message_handler(commands=['schedule'])
+        async def schedule_handler(message):
+            await self.handlers.schedule_command(message)
+
+        @self.bot.message_handler(commands=['manage'])
+        async def manage_handler(message):
+            await self.handlers.manage_command(message)
+
+        @self.bot.message_handler(commands=['import'])
+        async def import_handler(message):
+            await self.handlers.import_command(message)
+
+        @self.bot.message_handler(commands=['profile'])
+        async def profile_handler(message):
+            await self.handlers.profile_command(message)
+
+        @self.bot.callback_query_handler(func=lambda call: True)
+        async def callback_handler(call):
+            await self.handlers.handle_callback(call)
+
+        @self.bot.message_handler(content_types=['text'])
+        async def message_handler(message):
+            await self.handlers.handle_message(message)
+
+        @self.bot.message_handler(content_types=['document'])
+        async def document_handler(message):
+            await self.handlers.handle_document(message)
+
+        @self.bot.message_handler(content_types=['photo', 'video', 'animation', 'audio'])
+        async def media_handler(message):
+            await self.handlers.handle_media(message)
+
+        @self.bot.my_chat_member_handler()
+        async def my_chat_member_handler(update):
+            self.chat_cache.on_my_chat_member(update)
+            await self.health_checker.on_my_chat_member(update)
+
+        instrument_bot(self.bot, self.handlers.profiler)
+
+        logger.info("Обработчики настроены")
+
+    async def run(self):
+        """Работа бота до остановки"""
+        # Размер общего пула соединений; применяется при создании сессии aiohttp
+        asyncio_helper.REQUEST_LIMIT = ASYNC_REQUEST_LIMIT
+
+        self._setup_handlers()
+        await self.chat_cache.load_me()
+
+        self.scheduler = AsyncMessageScheduler(self)
+        self.scheduler.start()
+        self.outbox.start()
+        self.health_checker.start()
+        # Брошенные диалоги снимаются и без новых сообщений от пользователей
+        self.handlers.user_states.start_purging()
+        self._setup_metrics()
+
+        logger.info("Бот успешно запущен и готов к работе (асинхронный режим)!")
+        try:
+            if BOT_MODE == "webhook":
+                await self._run_webhook()
+            else:
+                # infinity_polling сам перезапускает опрос после ошибок сети
+                await self.bot.infinity_polling(timeout=20)
+        finally:
+            self.scheduler.stop()
+            self.outbox.stop()
+            self.health_checker.stop()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            await self.bot.close_session()
+            self.handlers.user_states.stop_purging()
+            # Незавершённые диалоги переживают перезапуск, если задан USER_STATE_FILE
+            self.handlers.user_states.save()
+
+    async def _run_webhook(self):
+        """Получение обновлений через webhook"""
+        loop = asyncio.get_running_loop()
+
+        def process(updates):
+            # Рабочий поток сервера ждёт обработки, так очередь даёт обратное давление
+            asyncio.run_coroutine_threadsafe(self.bot.process_new_updates(updates), loop).result()
+
+        server = WebhookServer(process)
+        metrics.UPDATE_QUEUE_DEPTH.set_function(server.updates.qsize)
+        server.start()
+        await self.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=server.secret,
+            max_connections=WEBHOOK_WORKERS
+        )
+        try:
+            await asyncio.Event().wait()
+        finally:
+            try:
+                await self.bot.delete_webhook()
+            except Exception as e:
+                logger.error(f"Не удалось удалить webhook: {e}")
+            server.stop()
+
+    def start(self):
+        """Запуск бота"""
+        logger.info("Запуск бота...")
+        asyncio.run(self.run())
@@ -0,0 +1,467 @@
+"""
+Асинхронные обработчики команд и сообщений бота
+"""
+
+import asyncio
+import logging
+from typing import List, Optional
+
+import aiohttp
+
+from broadcaster import AsyncBroadcaster
+from bulk_import import InvalidImportFile, parse_posts
+from chat_cache import AsyncChatCache
+from database import AsyncDatabase
+from handlers import BotHandlers
+from media import AsyncMediaGroupCollector, AsyncMediaPublisher, extract_media, validate_media
+from outbox import AsyncOutbox
+from rate_limiter import REQUEST_ERRORS
+from config import IMPORT_MAX_FILE_SIZE, MESSAGES, PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# download_file асинхронного клиента не оборачивает ошибки aiohttp и таймауты
+DOWNLOAD_ERRORS = REQUEST_ERRORS + (aiohttp.ClientError, asyncio.TimeoutError)
+
+class AsyncBotHandlers(BotHandlers):
+    """Обработчики для AsyncTeleBot.
+
+    Состояния пользователей, клавиатуры и форматирование текстов
+    наследуются от BotHandlers; все обращения к API и базе — корутины.
+    """
+
+    def __init__(self, bot, database: AsyncDatabase, broadcaster: AsyncBroadcaster,
+                 chat_cache: AsyncChatCache, outbox: AsyncOutbox):
+        super().__init__(bot, database, broadcaster, chat_cache, outbox)
+        self.publisher = AsyncMediaPublisher(bot, broadcaster)
+        self.media_groups = AsyncMediaGroupCollector()
+        self._profile_task = None
+
+    async def start_command(self, message):
+        """Обработчик команды /start"""
+        await self.bot.send_message(
+            message.chat.id,
+            MESSAGES["start"],
+            reply_markup=self.keyboards.main_menu(),
+            parse_mode='HTML'
+        )
+
+    async def help_command(self, message):
+        """Обработчик команды /help"""
+        await self.bot.send_message(
+            message.chat.id,
+            MESSAGES["help"],
+            reply_markup=self.keyboards.main_menu(),
+            parse_mode='HTML'
+        )
+
+    async def post_command(self, message):
+        """Обработчик команды /post"""
+        user_id = message.from_user.id
+        channels = await self.database.get_user_channels(user_id)
+
+        if not channels:
+            await self.bot.send_message(message.chat.id, MESSAGES["no_channels"])
+            return
+
+        self.set_user_state(user_id, "waiting_post_message")
+        await self.bot.send_message(
+            message.chat.id,
+            MESSAGES["enter_message"],
+            reply_markup=self.keyboards.cancel_keyboard()
+        )
+
+    async def schedule_command(self, message):
+        """Обработчик команды /schedule"""
+        user_id = message.from_user.id
+        channels = await self.database.get_user_channels(user_id)
+
+        if not channels:
+            await self.bot.send_message(message.chat.id, MESSAGES["no_channels"])
+            return
+
+        self.set_user_state(user_id, "waiting_schedule_message")
+        await self.bot.send_message(
+            message.chat.id,
+            MESSAGES["enter_schedule_message"],
+            reply_markup=self.keyboards.cancel_keyboard()
+        )
+
+    async def import_command(self, message):
+        """Обработчик команды /import"""
+        user_id = message.from_user.id
+
+        if not await self.database.get_user_channels(user_id):
+            await self.bot.send_message(message.chat.id, MESSAGES["no_channels"])
+            return
+
+        self.set_user_state(user_id, "waiting_import_file")
+        await self.bot.send_message(
+            message.chat.id,
+            MESSAGES["enter_import_file"],
+            reply_markup=self.keyboards.cancel_keyboard()
+        )
+
+    async def manage_command(self, message):
+        """Обработчик команды /manage"""
+        await self.bot.send_message(
+            message.chat.id,
+            "🛠 Главное меню управления ботом:",
+            reply_markup=self.keyboards.main_menu()
+        )
+
+    async def profile_command(self, message):
+        """Обработчик команды /profile: профиль цикла событий на N секунд"""
+        reply, capture = self._start_profile(message, whole_thread=True)
+        await self.bot.send_message(message.chat.id, reply)
+        if capture is not None:
+            # Ссылка на задачу, чтобы её не собрал сборщик мусора до отправки отчёта
+            self._profile_task = asyncio.create_task(self._send_profile_report(message.chat.id, capture.seconds))
+
+    async def _send_profile_report(self, chat_id: int, seconds: int):
+        """Отправка отчёта о снятом профиле файлом через seconds секунд"""
+        await asyncio.sleep(seconds)
+        # Профиль цикла событий останавливается в том же потоке, где запущен
+        capture = self.profiler.finish_capture()
+        if capture is None:
+            return
+
+        document, filename, caption = self._profile_document(capture)
+        try:
+            await self.bot.send_document(chat_id, document, visible_file_name=filename, caption=caption)
+        except Exception as e:
+            logger.error(f"Не удалось отправить профиль пользователю {chat_id}: {e}")
+
+    async def handle_message(self, message):
+        """Обработчик текстовых сообщений"""
+        user_id = message.from_user.id
+        message_text = message.text
+        user_state = self.get_user_state(user_id)
+
+        if message_text == "❌ Отмена":
+            self.clear_user_state(user_id)
+            await self.bot.send_message(
+                message.chat.id,
+                MESSAGES["cancel"],
+                reply_markup=self.keyboards.main_menu()
+            )
+            return
+
+        state = user_state.state if user_state else None
+
+        if state == "waiting_post_message":
+            await self._handle_post_message(message, message_text)
+        elif state == "waiting_schedule_message":
+            await self._handle_schedule_message(message, message_text)
+        elif state == "waiting_schedule_time":
+            await self._handle_schedule_time(message, message_text)
+        elif state == "waiting_channel_id":
+            await self._handle_channel_id(message, message_text)
+
+    async def handle_media(self, message):
+        """Обработчик фото, видео и альбомов в диалогах отправки и планирования"""
+        user_state = self.get_user_state(message.from_user.id)
+        if not user_state or user_state.state not in ("waiting_post_message", "waiting_schedule_message"):
+            return
+
+        if message.media_group_id:
+            self.media_groups.add(message, self._handle_media_group)
+        else:
+            await self._handle_media_messages([message])
+
+    async def _handle_media_messages(self, messages: list):
+        """Пост из одного сообщения с вложением или из альбома"""
+        message_obj = messages[0]
+        user_state = self.get_user_state(message_obj.from_user.id)
+        state = user_state.state if user_state else None
+
+        media = [item for item in map(extract_media, messages) if item]
+        caption = next((m.caption for m in messages if m.caption), "")
+        error = validate_media(media, caption)
+        if error:
+            await self.bot.send_message(message_obj.chat.id, f"❌ {error}")
+            return
+
+        if state == "waiting_post_message":
+            await self._handle_post_message(message_obj, caption, media)
+        elif state == "waiting_schedule_message":
+            await self._handle_schedule_message(message_obj, caption, media)
+
+    async def _handle_post_message(self, message_obj, message: str, media: Optional[List[dict]] = None):
+        """Обработка сообщения для немедленной отправки"""
+        user_id = message_obj.from_user.id
+        channels = await self.database.get_user_channels(user_id)
+
+        self.clear_user_state(user_id)
+
+        result, _ = await self.publisher.publish(
+            {channel_id: channel_info['title'] for channel_id, channel_info in channels.items()},
+            message,
+            media,
+            dead=await self.database.get_dead_channels(channels)
+        )
+        await self.outbox.defer(result, user_id, message, media)
+
+        await self.bot.send_message(
+            message_obj.chat.id,
+            self._format_post_result(result),
+            reply_markup=self.keyboards.main_menu(),
+            parse_mode='HTML'
+        )
+
+    async def _handle_schedule_message(self, message_obj, message: str, media: Optional[List[dict]] = None):
+        """Обработка сообщения для планирования"""
+        user_id = message_obj.from_user.id
+
+        self.set_user_state(user_id, "waiting_schedule_time", {"message": message, "media": media})
+        await self.bot.send_message(message_obj.chat.id, MESSAGES["enter_schedule_time"])
+
+    async def _handle_schedule_time(self, message_obj, time_str: str):
+        """Обработка времени для планирования"""
+        user_id = message_obj.from_user.id
+        user_state = self.get_user_state(user_id)
+        message = user_state.data["message"]
+
+        schedule_time, rule, error = self._parse_schedule_input(time_str)
+
+        if error:
+            await self.bot.send_message(message_obj.chat.id, error)
+            return
+
+        channels = list((await self.database.get_user_channels(user_id)).keys())
+        await self.database.add_scheduled_post(
+            user_id, message, schedule_time, channels, rule.text if rule else None,
+            user_state.data.get("media")
+        )
+
+        self.clear_user_state(user_id)
+
+        await self.bot.send_message(
+            message_obj.chat.id,
+            self._format_scheduled_confirmation(schedule_time, rule),
+            reply_markup=self.keyboards.main_menu()
+        )
+
+    async def _handle_channel_id(self, message_obj, channel_id: str):
+        """Обработка ID канала/группы"""
+        user_id = message_obj.from_user.id
+
+        try:
+            chat = await self.chat_cache.get_chat(channel_id)
+
+            member = await self.chat_cache.get_bot_member(chat.id)
+            if member.status not in ['administrator', 'creator']:
+                await self.bot.send_message(
+                    message_obj.chat.id,
+                    f"❌ Бот должен быть администратором в {chat.title}"
+                )
+                return
+
+            success = await self.database.add_user_channel(user_id, channel_id, chat.title)
+
+            if success:
+                await self.bot.send_message(
+                    message_obj.chat.id,
+                    MESSAGES["channel_added"].format(title=chat.title),
+                    reply_markup=self.keyboards.main_menu()
+                )
+            else:
+                await self.bot.send_message(
+                    message_obj.chat.id,
+                    MESSAGES["max_channels"],
+                    reply_markup=self.keyboards.main_menu()
+                )
+
+        except Exception as e:
+            await self.bot.send_message(
+                message_obj.chat.id,
+                MESSAGES["channel_error"].format(error=str(e)),
+                reply_markup=self.keyboards.main_menu()
+            )
+
+        self.clear_user_state(user_id)
+
+    async def handle_document(self, message):
+        """Обработчик файлов: импорт постов"""
+        user_id = message.from_user.id
+        user_state = self.get_user_state(user_id)
+
+        if user_state and user_state.state in ("waiting_post_message", "waiting_schedule_message"):
+            await self.handle_media(message)
+            return
+
+        if not user_state or user_state.state != "waiting_import_file":
+            await self.bot.send_message(message.chat.id, MESSAGES["import_hint"])
+            return
+
+        document = message.document
+        if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+            await self.bot.send_message(
+                message.chat.id,
+                MESSAGES["import_too_large"].format(size=IMPORT_MAX_FILE_SIZE // 1024)
+            )
+            return
+
+        try:
+            file_info = await self.bot.get_file(document.file_id)
+            data = await self.bot.download_file(file_info.file_path)
+        except DOWNLOAD_ERRORS as e:
+            logger.error(f"Ошибка при загрузке файла импорта от {user_id}: {e}")
+            await self.bot.send_message(message.chat.id, MESSAGES["import_download_error"])
+            return
+
+        try:
+            result = parse_posts(
+                data, document.file_name, await self.database.get_user_channels(user_id), self._parse_schedule_time
+            )
+        except (InvalidImportFile, UnicodeDecodeError) as e:
+            await self.bot.send_message(message.chat.id, MESSAGES["import_error"].format(error=e))
+            return
+
+        await self.database.add_scheduled_posts(user_id, result.accepted)
+        self.clear_user_state(user_id)
+
+        await self.bot.send_message(
+            message.chat.id,
+            self._format_import_result(result),
+            reply_markup=self.keyboards.main_menu()
+        )
+
+    async def handle_callback(self, call):
+        """Обработчик callback запросов"""
+        await self.bot.answer_callback_query(call.id)
+
+        await self.router.dispatch_async(call.data, call, call.from_user.id)
+
+    async def _edit(self, call, text: str, reply_markup):
+        """Замена текста и клавиатуры сообщения с кнопками"""
+        await self.bot.edit_message_text(
+            text,
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=reply_markup
+        )
+
+    async def _handle_post_now(self, call, user_id: int):
+        """Обработка немедленной отправки"""
+        if not await self.database.get_user_channels(user_id):
+            await self._edit(call, MESSAGES["no_channels"], self.keyboards.main_menu())
+            return
+
+        self.set_user_state(user_id, "waiting_post_message")
+        await self._edit(call, MESSAGES["enter_message"], self.keyboards.cancel_keyboard())
+
+    async def _handle_import_posts(self, call, user_id: int):
+        """Импорт постов из файла"""
+        if not await self.database.get_user_channels(user_id):
+            await self._edit(call, MESSAGES["no_channels"], self.keyboards.main_menu())
+            return
+
+        self.set_user_state(user_id, "waiting_import_file")
+        await self._edit(call, MESSAGES["enter_import_file"], self.keyboards.cancel_keyboard())
+
+    async def _handle_schedule_post(self, call, user_id: int):
+        """Обработка планирования поста"""
+        if not await self.database.get_user_channels(user_id):
+            await self._edit(call, MESSAGES["no_channels"], self.keyboards.main_menu())
+            return
+
+        self.set_user_state(user_id, "waiting_schedule_message")
+        await self._edit(call, MESSAGES["enter_schedule_message"], self.keyboards.cancel_keyboard())
+
+    async def _handle_add_channel(self, call, user_id: int):
+        """Добавление канала"""
+        self.set_user_state(user_id, "waiting_channel_id")
+        await self._edit(call, MESSAGES["enter_channel_id"], self.keyboards.cancel_keyboard())
+
+    async def _handle_remove_channel(self, call, user_id: int, page: int = 0):
+        """Удаление канала"""
+        markup = await self._cached_markup(
+            user_id, "channels", ("remove", page), lambda: self._build_channel_list(user_id, "remove", page)
+        )
+
+        if markup is None:
+            await self._edit(call, MESSAGES["no_channels"], self.keyboards.main_menu())
+            return
+
+        await self._edit(call, "🗑 Выберите канал/группу для удаления:", markup)
+
+    async def _cached_markup(self, user_id: int, kind: str, key, build) -> Optional[str]:
+        """Клавиатура из кэша либо результат await build()"""
+        markup, token = self.keyboard_cache.lookup(user_id, kind, key)
+        if markup is self.keyboard_cache.MISSING:
+            markup = await build()
+            self.keyboard_cache.store(user_id, kind, key, markup, token)
+        return markup
+
+    async def _build_channel_list(self, user_id: int, action: str, page: int) -> Optional[str]:
+        """Страница клавиатуры каналов пользователя (None — каналов нет)"""
+        channels, has_next = await self.database.get_user_channels_page(user_id, page * PAGE_SIZE, PAGE_SIZE)
+        if not channels and page > 0:
+            return await self._build_channel_list(user_id, action, 0)
+        return self.keyboards.channel_list(channels, action, page, has_next) if channels else None
+
+    async def _handle_list_channels(self, call, user_id: int, page: int = 0):
+        """Список каналов"""
+        channels, has_next = await self.database.get_user_channels_page(user_id, page * PAGE_SIZE, PAGE_SIZE)
+        if not channels and page > 0:
+            page = 0
+            channels, has_next = await self.database.get_user_channels_page(user_id, 0, PAGE_SIZE)
+
+        await self._edit(call, self._format_channels_list(channels), self._channels_page_markup(page, has_next))
+
+    async def _handle_scheduled_posts(self, call, user_id: int, page: int = 0):
+        """Запланированные посты"""
+        markup = await self._cached_markup(
+            user_id, "posts", ("list", page), lambda: self._build_scheduled_posts_list(user_id, page)
+        )
+
+        if markup is None:
+            await self._edit(call, MESSAGES["no_scheduled"], self.keyboards.main_menu())
+            return
+
+        await self._edit(call, MESSAGES["scheduled_list"], markup)
+
+    async def _build_scheduled_posts_list(self, user_id: int, page: int) -> Optional[str]:
+        """Страница клавиатуры запланированных постов (None — постов нет)"""
+        posts, has_next = await self.database.get_user_scheduled_posts_page(user_id, page * PAGE_SIZE, PAGE_SIZE)
+        if not posts and page > 0:
+            return await self._build_scheduled_posts_list(user_id, 0)
+        return self.keyboards.scheduled_posts_list(posts, page, has_next) if posts else None
+
+    async def _handle_confirm_remove_channel(self, call, user_id: int, channel_id: str):
+        """Подтверждение удаления канала"""
+        if await self.database.remove_user_channel(user_id, channel_id):
+            await self._edit(call, MESSAGES["channel_removed"], self.keyboards.main_menu())
+        else:
+            await self._edit(call, "❌ Ошибка при удалении канала", self.keyboards.main_menu())
+
+    async def _handle_scheduled_detail(self, call, user_id: int, post_id: str):
+        """Детали запланированного поста"""
+        post = await self.database.get_scheduled_post(user_id, post_id)
+
+        if not post:
+            await self._edit(call, "❌ Пост не найден", self.keyboards.main_menu())
+            return
+
+        await self._edit(
+            call,
+            self._format_scheduled_detail(post),
+            self.keyboards.scheduled_post_detail(post_id)
+        )
+
+    async def _handle_delete_scheduled(self, call, user_id: int, post_id: str):
+        """Удаление запланированного поста"""
+        if await self.database.remove_scheduled_post(post_id):
+            await self._edit(call, MESSAGES["scheduled_deleted"], self.keyboards.main_menu())
+        else:
+            await self._edit(call, "❌ Ошибка при удалении поста", self.keyboards.main_menu())
+
+    async def _handle_back_to_main(self, call, user_id: int):
+        """Возврат в главное меню"""
+        await self._edit(call, "🛠 Главное меню управления ботом:", self.keyboards.main_menu())
+
+    async def _handle_cancel(self, call, user_id: int):
+        """Отмена операции"""
+        self.clear_user_state(user_id)
+        await self._edit(call, "❌ Операция отменена. Выберите действие:", self.keyboards.main_menu())
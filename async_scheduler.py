@@ -0,0 +1,155 @@
+"""
+Асинхронный планировщик сообщений
+"""
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from async_bot import AsyncTelegramBot
+
+from config import SCHEDULER_CHECK_INTERVAL, SCHEDULER_CLAIM_BATCH, SCHEDULER_LEASE_SECONDS
+from media import AsyncMediaPublisher
+from scheduler import MessageScheduler, default_worker_id
+
+logger = logging.getLogger(__name__)
+
+class AsyncMessageScheduler(MessageScheduler):
+    """Планировщик для асинхронного режима: задача на общем цикле событий.
+
+    Логика та же, что у MessageScheduler: сон до ближайшего поста,
+    досрочное пробуждение при изменении постов в базе и аренда готовых
+    постов пачками.
+    """
+
+    def __init__(self, bot: 'AsyncTelegramBot'):
+        self.bot = bot
+        self.database = bot.database
+        self.publisher = AsyncMediaPublisher(bot.bot, bot.broadcaster)
+        self.outbox = bot.outbox
+        self.worker_id = default_worker_id()
+        self.running = False
+        self._task = None
+        self._loop = None
+        self._wakeup = asyncio.Event()
+
+        self.lag_stats = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+
+        self.database.add_listener(self._on_database_change)
+
+    def start(self):
+        """Запуск планировщика (вызывается внутри цикла событий)"""
+        if self.running:
+            return
+
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._scheduler_loop())
+        logger.info("Планировщик сообщений запущен")
+
+    def stop(self):
+        """Остановка планировщика"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+        logger.info("Планировщик сообщений остановлен")
+
+    def wake(self):
+        """Досрочное пробуждение для пересчёта времени сна"""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _on_database_change(self, kind: str, user_id: int):
+        """Реакция на изменение данных (вызывается из рабочего потока)"""
+        if kind == "posts":
+            self.wake()
+
+    async def _scheduler_loop(self):
+        """Основной цикл планировщика"""
+        while self.running:
+            self._wakeup.clear()
+            try:
+                await self._check_due_posts()
+                timeout = await self._seconds_until_next_post_async()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка в планировщике: {e}")
+                timeout = SCHEDULER_CHECK_INTERVAL
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                break
+
+    async def _seconds_until_next_post_async(self) -> Optional[float]:
+        """Время сна до ближайшего поста; None — ждать пробуждения"""
+        return self._sleep_time(await self.database.next_due_time())
+
+    async def _check_due_posts(self):
+        """Аренда и отправка готовых к отправке постов пачками"""
+        while True:
+            lease_end = time.monotonic() + SCHEDULER_LEASE_SECONDS
+            due_posts = await self.database.claim_due_posts(
+                self.worker_id, SCHEDULER_LEASE_SECONDS, SCHEDULER_CLAIM_BATCH
+            )
+
+            for post in due_posts:
+                if self._lease_expired(lease_end, post):
+                    break
+                try:
+                    self._record_lag(post)
+                    await self._send_scheduled_post(post)
+                    await self._complete_post(post)
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке запланированного поста {post['id']}: {e}")
+
+            if len(due_posts) < SCHEDULER_CLAIM_BATCH:
+                return
+
+    async def _complete_post(self, post: dict):
+        """Удаление отправленного поста или перенос повторяющегося на следующее срабатывание"""
+        next_time = self._next_run(post)
+        if next_time is None:
+            completed = await self.database.remove_scheduled_post(post["id"], self.worker_id)
+        else:
+            completed = await self.database.reschedule_post(post["id"], next_time, self.worker_id)
+
+        if not completed:
+            # Аренду перехватил другой обработчик или пост удалили: его запись не трогаем
+            logger.warning(f"Пост {post['id']} отправлен, но аренда уже потеряна: завершение пропущено")
+        elif next_time is None:
+            logger.info(f"Запланированный пост {post['id']} отправлен")
+        else:
+            logger.info(f"Повторяющийся пост {post['id']} отправлен, следующий раз {next_time.isoformat()}")
+
+    async def _send_scheduled_post(self, post: dict):
+        """Отправка запланированного поста"""
+        user_id = post["user_id"]
+        message = post["message"]
+
+        user_channels = await self.database.get_user_channels(user_id)
+        targets = self._scheduled_targets(post, user_channels)
+
+        result, media = await self.publisher.publish(
+            targets,
+            message,
+            post.get("media"),
+            dead=await self.database.get_dead_channels(targets)
+        )
+        if self._should_save_media(post, media):
+            await self.database.set_post_media(post["id"], media)
+        await self.outbox.defer(result, user_id, message, media)
+
+        try:
+            await self.bot.bot.send_message(
+                chat_id=user_id,
+                text=self._format_result(result),
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
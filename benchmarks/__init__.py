@@ -0,0 +1,5 @@
+"""
+Бенчмарки бота против локальной замены Bot API.
+
+Запуск из корня репозитория: python -m benchmarks.run --help
+"""
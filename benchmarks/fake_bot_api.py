@@ -0,0 +1,192 @@
+"""
+Локальная замена Bot API для бенчмарков
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from telebot import apihelper, asyncio_helper
+
+# Поля вложения, которых достаточно для разбора ответа в telebot.types
+FILE_FIELDS = {"width": 1, "height": 1, "duration": 1}
+MEDIA_METHODS = {
+    "sendPhoto": "photo",
+    "sendVideo": "video",
+    "sendAnimation": "animation",
+    "sendDocument": "document",
+    "sendAudio": "audio"
+}
+
+class FakeBotAPI:
+    """HTTP-сервер, отвечающий как Bot API.
+
+    latency — средняя задержка ответа (секунд), jitter — разброс задержки
+    в долях от latency; error_rate — доля ответов 400, server_error_rate —
+    доля ответов 502, throttle_rate — доля ответов 429 с retry_after. Методы отправки возвращают правдоподобные
+    сообщения, остальные методы — true.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: int = 1, host: str = "127.0.0.1", port: int = 0,
+                 seed: int = 0, server_error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_id = 0
+        # Число запросов по методам и по кодам ответа
+        self.requests = Counter()
+        self.statuses = Counter()
+        self._server = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Шаблон адреса для apihelper.API_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self) -> "FakeBotAPI":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def install(self):
+        """Направление запросов TeleBot и AsyncTeleBot на этот сервер"""
+        apihelper.API_URL = self.url
+        asyncio_helper.API_URL = self.url
+
+    @staticmethod
+    def uninstall():
+        apihelper.API_URL = None
+        asyncio_helper.API_URL = "https://api.telegram.org/bot{0}/{1}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests.clear()
+            self.statuses.clear()
+
+    # --- Ответы ---
+
+    def _next_message_id(self) -> int:
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    def _draw(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    @staticmethod
+    def _chat(chat_id) -> dict:
+        """Чат ответа; @username превращается в стабильный отрицательный id"""
+        try:
+            numeric_id = int(chat_id)
+        except (TypeError, ValueError):
+            numeric_id = -(abs(hash(chat_id)) % 10 ** 12) - 10 ** 12
+        return {"id": numeric_id, "type": "private" if numeric_id > 0 else "channel", "title": "Bench"}
+
+    def _message(self, chat_id, **fields) -> dict:
+        message_id = self._next_message_id()
+        message = {"message_id": message_id, "date": int(time.time()), "chat": self._chat(chat_id)}
+        message.update(fields)
+        return message
+
+    def _file(self, kind: str) -> dict:
+        file_id = f"{kind}_{self._next_message_id()}"
+        return dict(FILE_FIELDS, file_id=file_id, file_unique_id=file_id)
+
+    def _result(self, method: str, params: dict):
+        """Поле result успешного ответа"""
+        chat_id = params.get("chat_id")
+        if method == "sendMessage":
+            return self._message(chat_id, text=params.get("text", ""))
+        if method in MEDIA_METHODS:
+            kind = MEDIA_METHODS[method]
+            attachment = [self._file(kind)] if kind == "photo" else self._file(kind)
+            return self._message(chat_id, **{kind: attachment})
+        if method == "sendMediaGroup":
+            items = json.loads(params.get("media", "[]"))
+            return [
+                self._message(chat_id, **{item["type"]: [self._file("photo")] if item["type"] == "photo"
+                                          else self._file(item["type"])})
+                for item in items
+            ]
+        if method == "editMessageText":
+            return self._message(chat_id, text=params.get("text", ""))
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "getChat":
+            return self._chat(chat_id)
+        return True
+
+    def _respond(self, method: str, params: dict):
+        """Код ответа и тело"""
+        if self.latency:
+            spread = self.latency * self.jitter
+            time.sleep(max(0.0, self.latency + (self._draw() * 2 - 1) * spread))
+
+        draw = self._draw()
+        if draw < self.throttle_rate:
+            return 429, {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            }
+        if draw < self.throttle_rate + self.error_rate:
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: injected error"}
+        if draw < self.throttle_rate + self.error_rate + self.server_error_rate:
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway: injected error"}
+        return 200, {"ok": True, "result": self._result(method, params)}
+
+    def _make_request_handler(self):
+        api = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(url.query))
+
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length).decode("utf-8", errors="replace")
+                    if "x-www-form-urlencoded" in self.headers.get("Content-Type", ""):
+                        params.update(parse_qsl(body))
+
+                status, payload = api._respond(method, params)
+                with api._lock:
+                    api.requests[method] += 1
+                    api.statuses[status] += 1
+
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
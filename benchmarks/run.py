@@ -0,0 +1,462 @@
+"""
+Бенчмарки рассылки, планировщика и хранилища.
+
+Все запросы к Bot API уходят на локальный FakeBotAPI с настраиваемой
+задержкой, долей ошибок и ответов 429. Итоги пишутся в JSON, чтобы
+сравнивать версии между собой:
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List
+
+from async_handlers import AsyncBotHandlers
+from async_scheduler import AsyncMessageScheduler
+from bot_client import AsyncBotClient, BotClient
+from broadcaster import AsyncBroadcaster, Broadcaster
+from chat_cache import AsyncChatCache, ChatCache
+from config import BROADCAST_MAX_WORKERS, PAGE_SIZE
+from database import AsyncDatabase, Database
+from handlers import BotHandlers
+from media import AsyncMediaPublisher, MediaPublisher
+from outbox import AsyncOutbox, Outbox
+from rate_limiter import AsyncRateLimiter, RateLimiter
+from scheduler import MessageScheduler
+from sqlite_database import SQLiteDatabase
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+BENCH_TOKEN = "123456:BENCHMARK"
+BENCH_USER_ID = 1
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Посты одного пользователя при заполнении хранилища
+POSTS_PER_USER = 1000
+# Смещение времени постов, которые не должны сработать во время замера
+FAR_FUTURE = 365 * 24 * 3600
+
+def _summary(samples: List[float], scale: float = 1.0) -> dict:
+    """Сводка по замерам: среднее, перцентили и максимум (умноженные на scale)"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * scale
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered) * scale,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": ordered[-1] * scale
+    }
+
+def _permissive_limiter(limiter_class):
+    """Ограничитель, который не задерживает запросы, но повторяет их после 429"""
+    return limiter_class(
+        global_per_second=1e9,
+        private_per_second=1e9,
+        group_per_minute=1e9,
+        chat_burst=1e9
+    )
+
+def _channel_ids(count: int) -> List[str]:
+    return [str(-1001000000000 - index) for index in range(count)]
+
+def _add_channels(database, user_id: int, count: int):
+    for channel_id in _channel_ids(count):
+        database.add_user_channel(user_id, channel_id, f"Канал {channel_id}")
+
+def _fill_posts(database, size: int, start_ts: float, channels: List[str]) -> float:
+    """Заполнение хранилища постами далеко в будущем; возвращает длительность"""
+    started = time.perf_counter()
+    for first in range(0, size, POSTS_PER_USER):
+        user_id = 10 ** 6 + first // POSTS_PER_USER
+        batch = [
+            (f"Пост {index}", datetime.fromtimestamp(start_ts + index), channels, None)
+            for index in range(first, min(first + POSTS_PER_USER, size))
+        ]
+        database.add_scheduled_posts(user_id, batch)
+    return time.perf_counter() - started
+
+def _message_obj(user_id: int) -> SimpleNamespace:
+    """Минимальное сообщение пользователя для вызова обработчиков"""
+    return SimpleNamespace(
+        from_user=SimpleNamespace(id=user_id),
+        chat=SimpleNamespace(id=user_id),
+        message_id=1
+    )
+
+# --- Рассылка ---
+
+def bench_fanout(args, api: FakeBotAPI) -> dict:
+    """Пропускная способность _handle_post_message в обоих режимах"""
+    results = {}
+    for mode in args.modes:
+        api.reset_stats()
+        with tempfile.TemporaryDirectory() as directory:
+            database = Database(os.path.join(directory, "bench.json"), "journal")
+            _add_channels(database, BENCH_USER_ID, args.channels)
+            if mode == "sync":
+                durations, failed, elapsed = _fanout_sync(args, database)
+            else:
+                durations, failed, elapsed = asyncio.run(_fanout_async(args, database))
+
+        messages = args.posts * args.channels
+        results[mode] = {
+            "posts": args.posts,
+            "channels": args.channels,
+            "elapsed_s": elapsed,
+            "messages_per_s": messages / elapsed if elapsed else 0.0,
+            "post_ms": _summary(durations, 1000),
+            "failed_posts": failed,
+            "requests": dict(api.requests),
+            "statuses": {str(status): count for status, count in api.statuses.items()}
+        }
+    return results
+
+def _fanout_sync(args, database):
+    client = BotClient(BENCH_TOKEN, _permissive_limiter(RateLimiter))
+    broadcaster = Broadcaster(args.workers)
+    # Очередь повторов не запускается: повторы не должны попадать в замер
+    outbox = Outbox(client, database, MediaPublisher(client, broadcaster))
+    handlers = BotHandlers(client, database, broadcaster, ChatCache(client), outbox)
+    message_obj = _message_obj(BENCH_USER_ID)
+
+    durations = []
+    failed = 0
+    started = time.perf_counter()
+    for index in range(args.posts):
+        post_started = time.perf_counter()
+        try:
+            handlers._handle_post_message(message_obj, f"Пост {index}")
+        except Exception:
+            # Например, внедрённая ошибка при отправке итога пользователю
+            failed += 1
+        durations.append(time.perf_counter() - post_started)
+    return durations, failed, time.perf_counter() - started
+
+async def _fanout_async(args, database):
+    client = AsyncBotClient(BENCH_TOKEN, _permissive_limiter(AsyncRateLimiter))
+    broadcaster = AsyncBroadcaster(args.workers)
+    async_database = AsyncDatabase(database)
+    outbox = AsyncOutbox(client, async_database, AsyncMediaPublisher(client, broadcaster))
+    handlers = AsyncBotHandlers(client, async_database, broadcaster, AsyncChatCache(client), outbox)
+    message_obj = _message_obj(BENCH_USER_ID)
+
+    durations = []
+    failed = 0
+    started = time.perf_counter()
+    try:
+        for index in range(args.posts):
+            post_started = time.perf_counter()
+            try:
+                await handlers._handle_post_message(message_obj, f"Пост {index}")
+            except Exception:
+                failed += 1
+            durations.append(time.perf_counter() - post_started)
+    finally:
+        await client.close_session()
+    return durations, failed, time.perf_counter() - started
+
+# --- Планировщик ---
+
+class _LagRecorder:
+    """Сохранение задержки каждого срабатывания для перцентилей"""
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.lags = []
+
+    def _record_lag(self, post: dict):
+        super()._record_lag(post)
+        self.lags.append(self.lag_stats["last"])
+
+class RecordingScheduler(_LagRecorder, MessageScheduler):
+    pass
+
+class AsyncRecordingScheduler(_LagRecorder, AsyncMessageScheduler):
+    pass
+
+def bench_scheduler(args, api: FakeBotAPI) -> dict:
+    """Точность срабатывания при size постов в хранилище"""
+    results = {}
+    for size in args.scheduler_sizes:
+        results[str(size)] = {}
+        for mode in args.modes:
+            with tempfile.TemporaryDirectory() as directory:
+                database = Database(os.path.join(directory, "bench.json"), "journal")
+                channels = _channel_ids(args.scheduler_channels)
+                _add_channels(database, BENCH_USER_ID, args.scheduler_channels)
+                fill_s = _fill_posts(database, size, time.time() + FAR_FUTURE, channels)
+
+                # Посты, которые сработают во время замера, равномерно в окне window
+                first_due = time.time() + args.lead
+                database.add_scheduled_posts(BENCH_USER_ID, [
+                    (f"Срочный пост {index}",
+                     datetime.fromtimestamp(first_due + args.window * index / args.due),
+                     channels, None)
+                    for index in range(args.due)
+                ])
+
+                if mode == "sync":
+                    lags, timed_out = _scheduler_sync(args, database, size)
+                else:
+                    lags, timed_out = asyncio.run(_scheduler_async(args, database, size))
+
+            results[str(size)][mode] = {
+                "fill_s": fill_s,
+                "due_posts": args.due,
+                "fired": len(lags),
+                "timed_out": timed_out,
+                "lag_ms": _summary(lags, 1000)
+            }
+    return results
+
+def _scheduler_deadline(args) -> float:
+    return time.monotonic() + args.lead + args.window + args.scheduler_timeout
+
+def _scheduler_sync(args, database, size: int):
+    client = BotClient(BENCH_TOKEN, _permissive_limiter(RateLimiter))
+    broadcaster = Broadcaster(args.workers)
+    outbox = Outbox(client, database, MediaPublisher(client, broadcaster))
+    bot = SimpleNamespace(database=database, bot=client, broadcaster=broadcaster, outbox=outbox)
+    scheduler = RecordingScheduler(bot)
+
+    deadline = _scheduler_deadline(args)
+    scheduler.start()
+    try:
+        while database.count_scheduled_posts() > size and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        scheduler.stop()
+    return scheduler.lags, database.count_scheduled_posts() > size
+
+async def _scheduler_async(args, database, size: int):
+    client = AsyncBotClient(BENCH_TOKEN, _permissive_limiter(AsyncRateLimiter))
+    async_database = AsyncDatabase(database)
+    broadcaster = AsyncBroadcaster(args.workers)
+    outbox = AsyncOutbox(client, async_database, AsyncMediaPublisher(client, broadcaster))
+    bot = SimpleNamespace(database=async_database, bot=client, broadcaster=broadcaster, outbox=outbox)
+    scheduler = AsyncRecordingScheduler(bot)
+
+    deadline = _scheduler_deadline(args)
+    scheduler.start()
+    try:
+        while database.count_scheduled_posts() > size and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        scheduler.stop()
+        await client.close_session()
+    return scheduler.lags, database.count_scheduled_posts() > size
+
+# --- Хранилище ---
+
+def _open_database(storage: str, directory: str):
+    if storage == "sqlite":
+        return SQLiteDatabase(os.path.join(directory, "bench.sqlite3"))
+    return Database(os.path.join(directory, "bench.json"), storage)
+
+def _storage_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def _timed(samples: List[float], function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    samples.append(time.perf_counter() - started)
+    return result
+
+def bench_database(args) -> dict:
+    """Стоимость изменений и выборок в зависимости от числа постов"""
+    rng = random.Random(args.seed)
+    channels = _channel_ids(args.channels)
+    results = {}
+    for storage in args.storages:
+        results[storage] = {}
+        for size in args.database_sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                database = _open_database(storage, directory)
+                start_ts = time.time() + FAR_FUTURE
+                fill_s = _fill_posts(database, size, start_ts, channels)
+                # Несколько уже наступивших постов, чтобы get_due_posts что-то возвращал
+                database.add_scheduled_posts(BENCH_USER_ID, [
+                    (f"Просроченный пост {index}", datetime.fromtimestamp(time.time() - 60 - index), channels, None)
+                    for index in range(10)
+                ])
+
+                samples: Dict[str, List[float]] = {
+                    name: [] for name in ("add", "reschedule", "remove", "get_due_posts", "page")
+                }
+                added = []
+                for index in range(args.ops):
+                    added.append(_timed(
+                        samples["add"], database.add_scheduled_post, BENCH_USER_ID, f"Новый пост {index}",
+                        datetime.fromtimestamp(start_ts - 3600 - index), channels
+                    ))
+                for post_id in rng.sample(added, len(added)):
+                    new_time = datetime.fromtimestamp(start_ts + size + rng.randrange(FAR_FUTURE))
+                    _timed(samples["reschedule"], database.reschedule_post, post_id, new_time)
+                for index in range(args.ops):
+                    _timed(samples["get_due_posts"], database.get_due_posts)
+                    user_id = 10 ** 6 + rng.randrange(max(1, size // POSTS_PER_USER))
+                    _timed(samples["page"], database.get_user_scheduled_posts_page, user_id, 0, PAGE_SIZE)
+                for post_id in added:
+                    _timed(samples["remove"], database.remove_scheduled_post, post_id)
+
+                results[storage][str(size)] = {
+                    "fill_s": fill_s,
+                    "ops_ms": {name: _summary(values, 1000) for name, values in samples.items()},
+                    "storage_bytes": _storage_bytes(directory)
+                }
+                if storage == "sqlite":
+                    database._conn.close()
+    return results
+
+# --- Сравнение и запуск ---
+
+def _numeric_leaves(data, prefix: str = ""):
+    """Пары (путь, число) всех числовых значений вложенного словаря"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _numeric_leaves(value, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix, data
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """Строки сравнения с предыдущим прогоном: базовое значение, текущее и отношение"""
+    old = dict(_numeric_leaves(baseline.get("results", {})))
+    lines = []
+    for path, value in _numeric_leaves(current.get("results", {})):
+        if path not in old:
+            continue
+        ratio = f"x{value / old[path]:.2f}" if old[path] else "—"
+        lines.append(f"{path}: {old[path]:.4g} -> {value:.4g} ({ratio})")
+    return lines
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+def _str_list(value: str) -> List[str]:
+    return [item for item in value.split(",") if item]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки бота против локальной замены Bot API")
+    parser.add_argument("--suites", type=_str_list, default=["fanout", "scheduler", "database"],
+                        help="наборы через запятую: fanout, scheduler, database")
+    parser.add_argument("--modes", type=_str_list, default=["sync", "async"],
+                        help="режимы бота через запятую: sync, async")
+
+    api = parser.add_argument_group("замена Bot API")
+    api.add_argument("--latency", type=float, default=0.02, help="задержка ответа, секунд")
+    api.add_argument("--jitter", type=float, default=0.5, help="разброс задержки в долях от latency")
+    api.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 400")
+    api.add_argument("--server-error-rate", type=float, default=0.0, help="доля ответов 502")
+    api.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    api.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429")
+    api.add_argument("--seed", type=int, default=0)
+
+    fanout = parser.add_argument_group("рассылка")
+    fanout.add_argument("--posts", type=int, default=50, help="число рассылаемых постов")
+    fanout.add_argument("--channels", type=int, default=10, help="каналов у пользователя")
+    fanout.add_argument("--workers", type=int, default=BROADCAST_MAX_WORKERS, help="параллельных отправок")
+
+    scheduler = parser.add_argument_group("планировщик")
+    scheduler.add_argument("--scheduler-sizes", type=_int_list, default=[10000, 100000],
+                           help="постов в хранилище через запятую")
+    scheduler.add_argument("--scheduler-channels", type=int, default=3, help="каналов у срабатывающих постов")
+    scheduler.add_argument("--due", type=int, default=200, help="постов, срабатывающих во время замера")
+    scheduler.add_argument("--lead", type=float, default=1.0, help="секунд до первого срабатывания")
+    scheduler.add_argument("--window", type=float, default=5.0, help="окно срабатываний, секунд")
+    scheduler.add_argument("--scheduler-timeout", type=float, default=60.0,
+                           help="сколько ждать отставших постов после окна, секунд")
+
+    database = parser.add_argument_group("хранилище")
+    database.add_argument("--storages", type=_str_list, default=["json", "journal", "sqlite"])
+    database.add_argument("--database-sizes", type=_int_list, default=[1000, 10000],
+                          help="постов в хранилище через запятую")
+    database.add_argument("--ops", type=int, default=100, help="операций каждого вида")
+
+    parser.add_argument("--output", help="файл результатов (по умолчанию benchmarks/results/bench-<время>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="результаты прошлого прогона для сравнения")
+    parser.add_argument("--verbose", action="store_true", help="не скрывать логи бота")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    api = FakeBotAPI(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed,
+        server_error_rate=args.server_error_rate
+    ).start()
+    api.install()
+
+    results = {}
+    try:
+        if "fanout" in args.suites:
+            print("Рассылка...", file=sys.stderr)
+            results["fanout"] = bench_fanout(args, api)
+        if "scheduler" in args.suites:
+            print("Планировщик...", file=sys.stderr)
+            results["scheduler"] = bench_scheduler(args, api)
+        if "database" in args.suites:
+            print("Хранилище...", file=sys.stderr)
+            results["database"] = bench_database(args)
+    finally:
+        api.uninstall()
+        api.stop()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose")},
+        "results": results
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)))
+
+if __name__ == "__main__":
+    main()
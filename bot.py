@@ -3,22 +3,50 @@
 """
 
 import logging
-import telebot
 import threading
 import time
 
-from config import BOT_TOKEN
+from bot_client import BotClient
+from broadcaster import Broadcaster
+from chat_cache import ChatCache
+from config import BOT_TOKEN, BOT_MODE, WEBHOOK_URL, WEBHOOK_WORKERS
+from database import create_database
+from dispatcher import UpdateDispatcher
 from handlers import BotHandlers
+from health import ChannelHealthChecker
+from media import MediaPublisher
+import metrics
+from outbox import Outbox
+from profiling import instrument_bot
+from rate_limiter import RateLimiter
 from scheduler import MessageScheduler
+from webhook import WebhookServer
 
 logger = logging.getLogger(__name__)
 
 class TelegramBot:
     def __init__(self):
-        self.bot = telebot.TeleBot(BOT_TOKEN)
-        self.handlers = BotHandlers(self.bot)
+        # Все исходящие сообщения проходят через общий ограничитель
+        self.rate_limiter = RateLimiter()
+        # Обработчики выполняются в потоках диспетчера, а не во встроенном пуле TeleBot
+        self.bot = BotClient(BOT_TOKEN, self.rate_limiter, threaded=False)
+        self.dispatcher = UpdateDispatcher(self.bot.process_update_now)
+        self.bot.set_dispatcher(self.dispatcher)
+        # Единое хранилище для обработчиков и планировщика
+        self.database = create_database()
+        # Общий пул рассылки для немедленной отправки и планировщика
+        self.broadcaster = Broadcaster()
+        # Общий кэш сведений о чатах и профиля бота
+        self.chat_cache = ChatCache(self.bot)
+        # Очередь повторной отправки в каналы после временных сбоев
+        self.outbox = Outbox(self.bot, self.database, MediaPublisher(self.bot, self.broadcaster))
+        self.handlers = BotHandlers(self.bot, self.database, self.broadcaster, self.chat_cache, self.outbox)
+        self.health_checker = ChannelHealthChecker(self.database, self.chat_cache)
         self.scheduler = None
+        self.webhook_server = None
+        self.metrics_server = None
         self.running = False
+        self._stop_event = threading.Event()
     
     def _setup_handlers(self):
         """Настройка обработчиков команд и сообщений"""
@@ -43,6 +71,14 @@ class TelegramBot:
         @self.bot.message_handler(commands=['manage'])
         def manage_handler(message):
             self.handlers.manage_command(message)
+            
+        @self.bot.message_handler(commands=['import'])
+        def import_handler(message):
+            self.handlers.import_command(message)
+            
+        @self.bot.message_handler(commands=['profile'])
+        def profile_handler(message):
+            self.handlers.profile_command(message)
         
         # Callback запросы
         @self.bot.callback_query_handler(func=lambda call: True)
@@ -54,35 +90,121 @@ class TelegramBot:
         def message_handler(message):
             self.handlers.handle_message(message)
         
+        # Файлы для импорта постов
+        @self.bot.message_handler(content_types=['document'])
+        def document_handler(message):
+            self.handlers.handle_document(message)
+        
+        # Фото, видео и альбомы для отправки и планирования
+        @self.bot.message_handler(content_types=['photo', 'video', 'animation', 'audio'])
+        def media_handler(message):
+            self.handlers.handle_media(message)
+        
+        # Изменение статуса бота в чатах
+        @self.bot.my_chat_member_handler()
+        def my_chat_member_handler(update):
+            self.chat_cache.on_my_chat_member(update)
+            self.health_checker.on_my_chat_member(update)
+        
+        # Замеры времени всех обработчиков
+        instrument_bot(self.bot, self.handlers.profiler)
+        
         logger.info("Обработчики настроены")
     
+    def _run_polling(self):
+        """Получение обновлений через long polling"""
+        logger.info("Бот успешно запущен и готов к работе!")
+        
+        # Запускаем polling с обработкой ошибок для 24/7 работы
+        while self.running:
+            try:
+                self.bot.polling(none_stop=True, interval=0, timeout=20)
+            except Exception as e:
+                logger.error(f"Ошибка polling: {e}")
+                time.sleep(5)  # Ждем 5 секунд перед повторной попыткой
+                if self.running:
+                    logger.info("Перезапуск polling...")
+    
+    def _run_webhook(self):
+        """Получение обновлений через webhook"""
+        server = WebhookServer(self.bot.process_new_updates)
+        self.webhook_server = server
+        server.start()
+        self.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=server.secret,
+            max_connections=WEBHOOK_WORKERS
+        )
+        logger.info("Бот успешно запущен и готов к работе (webhook)!")
+        
+        try:
+            while self.running:
+                self._stop_event.wait(1)
+        finally:
+            try:
+                self.bot.delete_webhook()
+            except Exception as e:
+                logger.error(f"Не удалось удалить webhook: {e}")
+            server.stop()
+    
+    def _queue_depth(self) -> int:
+        """Обновления, принятые, но ещё не обработанные"""
+        depth = sum(self.dispatcher.queue_depths())
+        if self.webhook_server:
+            depth += self.webhook_server.updates.qsize()
+        return depth
+    
+    def _setup_metrics(self):
+        """Значения метрик, которые считываются при каждом запросе"""
+        metrics.PENDING_POSTS.set_function(self.database.count_scheduled_posts)
+        metrics.USER_STATES.set_function(lambda: len(self.handlers.user_states))
+        metrics.UPDATE_QUEUE_DEPTH.set_function(self._queue_depth)
+        metrics.OUTBOX_PENDING.set_function(self.database.count_deliveries)
+        metrics.OUTBOX_DEAD.set_function(lambda: self.database.count_deliveries(dead=True))
+        self.metrics_server = metrics.start_metrics_server()
+    
+    def stop(self):
+        """Остановка бота"""
+        self.running = False
+        self._stop_event.set()
+        self.bot.stop_polling()
+    
     def start(self):
         """Запуск бота"""
         try:
             # Настраиваем обработчики
             self._setup_handlers()
             
+            # Профиль бота не меняется, запрашиваем его один раз
+            self.chat_cache.load_me()
+            
+            # Запускаем обработку обновлений по шардам пользователей
+            self.dispatcher.start()
+            
+            # Брошенные диалоги снимаются и без новых сообщений от пользователей
+            self.handlers.user_states.start_purging()
+            
             # Запускаем планировщик
             self.scheduler = MessageScheduler(self)
-            scheduler_thread = threading.Thread(target=self.scheduler.start, daemon=True)
-            scheduler_thread.start()
+            self.scheduler.start()
+            
+            # Запускаем повторную отправку отложенных доставок
+            self.outbox.start()
+            
+            # Запускаем фоновую проверку каналов
+            self.health_checker.start()
+            
+            # Отдаём метрики по HTTP
+            self._setup_metrics()
             
             # Запускаем бота
             logger.info("Запуск бота...")
             self.running = True
             
-            logger.info("Бот успешно запущен и готов к работе!")
-            
-            # Запускаем polling с обработкой ошибок для 24/7 работы
-            while self.running:
-                try:
-                    self.bot.polling(none_stop=True, interval=0, timeout=20)
-                except Exception as e:
-                    logger.error(f"Ошибка polling: {e}")
-                    import time
-                    time.sleep(5)  # Ждем 5 секунд перед повторной попыткой
-                    if self.running:
-                        logger.info("Перезапуск polling...")
+            if BOT_MODE == "webhook":
+                self._run_webhook()
+            else:
+                self._run_polling()
             
         except Exception as e:
             logger.error(f"Ошибка при запуске бота: {e}")
@@ -91,3 +213,12 @@ class TelegramBot:
             self.running = False
             if self.scheduler:
                 self.scheduler.stop()
+            self.outbox.stop()
+            self.health_checker.stop()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            self.dispatcher.stop()
+            self.broadcaster.shutdown()
+            self.handlers.user_states.stop_purging()
+            # Незавершённые диалоги переживают перезапуск, если задан USER_STATE_FILE
+            self.handlers.user_states.save()
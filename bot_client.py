@@ -0,0 +1,106 @@
+"""
+Клиент Bot API с учётом лимитов Telegram
+"""
+
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+from dispatcher import UpdateDispatcher
+from rate_limiter import AsyncRateLimiter, RateLimiter
+
+class BotClient(telebot.TeleBot):
+    """TeleBot, у которого исходящие сообщения проходят через RateLimiter"""
+
+    def __init__(self, token: str, rate_limiter: RateLimiter, **kwargs):
+        super().__init__(token, **kwargs)
+        self.rate_limiter = rate_limiter
+        self.dispatcher = None
+
+    def set_dispatcher(self, dispatcher: UpdateDispatcher):
+        """Передача обновлений в диспетчер вместо обработки на месте"""
+        self.dispatcher = dispatcher
+
+    def process_new_updates(self, updates):
+        if self.dispatcher is None:
+            return super().process_new_updates(updates)
+
+        for update in updates:
+            # Смещение сдвигаем до постановки в шард: иначе следующий getUpdates
+            # вернёт обновления, которые ещё ждут в очередях, и они выполнятся дважды
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.dispatcher.submit(update)
+
+    def process_update_now(self, update):
+        """Обработка одного обновления в текущем потоке (для рабочих потоков диспетчера).
+
+        last_update_id пишет только поток приёма: к моменту обработки он уже
+        не меньше update_id, поэтому TeleBot здесь смещение не трогает.
+        """
+        super().process_new_updates([update])
+
+    def send_message(self, chat_id, *args, **kwargs):
+        return self.rate_limiter.call(chat_id, super().send_message, chat_id, *args, **kwargs)
+
+    def send_photo(self, chat_id, *args, **kwargs):
+        return self.rate_limiter.call(chat_id, super().send_photo, chat_id, *args, **kwargs)
+
+    def send_video(self, chat_id, *args, **kwargs):
+        return self.rate_limiter.call(chat_id, super().send_video, chat_id, *args, **kwargs)
+
+    def send_animation(self, chat_id, *args, **kwargs):
+        return self.rate_limiter.call(chat_id, super().send_animation, chat_id, *args, **kwargs)
+
+    def send_document(self, chat_id, *args, **kwargs):
+        return self.rate_limiter.call(chat_id, super().send_document, chat_id, *args, **kwargs)
+
+    def send_audio(self, chat_id, *args, **kwargs):
+        return self.rate_limiter.call(chat_id, super().send_audio, chat_id, *args, **kwargs)
+
+    def send_media_group(self, chat_id, *args, **kwargs):
+        return self.rate_limiter.call(chat_id, super().send_media_group, chat_id, *args, **kwargs)
+
+    def edit_message_text(self, *args, **kwargs):
+        chat_id = _edit_chat_id(args, kwargs)
+        return self.rate_limiter.call(chat_id, super().edit_message_text, *args, **kwargs)
+
+class AsyncBotClient(AsyncTeleBot):
+    """AsyncTeleBot, у которого исходящие сообщения проходят через AsyncRateLimiter"""
+
+    def __init__(self, token: str, rate_limiter: AsyncRateLimiter, **kwargs):
+        super().__init__(token, **kwargs)
+        self.rate_limiter = rate_limiter
+
+    async def send_message(self, chat_id, *args, **kwargs):
+        return await self.rate_limiter.call(chat_id, super().send_message, chat_id, *args, **kwargs)
+
+    async def send_photo(self, chat_id, *args, **kwargs):
+        return await self.rate_limiter.call(chat_id, super().send_photo, chat_id, *args, **kwargs)
+
+    async def send_video(self, chat_id, *args, **kwargs):
+        return await self.rate_limiter.call(chat_id, super().send_video, chat_id, *args, **kwargs)
+
+    async def send_animation(self, chat_id, *args, **kwargs):
+        return await self.rate_limiter.call(chat_id, super().send_animation, chat_id, *args, **kwargs)
+
+    async def send_document(self, chat_id, *args, **kwargs):
+        return await self.rate_limiter.call(chat_id, super().send_document, chat_id, *args, **kwargs)
+
+    async def send_audio(self, chat_id, *args, **kwargs):
+        return await self.rate_limiter.call(chat_id, super().send_audio, chat_id, *args, **kwargs)
+
+    async def send_media_group(self, chat_id, *args, **kwargs):
+        return await self.rate_limiter.call(chat_id, super().send_media_group, chat_id, *args, **kwargs)
+
+    async def edit_message_text(self, *args, **kwargs):
+        chat_id = _edit_chat_id(args, kwargs)
+        return await self.rate_limiter.call(chat_id, super().edit_message_text, *args, **kwargs)
+
+def _edit_chat_id(args: tuple, kwargs: dict):
+    """chat_id из аргументов edit_message_text"""
+    # chat_id — второй позиционный параметр либо именованный
+    chat_id = kwargs.get("chat_id", args[1] if len(args) > 1 else None)
+    if chat_id is None:
+        # Инлайн-сообщение без чата: учитываем только глобальный лимит
+        chat_id = "inline"
+    return chat_id
@@ -0,0 +1,142 @@
+"""
+Параллельная рассылка сообщений по каналам
+"""
+
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Collection, Dict, List, Tuple
+
+from config import BROADCAST_MAX_WORKERS
+from rate_limiter import is_transient_error
+
+logger = logging.getLogger(__name__)
+
+class BroadcastResult:
+    """Итог рассылки по каналам"""
+
+    def __init__(self):
+        self.success_count = 0
+        self.error_count = 0
+        # (channel_id, channel_title, текст ошибки) в порядке каналов
+        self.errors: List[Tuple[str, str, str]] = []
+        # (channel_id, channel_title) каналов, пропущенных как недоступные
+        self.skipped: List[Tuple[str, str]] = []
+        # (channel_id, channel_title, исключение) ошибок, после которых стоит повторить отправку
+        self.transient: List[Tuple[str, str, Exception]] = []
+        # (channel_id, channel_title) каналов, переданных очереди повторов
+        self.deferred: List[Tuple[str, str]] = []
+
+    @classmethod
+    def with_skipped(cls, channels: Dict[str, str], dead: Collection[str]) -> Tuple['BroadcastResult', Dict[str, str]]:
+        """Новый итог с пропущенными каналами и оставшиеся для отправки каналы"""
+        result = cls()
+        targets = {}
+        for channel_id, title in channels.items():
+            if channel_id in dead:
+                result.skipped.append((channel_id, title))
+            else:
+                targets[channel_id] = title
+        return result, targets
+
+    def add_error(self, channel_id: str, title: str, error: Exception):
+        """Учёт неудачной отправки в канал"""
+        self.error_count += 1
+        self.errors.append((channel_id, title, str(error)))
+        if is_transient_error(error):
+            self.transient.append((channel_id, title, error))
+
+    def defer_transient(self):
+        """Перевод временных ошибок в отложенные: их отправит очередь повторов"""
+        deferred = {channel_id for channel_id, _, _ in self.transient}
+        self.errors = [error for error in self.errors if error[0] not in deferred]
+        self.error_count -= len(self.transient)
+        self.deferred.extend((channel_id, title) for channel_id, title, _ in self.transient)
+        self.transient = []
+
+    def merge(self, other: 'BroadcastResult'):
+        """Добавление итогов другой рассылки"""
+        self.success_count += other.success_count
+        self.error_count += other.error_count
+        self.errors.extend(other.errors)
+        self.skipped.extend(other.skipped)
+        self.transient.extend(other.transient)
+        self.deferred.extend(other.deferred)
+
+class Broadcaster:
+    """Общий пул потоков для рассылки в несколько каналов одновременно.
+
+    Используется и немедленной отправкой, и планировщиком, поэтому общее
+    число одновременных запросов к Bot API ограничено размером пула.
+    """
+
+    def __init__(self, max_workers: int = BROADCAST_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="broadcast"
+        )
+
+    def broadcast(self, channels: Dict[str, str], send: Callable[[str], object],
+                  dead: Collection[str] = ()) -> BroadcastResult:
+        """Отправка во все каналы параллельно.
+
+        channels — словарь {channel_id: channel_title}, send(channel_id)
+        выполняет отправку в один канал и бросает исключение при ошибке.
+        Каналы из dead не получают запросов и попадают в result.skipped.
+        """
+        result, targets = BroadcastResult.with_skipped(channels, dead)
+        # Контекст вызывающего потока переходит в пул, чтобы время запросов
+        # учитывалось в замере обработчика (см. profiling)
+        futures = [
+            (channel_id, title, self._executor.submit(contextvars.copy_context().run, send, channel_id))
+            for channel_id, title in targets.items()
+        ]
+
+        for channel_id, title, future in futures:
+            try:
+                future.result()
+                result.success_count += 1
+            except Exception as e:
+                result.add_error(channel_id, title, e)
+
+        return result
+
+    def shutdown(self):
+        """Остановка пула потоков"""
+        self._executor.shutdown(wait=False)
+
+class AsyncBroadcaster:
+    """Асинхронная рассылка: до max_workers одновременных отправок на цикле событий"""
+
+    def __init__(self, max_workers: int = BROADCAST_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._semaphore = None
+
+    async def broadcast(self, channels: Dict[str, str],
+                        send: Callable[[str], Awaitable[object]],
+                        dead: Collection[str] = ()) -> BroadcastResult:
+        """Отправка во все каналы параллельно (см. Broadcaster.broadcast)"""
+        result, channels = BroadcastResult.with_skipped(channels, dead)
+
+        if self._semaphore is None:
+            # Семафор создаётся внутри работающего цикла событий
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def send_limited(channel_id: str):
+            async with self._semaphore:
+                return await send(channel_id)
+
+        outcomes = await asyncio.gather(
+            *(send_limited(channel_id) for channel_id in channels),
+            return_exceptions=True
+        )
+
+        for (channel_id, title), outcome in zip(channels.items(), outcomes):
+            if isinstance(outcome, Exception):
+                result.add_error(channel_id, title, outcome)
+            else:
+                result.success_count += 1
+
+        return result
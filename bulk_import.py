@@ -0,0 +1,162 @@
+"""
+Массовое планирование постов из CSV- и JSON-файлов
+"""
+
+import codecs
+import csv
+import json
+import re
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import IMPORT_MAX_ROWS, IMPORT_MAX_TEXT_LENGTH
+from media import MEDIA_TYPES, media_from_url, validate_media
+
+# Разделители каналов в одной ячейке CSV или строке JSON
+CHANNELS_SEPARATOR = re.compile(r"[\s,;]+")
+
+class InvalidImportFile(Exception):
+    """Файл целиком не подходит для импорта"""
+
+class ImportResult:
+    """Итог разбора файла"""
+
+    def __init__(self):
+        # (message, schedule_time, channels, media) принятых строк
+        self.accepted: List[Tuple[str, datetime, List[str], Optional[List[dict]]]] = []
+        # (номер строки, причина) отклонённых строк
+        self.rejected: List[Tuple[int, str]] = []
+
+def _iter_csv_rows(data: bytes) -> Iterator[Tuple[int, dict]]:
+    """Строки CSV с заголовком time,text[,channels]"""
+    lines = codecs.iterdecode(data.splitlines(keepends=True), "utf-8-sig")
+    sample = data[:4096].decode("utf-8-sig", errors="ignore")
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.DictReader(lines, dialect=dialect)
+    if not reader.fieldnames or not {"time", "text"} <= {name.strip().lower() for name in reader.fieldnames}:
+        raise InvalidImportFile("в первой строке CSV должны быть столбцы time и text")
+
+    for row in reader:
+        yield reader.line_num, {
+            (key or "").strip().lower(): value for key, value in row.items()
+        }
+
+def _iter_json_rows(data: bytes) -> Iterator[Tuple[int, dict]]:
+    """Объекты из JSON-массива или JSON Lines, по одному за раз"""
+    text = data.decode("utf-8-sig")
+    decoder = json.JSONDecoder()
+    position = 0
+    length = len(text)
+    line_no, counted_to = 1, 0
+
+    # Массив разбираем поэлементно: пропускаем "[", "," и "]" между объектами
+    while position < length:
+        char = text[position]
+        if char.isspace() or char in "[,]":
+            position += 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(text, position)
+        except json.JSONDecodeError as e:
+            raise InvalidImportFile(f"некорректный JSON: {e.msg} (строка {e.lineno})")
+
+        line_no += text.count("\n", counted_to, position)
+        counted_to = position
+        yield line_no, value if isinstance(value, dict) else {"_invalid": value}
+        position = end
+
+def iter_rows(data: bytes, filename: str) -> Iterator[Tuple[int, dict]]:
+    """Строки файла по расширению: .csv или .json/.jsonl"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return _iter_csv_rows(data)
+    if name.endswith((".json", ".jsonl")):
+        return _iter_json_rows(data)
+    raise InvalidImportFile("поддерживаются только файлы .csv, .json и .jsonl")
+
+def _row_channels(value, user_channels: Dict[str, dict]) -> List[str]:
+    """Каналы строки; пустое значение — все каналы пользователя"""
+    if isinstance(value, list):
+        channels = [str(channel).strip() for channel in value if str(channel).strip()]
+    else:
+        channels = [channel for channel in CHANNELS_SEPARATOR.split(str(value or "")) if channel]
+
+    if not channels:
+        return list(user_channels)
+
+    unknown = [channel for channel in channels if channel not in user_channels]
+    if unknown:
+        raise ValueError(f"неизвестные каналы: {', '.join(unknown[:3])}")
+    return list(dict.fromkeys(channels))
+
+def _row_media(value) -> Optional[List[dict]]:
+    """Вложения строки: ссылки через пробел или список ссылок и объектов {"type", "url"}"""
+    if not value:
+        return None
+
+    items = value if isinstance(value, list) else str(value).split()
+    media = []
+    for item in items:
+        if isinstance(item, dict):
+            if item.get("type") not in MEDIA_TYPES or not item.get("url"):
+                raise ValueError("у вложения должны быть поля type и url")
+            media.append({"type": item["type"], "url": str(item["url"])})
+        elif str(item).startswith(("http://", "https://")):
+            media.append(media_from_url(str(item)))
+        else:
+            raise ValueError(f"вложение должно быть ссылкой http(s): {str(item)[:50]}")
+    return media or None
+
+def parse_posts(data: bytes, filename: str, user_channels: Dict[str, dict],
+                parse_time: Callable[[str], Optional[datetime]],
+                max_rows: int = IMPORT_MAX_ROWS) -> ImportResult:
+    """Разбор и проверка всех строк файла.
+
+    Строки читаются по одной; каждая проверяется независимо, поэтому
+    ошибка в одной строке не мешает принять остальные.
+    """
+    result = ImportResult()
+    now = datetime.now()
+
+    for line_no, row in iter_rows(data, filename):
+        if len(result.accepted) + len(result.rejected) >= max_rows:
+            result.rejected.append((line_no, f"превышен лимит в {max_rows} строк, остаток файла пропущен"))
+            break
+
+        if "_invalid" in row:
+            result.rejected.append((line_no, "ожидался объект с полями time и text"))
+            continue
+
+        text = str(row.get("text") or "").strip()
+        schedule_time = parse_time(str(row.get("time") or ""))
+        try:
+            media = _row_media(row.get("media"))
+        except ValueError as e:
+            result.rejected.append((line_no, str(e)))
+            continue
+        media_error = validate_media(media, text) if media else None
+
+        if media_error:
+            result.rejected.append((line_no, media_error))
+        elif not text and not media:
+            result.rejected.append((line_no, "пустой текст"))
+        elif len(text) > IMPORT_MAX_TEXT_LENGTH:
+            result.rejected.append((line_no, f"текст длиннее {IMPORT_MAX_TEXT_LENGTH} символов"))
+        elif schedule_time is None:
+            result.rejected.append((line_no, "неверный формат времени"))
+        elif schedule_time <= now:
+            result.rejected.append((line_no, "время уже прошло"))
+        else:
+            try:
+                channels = _row_channels(row.get("channels"), user_channels)
+            except ValueError as e:
+                result.rejected.append((line_no, str(e)))
+                continue
+            result.accepted.append((text, schedule_time, channels, media))
+
+    return result
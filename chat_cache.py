@@ -0,0 +1,152 @@
+"""
+Кэш сведений о чатах и профиля бота
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from telebot.types import ChatMemberUpdated
+
+from config import CHAT_CACHE_SIZE, CHAT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+def chat_key(chat_id) -> str:
+    """Ключ чата: числовой id строкой или @username в нижнем регистре"""
+    key = str(chat_id)
+    return key.lower() if key.startswith("@") else key
+
+class ChatCache:
+    """Общий кэш get_me, get_chat и get_chat_member.
+
+    Профиль бота запрашивается один раз при запуске. Сведения о чатах и
+    статусы участников хранятся ttl секунд, не более max_size записей
+    каждого вида. Обновление my_chat_member сбрасывает записи чата и
+    сразу кладёт в кэш новый статус бота из этого обновления.
+    """
+
+    MISSING = object()
+
+    def __init__(self, bot, ttl: float = CHAT_CACHE_TTL, max_size: int = CHAT_CACHE_SIZE):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_size = max_size
+        self.me = None
+        self._lock = threading.Lock()
+        self._chats: "OrderedDict[str, tuple]" = OrderedDict()
+        self._members: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # --- Хранилище записей ---
+
+    def _lookup(self, entries: OrderedDict, key: Hashable) -> Any:
+        """Значение из кэша или MISSING"""
+        now = time.monotonic()
+        with self._lock:
+            entry = entries.get(key)
+            if entry is None or entry[0] <= now:
+                entries.pop(key, None)
+                self.misses += 1
+                return self.MISSING
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _store(self, entries: OrderedDict, key: Hashable, value: Any):
+        """Сохранение значения на ttl секунд"""
+        with self._lock:
+            entries[key] = (time.monotonic() + self.ttl, value)
+            entries.move_to_end(key)
+            if len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def _store_chat(self, chat_id, chat):
+        """Сохранение чата под запрошенным ключом и под числовым id"""
+        self._store(self._chats, chat_key(chat_id), chat)
+        self._store(self._chats, chat_key(chat.id), chat)
+
+    def invalidate(self, chat_id, username: Optional[str] = None):
+        """Сброс сведений о чате и статусов его участников"""
+        keys = {chat_key(chat_id)}
+        if username:
+            keys.add(chat_key(f"@{username}"))
+
+        with self._lock:
+            for key in keys:
+                self._chats.pop(key, None)
+            for member_key in [k for k in self._members if k[0] in keys]:
+                del self._members[member_key]
+
+    def on_my_chat_member(self, update: ChatMemberUpdated):
+        """Изменение статуса бота в чате (обновление my_chat_member)"""
+        chat = update.chat
+        self.invalidate(chat.id, getattr(chat, "username", None))
+        self._store(self._members, (chat_key(chat.id), update.new_chat_member.user.id), update.new_chat_member)
+        logger.info(f"Статус бота в чате {chat.id} изменён: {update.new_chat_member.status}")
+
+    # --- Запросы к Bot API ---
+
+    def load_me(self):
+        """Однократный запрос профиля бота"""
+        self.me = self.bot.get_me()
+        logger.info(f"Бот @{self.me.username} (id {self.me.id})")
+        return self.me
+
+    def get_me(self):
+        """Профиль бота"""
+        return self.me if self.me is not None else self.load_me()
+
+    def get_chat(self, chat_id):
+        """Сведения о чате"""
+        chat = self._lookup(self._chats, chat_key(chat_id))
+        if chat is self.MISSING:
+            chat = self.bot.get_chat(chat_id)
+            self._store_chat(chat_id, chat)
+        return chat
+
+    def get_chat_member(self, chat_id, user_id: int):
+        """Статус участника чата"""
+        key = (chat_key(chat_id), user_id)
+        member = self._lookup(self._members, key)
+        if member is self.MISSING:
+            member = self.bot.get_chat_member(chat_id, user_id)
+            self._store(self._members, key, member)
+        return member
+
+    def get_bot_member(self, chat_id):
+        """Статус самого бота в чате"""
+        return self.get_chat_member(chat_id, self.get_me().id)
+
+
+class AsyncChatCache(ChatCache):
+    """ChatCache для AsyncTeleBot: запросы к API — корутины"""
+
+    async def load_me(self):
+        self.me = await self.bot.get_me()
+        logger.info(f"Бот @{self.me.username} (id {self.me.id})")
+        return self.me
+
+    async def get_me(self):
+        return self.me if self.me is not None else await self.load_me()
+
+    async def get_chat(self, chat_id):
+        chat = self._lookup(self._chats, chat_key(chat_id))
+        if chat is self.MISSING:
+            chat = await self.bot.get_chat(chat_id)
+            self._store_chat(chat_id, chat)
+        return chat
+
+    async def get_chat_member(self, chat_id, user_id: int):
+        key = (chat_key(chat_id), user_id)
+        member = self._lookup(self._members, key)
+        if member is self.MISSING:
+            member = await self.bot.get_chat_member(chat_id, user_id)
+            self._store(self._members, key, member)
+        return member
+
+    async def get_bot_member(self, chat_id):
+        return await self.get_chat_member(chat_id, (await self.get_me()).id)
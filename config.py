@@ -7,12 +7,127 @@ import os
 # Токен бота из переменных окружения
 BOT_TOKEN = os.getenv("BOT_TOKEN", "your_bot_token_here")
 
+# Режим работы: "sync" (TeleBot и потоки) или "async" (AsyncTeleBot, один цикл событий)
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "sync")
+
+# Размер общего пула соединений aiohttp в асинхронном режиме
+ASYNC_REQUEST_LIMIT = int(os.getenv("ASYNC_REQUEST_LIMIT", 100))
+
+# Получение обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Настройки webhook. Сервер слушает HTTP, TLS завершается на обратном прокси,
+# который проксирует WEBHOOK_URL на WEBHOOK_HOST:WEBHOOK_PORT + WEBHOOK_PATH
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет заголовка X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -);
+# пустая строка — случайный секрет на время работы процесса
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+
 # Настройки базы данных
 DATABASE_FILE = "bot_data.json"
 
-# Настройки планировщика
+# Режим хранения: "json" (полная перезапись файла), "journal" (журнал изменений)
+# или "sqlite" (база SQLite с однократным переносом данных из DATABASE_FILE)
+DATABASE_STORAGE = os.getenv("DATABASE_STORAGE", "json")
+
+# Файл базы SQLite
+SQLITE_DATABASE_FILE = os.getenv("SQLITE_DATABASE_FILE", "bot_data.sqlite3")
+
+# Размер журнала в байтах, после которого он сворачивается в снимок
+JOURNAL_COMPACT_THRESHOLD = int(os.getenv("JOURNAL_COMPACT_THRESHOLD", 4 * 1024 * 1024))
+
+# Настройки планировщика: планировщик спит до ближайшего поста,
+# а этот интервал используется для повторной попытки после ошибки
+# и как предел сна, когда базу SQLite меняют и другие процессы
 SCHEDULER_CHECK_INTERVAL = 30  # секунд
 
+# Несколько процессов бота на одной базе SQLite делят готовые посты арендой:
+# имя процесса (по умолчанию хост:pid), срок аренды (секунд) и сколько
+# постов арендуется за раз
+SCHEDULER_WORKER_ID = os.getenv("SCHEDULER_WORKER_ID", "")
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", 300))
+SCHEDULER_CLAIM_BATCH = int(os.getenv("SCHEDULER_CLAIM_BATCH", 20))
+
+# Очередь повторной отправки в каналы после временных сбоев (сеть, 5xx, 429):
+# число попыток до переноса в недоставленные, пауза перед второй попыткой
+# и предел паузы (секунд; пауза удваивается с каждой попыткой), сколько
+# доставок берётся за раз
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_BASE_DELAY = float(os.getenv("OUTBOX_BASE_DELAY", 30))
+OUTBOX_MAX_DELAY = float(os.getenv("OUTBOX_MAX_DELAY", 3600))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", 20))
+# Срок хранения недоставленных доставок (дней), после него они удаляются
+OUTBOX_DEAD_RETENTION_DAYS = int(os.getenv("OUTBOX_DEAD_RETENTION_DAYS", 30))
+
+# Потоки обработки обновлений (шарды по пользователям) и глубина очереди шарда
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 100))
+
+# Количество потоков для параллельной рассылки по каналам
+BROADCAST_MAX_WORKERS = int(os.getenv("BROADCAST_MAX_WORKERS", 8))
+
+# Лимиты Bot API: общий поток сообщений, личные чаты и группы/каналы
+RATE_LIMIT_GLOBAL_PER_SECOND = 30
+RATE_LIMIT_PRIVATE_PER_SECOND = 1
+RATE_LIMIT_GROUP_PER_MINUTE = 20
+RATE_LIMIT_CHAT_BURST = 3  # сообщений подряд в один чат без ожидания
+RATE_LIMIT_MAX_RETRIES = 5  # повторов после ответа 429
+
+# Состояния диалогов: время жизни брошенного диалога (секунд), максимум
+# одновременно хранимых диалогов и файл для сохранения между перезапусками
+# (пустая строка — не сохранять)
+USER_STATE_TTL = int(os.getenv("USER_STATE_TTL", 3600))
+USER_STATE_MAX_USERS = int(os.getenv("USER_STATE_MAX_USERS", 100000))
+USER_STATE_FILE = os.getenv("USER_STATE_FILE", "")
+# Интервал фоновой очистки брошенных диалогов (секунд)
+USER_STATE_PURGE_INTERVAL = int(os.getenv("USER_STATE_PURGE_INTERVAL", 300))
+
+# Проверка доступности каналов: интервал полного обхода (секунд),
+# размер пачки и пауза между пачками (секунд)
+HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", 6 * 3600))
+HEALTH_CHECK_BATCH_SIZE = int(os.getenv("HEALTH_CHECK_BATCH_SIZE", 20))
+HEALTH_CHECK_BATCH_PAUSE = float(os.getenv("HEALTH_CHECK_BATCH_PAUSE", 5))
+
+# Кэш get_chat/get_chat_member: время жизни записи (секунд) и число записей
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", 300))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 10000))
+
+# Сколько пользователей держать в кэше клавиатур
+KEYBOARD_CACHE_USERS = int(os.getenv("KEYBOARD_CACHE_USERS", 10000))
+
+# Сколько каналов или постов показывать на одной странице списка
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 10))
+
+# Импорт постов из файла: размер файла (байт), число строк и длина текста
+IMPORT_MAX_FILE_SIZE = int(os.getenv("IMPORT_MAX_FILE_SIZE", 2 * 1024 * 1024))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 1000))
+IMPORT_MAX_TEXT_LENGTH = 4096
+
+# Сколько ждать остальные части альбома после последней полученной (секунд)
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", 1.0))
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics
+# (0 — не запускать сервер) и предел числа наборов меток у одной метрики
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9464))
+METRICS_MAX_LABEL_SETS = int(os.getenv("METRICS_MAX_LABEL_SETS", 5000))
+
+# Администраторы бота: Telegram id через запятую (им доступна команда /profile)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+
+# Профилирование: порог, после которого обработка обновления попадает в лог
+# (миллисекунд), длительность снятия профиля по /profile по умолчанию и
+# максимум (секунд), число строк профиля в отчёте
+PROFILE_SLOW_HANDLER_MS = float(os.getenv("PROFILE_SLOW_HANDLER_MS", 1000))
+PROFILE_DEFAULT_SECONDS = int(os.getenv("PROFILE_DEFAULT_SECONDS", 30))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 600))
+PROFILE_REPORT_LINES = int(os.getenv("PROFILE_REPORT_LINES", 80))
+
 # Максимальное количество каналов/групп на пользователя
 MAX_CHANNELS_PER_USER = 10
 
@@ -42,6 +157,7 @@ MESSAGES = {
 🔹 Используйте инлайн кнопки для навигации
 🔹 Добавьте бота в каналы/группы как администратора
 🔹 Используйте кнопку "➕ Добавить канал/группу" для подключения
+🔹 Команда /import планирует сразу много постов из файла CSV или JSON
 
 🕐 Форматы времени для планирования:
 • 14:30 25.12.2024
@@ -52,13 +168,15 @@ MESSAGES = {
 ⚠️ Важно: Бот должен быть администратором в ваших каналах!""",
     
     "no_channels": "❌ У вас нет добавленных каналов или групп. Используйте /manage для добавления.",
-    "enter_message": "✍️ Введите сообщение для отправки:",
-    "enter_schedule_message": "✍️ Введите сообщение для планирования:",
-    "enter_schedule_time": "🕐 Введите время отправки в формате:\n14:30 25.12.2024\nили\n25.12.2024 14:30",
+    "enter_message": "✍️ Введите сообщение для отправки или пришлите фото, видео, альбом:",
+    "enter_schedule_message": "✍️ Введите сообщение для планирования или пришлите фото, видео, альбом:",
+    "enter_schedule_time": "🕐 Введите время отправки в формате:\n14:30 25.12.2024\nили\n25.12.2024 14:30\n\n🔁 Для повторяющегося поста — правило:\nежедневно 10:00\nеженедельно пн,пт 10:00\ncron 0 10 * * 1-5",
     "invalid_time": "❌ Неверный формат времени. Используйте: 14:30 25.12.2024",
     "time_in_past": "❌ Указанное время уже прошло. Выберите время в будущем.",
     "message_sent": "✅ Сообщение отправлено!",
     "message_scheduled": "⏰ Сообщение запланировано на {time}",
+    "message_recurring": "🔁 Сообщение будет публиковаться {rule}. Первая отправка: {time}",
+    "invalid_rule": "❌ Неверное правило повторения: {error}",
     "enter_channel_id": "📝 Введите ID канала или группы (например: @mychannel или -1001234567890):",
     "channel_added": "✅ Канал/группа добавлен(а): {title}",
     "channel_exists": "ℹ️ Этот канал/группа уже добавлен(а)",
@@ -67,11 +185,34 @@ MESSAGES = {
     "max_channels": f"❌ Достигнуто максимальное количество каналов/групп ({MAX_CHANNELS_PER_USER})",
     "posting_error": "❌ Ошибка при отправке в {title}: {error}",
     "posting_success": "✅ Отправлено в {title}",
+    "outbox_delivered": "✅ Пост доставлен в {title} с {attempts}-й попытки",
+    "outbox_dead": "❌ Пост не доставлен в {title} после {attempts} попыток: {error}",
     "cancel": "❌ Операция отменена",
     "manage_channels": "🛠 Управление каналами и группами:",
     "no_scheduled": "📭 Нет запланированных сообщений",
     "scheduled_list": "📋 Запланированные сообщения:",
-    "scheduled_deleted": "✅ Запланированное сообщение удалено"
+    "scheduled_deleted": "✅ Запланированное сообщение удалено",
+    "enter_import_file": """📥 Отправьте файл .csv, .json или .jsonl с постами.
+
+CSV — первая строка с заголовками:
+time,text,channels
+14:30 25.12.2024,Текст поста,-1001234567890 @mychannel
+
+JSON — массив объектов (или по объекту в строке для .jsonl):
+[{"time": "14:30 25.12.2024", "text": "Текст поста", "channels": ["@mychannel"]}]
+
+Столбец channels необязателен: без него пост уйдёт во все ваши каналы.
+Столбец media — ссылки на фото или видео через пробел; текст тогда станет подписью.""",
+    "import_hint": "📎 Чтобы запланировать посты из файла, используйте /import",
+    "import_too_large": "❌ Файл слишком большой (максимум {size} КБ)",
+    "import_error": "❌ Файл не принят: {error}",
+    "import_download_error": "❌ Не удалось получить файл от Telegram, отправьте его ещё раз",
+    "import_done": "📥 Импорт завершён\n\n✅ Запланировано: {accepted}\n❌ Отклонено строк: {rejected}",
+    "admin_only": "⛔ Команда доступна только администраторам бота",
+    "profile_usage": "❌ Укажите длительность в секундах: /profile 30 (не больше {max} с)",
+    "profile_started": "🔬 Профиль снимается {seconds} с, отчёт придёт файлом",
+    "profile_busy": "ℹ️ Профиль уже снимается, дождитесь отчёта",
+    "profile_done": "🔬 Профиль за {seconds} с: обработано обновлений — {updates}"
 }
 
 # Кнопки клавиатуры
@@ -83,5 +224,7 @@ BUTTONS = {
     "cancel": "❌ Отмена",
     "back": "⬅️ Назад",
     "confirm": "✅ Подтвердить",
-    "delete": "🗑 Удалить"
+    "delete": "🗑 Удалить",
+    "prev_page": "◀️ Предыдущие",
+    "next_page": "Следующие ▶️"
 }
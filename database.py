@@ -2,18 +2,137 @@
 Управление базой данных бота
 """
 
+import asyncio
+import bisect
+import hashlib
+import heapq
 import json
+import logging
 import os
-from typing import Dict, List, Optional
+import threading
+import time
+import uuid
+from collections import Counter
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from datetime import datetime
-import asyncio
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка файла данных недоступна
+    fcntl = None
+
+import metrics
+from config import DATABASE_FILE, DATABASE_STORAGE, JOURNAL_COMPACT_THRESHOLD, SQLITE_DATABASE_FILE
+
+logger = logging.getLogger(__name__)
+
+# Пост для пакетного добавления: (message, schedule_time, channels, media)
+ImportedPost = Tuple[str, datetime, List[str], Optional[List[dict]]]
+
+# Блокировки файлов данных, взятые этим процессом: {путь: открытый файл блокировки}
+_data_file_locks: Dict[str, object] = {}
+_data_file_locks_guard = threading.Lock()
+
+
+class DatabaseInUse(RuntimeError):
+    """Файл данных уже открыт другим процессом"""
+
+
+def _lock_data_file(filename: str):
+    """Эксклюзивная блокировка файла данных до завершения процесса.
+
+    Аренды постов и доставок хранятся в памяти процесса, поэтому второй
+    экземпляр бота с тем же файлом разослал бы посты повторно. Несколько
+    экземпляров поддерживает только хранилище SQLite (DATABASE_STORAGE=sqlite).
+    """
+    if fcntl is None:
+        return
+
+    path = os.path.realpath(f"{filename}.lock")
+    with _data_file_locks_guard:
+        if path in _data_file_locks:
+            return
+
+        lock_file = open(path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise DatabaseInUse(
+                f"Файл данных {filename} уже открыт другим процессом; "
+                f"несколько экземпляров бота поддерживает только хранилище SQLite"
+            )
+        _data_file_locks[path] = lock_file
+
+def content_key(message: str) -> str:
+    """Ключ текста поста в общем хранилище текстов"""
+    return hashlib.blake2b(message.encode('utf-8'), digest_size=16).hexdigest()
+
+def targets_key(channels: List[str]) -> str:
+    """Ключ списка каналов поста в общем хранилище списков"""
+    return content_key("\n".join(channels))
 
 class Database:
-    def __init__(self, filename: str = "bot_data.json"):
+    """Хранилище данных бота.
+
+    Один экземпляр разделяется между обработчиками и планировщиком,
+    поэтому все обращения к данным защищены общей блокировкой потоков.
+
+    Поддерживает два режима хранения:
+    • "json" — весь файл перезаписывается при каждом изменении;
+    • "journal" — каждое изменение дописывается одной компактной строкой
+      в журнал, который при запуске воспроизводится поверх снимка и
+      в фоне сворачивается в новый снимок после превышения порога.
+
+    Аренда постов планировщиком (claim_due_posts) хранится только в памяти:
+    с файлами JSON работает один процесс бота. Для нескольких процессов
+    нужно хранилище SQLite.
+
+    Тексты постов и списки каналов хранятся по одному разу в
+    data["contents"] и data["targets"] под ключом-хешем; посты ссылаются
+    на них полями content и targets. Запись удаляется, когда на неё не
+    остаётся ссылок.
+
+    Очередь повторной отправки (data["outbox"]) хранит доставки в один
+    канал вместе с текстом и вложениями; у недоставленных доставок
+    next_attempt равен None, они хранятся OUTBOX_DEAD_RETENTION_DAYS дней.
+    """
+
+    # Файл данных не рассчитан на одновременную работу нескольких процессов:
+    # второй процесс с тем же файлом получает DatabaseInUse
+    shared = False
+
+    def __init__(self, filename: str = DATABASE_FILE, storage: str = DATABASE_STORAGE):
+        _lock_data_file(filename)
         self.filename = filename
+        self.storage = storage
+        self.journal_filename = f"{filename}.journal"
+        self._compacting_filename = f"{filename}.journal.compacting"
+        self._lock = threading.RLock()
+        self._journal = None
+        self._journal_size = 0
+        self._compacting = False
+        self._listeners = []
+        # Аренда постов планировщиком: {post_id: (worker_id, epoch окончания)}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        # Аренда доставок очереди повторов: {delivery_id: (worker_id, epoch окончания)}
+        self._delivery_leases: Dict[str, Tuple[str, float]] = {}
+
         self.data = self._load_data()
-        self._lock = asyncio.Lock()
-    
+        self._journal_seq = self.data.get("journal_seq", 0)
+        self._build_indexes()
+
+        if self.storage == "journal":
+            self._open_journal()
+        elif self._replay_journal_files() or os.path.exists(self.journal_filename):
+            # Переход из режима журнала: переносим хвост журнала в снимок
+            self.data["journal_seq"] = self._journal_seq
+            self._write_snapshot()
+            for path in (self._compacting_filename, self.journal_filename):
+                if os.path.exists(path):
+                    os.remove(path)
+
     def _load_data(self) -> dict:
         """Загрузка данных из файла"""
         if os.path.exists(self.filename):
@@ -22,70 +141,516 @@ class Database:
                     return json.load(f)
             except (json.JSONDecodeError, FileNotFoundError):
                 pass
-        
+
         # Структура по умолчанию
         return {
             "users": {},
             "scheduled_posts": []
         }
-    
-    async def _save_data(self):
-        """Сохранение данных в файл"""
-        async with self._lock:
+
+    def _build_indexes(self):
+        """Построение вспомогательных индексов по загруженным данным"""
+        # Общие тексты и списки каналов со счётчиками ссылок из постов
+        self.data.setdefault("contents", {})
+        self.data.setdefault("targets", {})
+        self._content_refs: Counter = Counter()
+        self._target_refs: Counter = Counter()
+        # В памяти посты лежат словарём по id, в файле — списком (см. _snapshot)
+        posts = [self._intern_post(post) for post in self.data["scheduled_posts"]]
+        self.data["scheduled_posts"] = {post["id"]: post for post in posts}
+        for name, refs in (("contents", self._content_refs), ("targets", self._target_refs)):
+            stored = self.data[name]
+            for key in [key for key in stored if key not in refs]:
+                del stored[key]
+
+        self._posts_by_id: Dict[str, dict] = self.data["scheduled_posts"]
+
+        # Состояние каналов, которое поддерживает проверка доступности
+        self.data.setdefault("channel_status", {})
+        # Очередь повторной отправки: {delivery_id: доставка}
+        self.data.setdefault("outbox", {})
+        # Индекс повторов: куча (epoch, delivery_id) с ленивым удалением, как у
+        # постов. Запись действительна, пока её время совпадает с _delivery_ready_ts:
+        # это next_attempt, а у арендованной доставки — окончание аренды
+        self._delivery_ready_ts: Dict[str, float] = {}
+        self._delivery_heap: List[Tuple[float, str]] = []
+        self._dead_deliveries: Set[str] = set()
+        for delivery in self.data["outbox"].values():
+            self._index_delivery(delivery)
+        # Какие пользователи добавили канал: {channel_id: {user_id, ...}}
+        self._channel_users: Dict[str, Set[str]] = {}
+        for user_id, user in self.data["users"].items():
+            for channel_id in user["channels"]:
+                self._channel_users.setdefault(channel_id, set()).add(user_id)
+
+        # Индекс времени отправки: куча (epoch, post_id) с ленивым удалением.
+        # Запись в куче действительна, пока её время совпадает с _post_ready_ts:
+        # это время отправки (_post_due_ts), а у арендованного поста — окончание аренды
+        self._post_due_ts = {
+            post["id"]: datetime.fromisoformat(post["schedule_time"]).timestamp()
+            for post in self._posts_by_id.values()
+        }
+        self._post_ready_ts: Dict[str, float] = dict(self._post_due_ts)
+        self._due_heap = [(ts, post_id) for post_id, ts in self._post_ready_ts.items()]
+        heapq.heapify(self._due_heap)
+
+        # Посты каждого пользователя: отсортированный список (epoch, post_id)
+        self._user_posts: Dict[int, List[Tuple[float, str]]] = {}
+        for post in self._posts_by_id.values():
+            bisect.insort(
+                self._user_posts.setdefault(post["user_id"], []),
+                (self._post_due_ts[post["id"]], post["id"])
+            )
+
+    def _snapshot(self) -> dict:
+        """Данные в формате файла: посты — списком"""
+        return dict(self.data, scheduled_posts=list(self._posts_by_id.values()))
+
+    def _write_snapshot(self):
+        """Полная перезапись файла данных"""
+        with self._lock:
             with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
-    
-    async def add_user_channel(self, user_id: int, channel_id: str, channel_title: str) -> bool:
+                json.dump(self._snapshot(), f, ensure_ascii=False, indent=2)
+                metrics.STORAGE_WRITE_BYTES.observe(f.tell(), backend=self.storage)
+
+    # --- Журнал изменений ---
+
+    def _replay_journal_files(self) -> int:
+        """Воспроизведение всех файлов журнала поверх снимка"""
+        replayed = 0
+        for path in (self._compacting_filename, self.journal_filename):
+            replayed += self._replay_journal_file(path)
+
+        if replayed:
+            logger.info(f"Из журнала восстановлено изменений: {replayed}")
+        return replayed
+
+    def _open_journal(self):
+        """Воспроизведение журнала и открытие его на дозапись"""
+        self._replay_journal_files()
+        self._journal = open(self.journal_filename, 'a', encoding='utf-8')
+        self._journal_size = self._journal.tell()
+
+        # Остатки прерванного сжатия сворачиваем сразу
+        if os.path.exists(self._compacting_filename):
+            self._compact()
+
+    def _replay_journal_file(self, path: str) -> int:
+        """Применение записей журнала, которых ещё нет в снимке"""
+        if not os.path.exists(path):
+            return 0
+
+        snapshot_seq = self.data.get("journal_seq", 0)
+        applied = 0
+        valid_size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    # Запись без перевода строки дописана не полностью
+                    if not line.endswith(b"\n"):
+                        raise ValueError("нет конца строки")
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя запись после аварийной остановки
+                    logger.warning(f"Повреждённая запись в журнале {path}, воспроизведение остановлено")
+                    break
+                valid_size += len(line)
+
+                if record["s"] <= snapshot_seq:
+                    continue
+
+                self._apply(record["op"], record["a"])
+                self._journal_seq = record["s"]
+                applied += 1
+
+        # Обрезаем хвост, иначе следующая запись склеится с оборванной строкой
+        if valid_size < os.path.getsize(path):
+            os.truncate(path, valid_size)
+        return applied
+
+    def _append_journal(self, op: str, args: dict):
+        """Дозапись одной операции в журнал"""
+        self._journal_seq += 1
+        line = json.dumps(
+            {"s": self._journal_seq, "op": op, "a": args},
+            ensure_ascii=False,
+            separators=(',', ':')
+        ) + "\n"
+        self._journal.write(line)
+        self._journal.flush()
+        line_size = len(line.encode('utf-8'))
+        self._journal_size += line_size
+        metrics.STORAGE_WRITE_BYTES.observe(line_size, backend=self.storage)
+
+        if self._journal_size >= JOURNAL_COMPACT_THRESHOLD and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._compact, daemon=True).start()
+
+    def _compact(self):
+        """Сворачивание журнала в новый снимок"""
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                self.data["journal_seq"] = self._journal_seq
+                payload = json.dumps(self._snapshot(), ensure_ascii=False, separators=(',', ':'))
+
+                # Текущий журнал откладываем в сторону, новые записи идут в чистый файл
+                self._journal.close()
+                if os.path.exists(self._compacting_filename):
+                    with open(self._compacting_filename, 'a', encoding='utf-8') as dst, \
+                         open(self.journal_filename, 'r', encoding='utf-8') as src:
+                        dst.write(src.read())
+                    os.remove(self.journal_filename)
+                else:
+                    os.replace(self.journal_filename, self._compacting_filename)
+                self._journal = open(self.journal_filename, 'a', encoding='utf-8')
+                self._journal_size = 0
+
+            tmp_filename = f"{self.filename}.tmp"
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+                metrics.STORAGE_WRITE_BYTES.observe(f.tell(), backend="snapshot")
+            os.replace(tmp_filename, self.filename)
+            os.remove(self._compacting_filename)
+            logger.info("Журнал базы данных свёрнут в снимок")
+        except Exception as e:
+            logger.error(f"Ошибка при сжатии журнала: {e}")
+        finally:
+            self._compacting = False
+            metrics.STORAGE_WRITE_SECONDS.observe(time.perf_counter() - started, backend=self.storage, op="compact")
+
+    # --- Применение операций ---
+
+    def _commit(self, op: str, args: dict):
+        """Применение операции и её сохранение в выбранном режиме"""
+        with self._lock, metrics.STORAGE_WRITE_SECONDS.time(backend=self.storage, op=op):
+            self._apply(op, args)
+            if self.storage == "journal":
+                self._append_journal(op, args)
+            else:
+                self._write_snapshot()
+
+    def _apply(self, op: str, args: dict):
+        """Применение операции к данным в памяти"""
+        getattr(self, f"_op_{op}")(**args)
+
+    def _op_set_channel(self, user_id: str, channel_id: str, info: dict):
+        user = self.data["users"].setdefault(user_id, {"channels": {}})
+        user["channels"][channel_id] = info
+        self._channel_users.setdefault(channel_id, set()).add(user_id)
+
+    def _op_del_channel(self, user_id: str, channel_id: str):
+        user = self.data["users"].get(user_id)
+        if user:
+            user["channels"].pop(channel_id, None)
+
+        users = self._channel_users.get(channel_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                # Канал больше никем не используется
+                del self._channel_users[channel_id]
+                self.data["channel_status"].pop(channel_id, None)
+
+    def _op_set_channel_status(self, channel_id: str, status: dict):
+        self.data["channel_status"][channel_id] = status
+
+    def _split_posts(self, posts: List[dict]) -> Tuple[List[dict], dict, dict]:
+        """Посты со ссылками вместо message/channels и ещё не сохранённые тексты и списки"""
+        stored, contents, targets = [], {}, {}
+        for post in posts:
+            post = dict(post)
+            message = post.pop("message")
+            post["content"] = content_key(message)
+            if post["content"] not in self.data["contents"]:
+                contents[post["content"]] = message
+
+            channels = post.pop("channels")
+            post["targets"] = targets_key(channels)
+            if post["targets"] not in self.data["targets"]:
+                targets[post["targets"]] = channels
+            stored.append(post)
+        return stored, contents, targets
+
+    def _intern_post(self, post: dict, contents: Optional[dict] = None, targets: Optional[dict] = None) -> dict:
+        """Учёт ссылок поста на общие тексты и списки каналов"""
+        if "message" in post:
+            # Пост в старом формате, с текстом и каналами внутри
+            (post,), contents, targets = self._split_posts([post])
+        if contents:
+            self.data["contents"].update(contents)
+        if targets:
+            self.data["targets"].update(targets)
+
+        self._content_refs[post["content"]] += 1
+        self._target_refs[post["targets"]] += 1
+        return post
+
+    def _release_post(self, post: dict):
+        """Снятие ссылок удалённого поста; тексты без ссылок удаляются"""
+        for key, refs, stored in (
+            (post["content"], self._content_refs, self.data["contents"]),
+            (post["targets"], self._target_refs, self.data["targets"])
+        ):
+            refs[key] -= 1
+            if refs[key] <= 0:
+                del refs[key]
+                stored.pop(key, None)
+
+    def _resolve_post(self, post: dict) -> dict:
+        """Пост в публичном виде: с текстом и списком каналов"""
+        return dict(
+            post,
+            message=self.data["contents"][post["content"]],
+            channels=self.data["targets"][post["targets"]]
+        )
+
+    def _op_add_post(self, post: dict, contents: Optional[dict] = None, targets: Optional[dict] = None):
+        post = self._intern_post(post, contents, targets)
+        self._posts_by_id[post["id"]] = post
+
+        ts = datetime.fromisoformat(post["schedule_time"]).timestamp()
+        self._post_due_ts[post["id"]] = ts
+        self._post_ready_ts[post["id"]] = ts
+        heapq.heappush(self._due_heap, (ts, post["id"]))
+        bisect.insort(self._user_posts.setdefault(post["user_id"], []), (ts, post["id"]))
+
+    def _op_add_posts(self, posts: List[dict], contents: Optional[dict] = None, targets: Optional[dict] = None):
+        if contents:
+            self.data["contents"].update(contents)
+        if targets:
+            self.data["targets"].update(targets)
+        for post in posts:
+            self._op_add_post(post)
+
+    def _op_reschedule_post(self, post_id: str, schedule_time: str):
+        post = self._posts_by_id.get(post_id)
+        if post is None:
+            return
+
+        old_ts = self._post_due_ts[post_id]
+        user_posts = self._user_posts[post["user_id"]]
+        index = bisect.bisect_left(user_posts, (old_ts, post_id))
+        if index < len(user_posts) and user_posts[index][1] == post_id:
+            del user_posts[index]
+
+        # Старая запись кучи становится недействительной: время в _post_ready_ts сменилось
+        ts = datetime.fromisoformat(schedule_time).timestamp()
+        post["schedule_time"] = schedule_time
+        self._post_due_ts[post_id] = ts
+        self._post_ready_ts[post_id] = ts
+        heapq.heappush(self._due_heap, (ts, post_id))
+        bisect.insort(user_posts, (ts, post_id))
+
+    def _op_set_post_media(self, post_id: str, media: List[dict]):
+        post = self._posts_by_id.get(post_id)
+        if post is not None:
+            post["media"] = media
+
+    def _op_del_post(self, post_id: str):
+        post = self._posts_by_id.pop(post_id, None)
+        if post is not None:
+            self._release_post(post)
+            ts = self._post_due_ts.pop(post_id, None)
+            self._post_ready_ts.pop(post_id, None)
+
+            user_posts = self._user_posts.get(post["user_id"], [])
+            index = bisect.bisect_left(user_posts, (ts, post_id))
+            if index < len(user_posts) and user_posts[index][1] == post_id:
+                del user_posts[index]
+            if not user_posts:
+                self._user_posts.pop(post["user_id"], None)
+
+            # Запись в куче остаётся до извлечения; при избытке мусора перестраиваем
+            if len(self._due_heap) > 2 * len(self._post_ready_ts) + 64:
+                self._due_heap = [(ts, pid) for pid, ts in self._post_ready_ts.items()]
+                heapq.heapify(self._due_heap)
+
+    def _index_delivery(self, delivery: dict):
+        """Учёт доставки в индексе повторов или среди недоставленных"""
+        delivery_id = delivery["id"]
+        if delivery["next_attempt"] is None:
+            self._delivery_ready_ts.pop(delivery_id, None)
+            self._dead_deliveries.add(delivery_id)
+        else:
+            self._delivery_ready_ts[delivery_id] = delivery["next_attempt"]
+            heapq.heappush(self._delivery_heap, (delivery["next_attempt"], delivery_id))
+
+    def _unindex_delivery(self, delivery_id: str):
+        """Снятие доставки с индексов; при избытке мусора куча перестраивается"""
+        self._delivery_ready_ts.pop(delivery_id, None)
+        self._dead_deliveries.discard(delivery_id)
+        if len(self._delivery_heap) > 2 * len(self._delivery_ready_ts) + 64:
+            self._delivery_heap = [(ts, did) for did, ts in self._delivery_ready_ts.items()]
+            heapq.heapify(self._delivery_heap)
+
+    def _op_add_deliveries(self, deliveries: List[dict]):
+        for delivery in deliveries:
+            self.data["outbox"][delivery["id"]] = delivery
+            self._index_delivery(delivery)
+
+    def _op_retry_delivery(self, delivery_id: str, next_attempt: float, error: str):
+        delivery = self.data["outbox"].get(delivery_id)
+        if delivery is not None:
+            delivery["attempts"] += 1
+            delivery["next_attempt"] = next_attempt
+            delivery["last_error"] = error
+            self._index_delivery(delivery)
+
+    def _op_fail_delivery(self, delivery_id: str, error: str, failed_at: str):
+        delivery = self.data["outbox"].get(delivery_id)
+        if delivery is not None:
+            delivery["attempts"] += 1
+            delivery["next_attempt"] = None
+            delivery["last_error"] = error
+            delivery["failed_at"] = failed_at
+            self._index_delivery(delivery)
+
+    def _op_del_delivery(self, delivery_id: str):
+        self.data["outbox"].pop(delivery_id, None)
+        self._unindex_delivery(delivery_id)
+
+    def _op_del_deliveries(self, delivery_ids: List[str]):
+        for delivery_id in delivery_ids:
+            self._op_del_delivery(delivery_id)
+
+    def _is_due_entry_valid(self, entry: tuple) -> bool:
+        """Проверка, что запись кучи не устарела"""
+        ts, post_id = entry
+        return self._post_ready_ts.get(post_id) == ts
+
+    # --- Уведомления об изменениях ---
+
+    def add_listener(self, callback: Callable[[str, int], None]):
+        """Подписка на изменения данных.
+
+        callback(kind, user_id) вызывается под блокировкой хранилища
+        после каждого изменения; kind — "channels" или "posts".
+        Обработчик должен быть быстрым и не обращаться к хранилищу повторно
+        из других потоков с ожиданием.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, user_id: int):
+        """Оповещение подписчиков об изменении"""
+        for callback in self._listeners:
+            try:
+                callback(kind, user_id)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике изменений базы данных: {e}")
+
+    # --- Публичный API ---
+
+    def add_user_channel(self, user_id: int, channel_id: str, channel_title: str) -> bool:
         """Добавление канала/группы для пользователя"""
         user_id_str = str(user_id)
-        
-        if user_id_str not in self.data["users"]:
-            self.data["users"][user_id_str] = {"channels": {}}
-        
-        user_channels = self.data["users"][user_id_str]["channels"]
-        
-        # Проверка лимита каналов
-        from config import MAX_CHANNELS_PER_USER
-        if len(user_channels) >= MAX_CHANNELS_PER_USER:
-            return False
-        
-        # Добавление канала
-        user_channels[channel_id] = {
-            "title": channel_title,
-            "added_at": datetime.now().isoformat()
-        }
-        
-        await self._save_data()
-        return True
-    
-    async def remove_user_channel(self, user_id: int, channel_id: str) -> bool:
-        """Удаление канала/группы пользователя"""
-        user_id_str = str(user_id)
-        
-        if (user_id_str in self.data["users"] and 
-            channel_id in self.data["users"][user_id_str]["channels"]):
-            
-            del self.data["users"][user_id_str]["channels"][channel_id]
-            await self._save_data()
+
+        with self._lock:
+            user_channels = self.get_user_channels(user_id)
+
+            # Проверка лимита каналов
+            from config import MAX_CHANNELS_PER_USER
+            if len(user_channels) >= MAX_CHANNELS_PER_USER:
+                return False
+
+            # Добавление канала
+            self._commit("set_channel", {
+                "user_id": user_id_str,
+                "channel_id": channel_id,
+                "info": {
+                    "title": channel_title,
+                    "added_at": datetime.now().isoformat()
+                }
+            })
+            self._notify("channels", user_id)
             return True
-        
+
+    def remove_user_channel(self, user_id: int, channel_id: str) -> bool:
+        """Удаление канала/группы пользователя"""
+        with self._lock:
+            if channel_id in self.get_user_channels(user_id):
+                self._commit("del_channel", {"user_id": str(user_id), "channel_id": channel_id})
+                self._notify("channels", user_id)
+                return True
+
         return False
-    
+
     def get_user_channels(self, user_id: int) -> Dict[str, dict]:
         """Получение каналов/групп пользователя"""
         user_id_str = str(user_id)
-        
-        if user_id_str in self.data["users"]:
-            return self.data["users"][user_id_str]["channels"]
-        
+
+        with self._lock:
+            if user_id_str in self.data["users"]:
+                return dict(self.data["users"][user_id_str]["channels"])
+
         return {}
-    
-    async def add_scheduled_post(self, user_id: int, message: str, 
-                               schedule_time: datetime, channels: List[str]) -> str:
-        """Добавление запланированного поста"""
+
+    def get_user_channels_page(self, user_id: int, offset: int, limit: int) -> Tuple[Dict[str, dict], bool]:
+        """Страница каналов/групп пользователя и признак следующей страницы"""
+        with self._lock:
+            user = self.data["users"].get(str(user_id))
+            if not user:
+                return {}, False
+            items = list(islice(user["channels"].items(), offset, offset + limit + 1))
+
+        return dict(items[:limit]), len(items) > limit
+
+    def get_channel_ids(self) -> List[str]:
+        """Все каналы, добавленные хотя бы одним пользователем"""
+        with self._lock:
+            return list(self._channel_users)
+
+    def set_channel_status(self, channel_id: str, status: str, error: Optional[str] = None) -> bool:
+        """Запись состояния канала; True — состояние изменилось.
+
+        Сохраняется только смена состояния, поэтому регулярные проверки
+        не пишут на диск, пока с каналом ничего не происходит.
+        """
+        with self._lock:
+            if channel_id not in self._channel_users:
+                return False
+
+            current = self.data["channel_status"].get(channel_id)
+            if current is not None and current["status"] == status:
+                return False
+
+            self._commit("set_channel_status", {
+                "channel_id": channel_id,
+                "status": {"status": status, "error": error, "changed_at": datetime.now().isoformat()}
+            })
+            return True
+
+    def get_channel_status(self, channel_id: str) -> Optional[str]:
+        """Состояние канала; None — канал ещё не проверялся"""
+        with self._lock:
+            status = self.data["channel_status"].get(channel_id)
+            return status["status"] if status else None
+
+    def get_dead_channels(self, channel_ids: Iterable[str]) -> Set[str]:
+        """Каналы из channel_ids, в которые отправка заведомо невозможна"""
+        with self._lock:
+            statuses = self.data["channel_status"]
+            return {
+                channel_id for channel_id in channel_ids
+                if statuses.get(channel_id, {}).get("status") == "dead"
+            }
+
+    def _new_post(self, user_id: int, message: str, schedule_time: datetime,
+                  channels: List[str], taken: Set[str] = frozenset(),
+                  recurrence: Optional[str] = None, media: Optional[List[dict]] = None) -> dict:
+        """Словарь нового поста с ещё не занятым id"""
         post_id = f"{user_id}_{int(schedule_time.timestamp())}"
-        
-        scheduled_post = {
+
+        # Идентификатор служит ключом в журнале, поэтому он должен быть уникальным
+        suffix = 1
+        base_id = post_id
+        while post_id in self._posts_by_id or post_id in taken:
+            post_id = f"{base_id}_{suffix}"
+            suffix += 1
+
+        post = {
             "id": post_id,
             "user_id": user_id,
             "message": message,
@@ -93,34 +658,426 @@ class Database:
             "channels": channels,
             "created_at": datetime.now().isoformat()
         }
-        
-        self.data["scheduled_posts"].append(scheduled_post)
-        await self._save_data()
-        return post_id
-    
+        if recurrence:
+            post["recurrence"] = recurrence
+        if media:
+            post["media"] = media
+        return post
+
+    def add_scheduled_post(self, user_id: int, message: str,
+                         schedule_time: datetime, channels: List[str],
+                         recurrence: Optional[str] = None,
+                         media: Optional[List[dict]] = None) -> str:
+        """Добавление запланированного поста.
+
+        recurrence — правило повторения (см. recurrence.parse_rule); такой
+        пост хранится один раз, а после отправки переносится на следующее
+        срабатывание. media — вложения поста (см. media.extract_media),
+        message тогда служит подписью.
+        """
+        with self._lock:
+            scheduled_post = self._new_post(
+                user_id, message, schedule_time, channels, recurrence=recurrence, media=media
+            )
+            (stored,), contents, targets = self._split_posts([scheduled_post])
+            self._commit("add_post", {"post": stored, "contents": contents, "targets": targets})
+            self._notify("posts", user_id)
+            return scheduled_post["id"]
+
+    def add_scheduled_posts(self, user_id: int, posts: List[ImportedPost]) -> List[str]:
+        """Добавление пачки постов (message, schedule_time, channels, media) одной записью"""
+        with self._lock:
+            new_posts = []
+            taken = set()
+            for message, schedule_time, channels, media in posts:
+                scheduled_post = self._new_post(user_id, message, schedule_time, channels, taken, media=media)
+                taken.add(scheduled_post["id"])
+                new_posts.append(scheduled_post)
+
+            if new_posts:
+                stored, contents, targets = self._split_posts(new_posts)
+                self._commit("add_posts", {"posts": stored, "contents": contents, "targets": targets})
+                self._notify("posts", user_id)
+            return [scheduled_post["id"] for scheduled_post in new_posts]
+
     def get_due_posts(self) -> List[dict]:
-        """Получение постов, готовых к отправке"""
-        now = datetime.now()
-        due_posts = []
-        
-        for post in self.data["scheduled_posts"]:
-            schedule_time = datetime.fromisoformat(post["schedule_time"])
-            if schedule_time <= now:
-                due_posts.append(post)
-        
-        return due_posts
-    
-    async def remove_scheduled_post(self, post_id: str) -> bool:
-        """Удаление запланированного поста"""
-        for i, post in enumerate(self.data["scheduled_posts"]):
-            if post["id"] == post_id:
-                del self.data["scheduled_posts"][i]
-                await self._save_data()
+        """Получение постов, готовых к отправке и не арендованных обработчиком.
+
+        Куча только читается: обход идёт от вершины по записям не позже
+        текущего времени, поэтому вызов стоит O(k) для k наступивших записей
+        и не перестраивает кучу. Для отправки нужен claim_due_posts — он
+        убирает взятые посты из выборки до окончания аренды.
+        """
+        now_ts = datetime.now().timestamp()
+        due_entries = []
+
+        with self._lock:
+            heap = self._due_heap
+            stack = [0] if heap else []
+            while stack:
+                index = stack.pop()
+                entry = heap[index]
+                if entry[0] > now_ts:
+                    continue
+                if self._is_due_entry_valid(entry):
+                    due_entries.append(entry)
+                stack.extend(child for child in (2 * index + 1, 2 * index + 2) if child < len(heap))
+
+            due_entries.sort()
+            return [self._resolve_post(self._posts_by_id[post_id]) for _, post_id in due_entries]
+
+    def claim_due_posts(self, worker_id: str, lease_seconds: float, limit: Optional[int] = None) -> List[dict]:
+        """Аренда готовых к отправке постов, не арендованных другими.
+
+        Пост остаётся за worker_id lease_seconds секунд; reschedule_post и
+        remove_scheduled_post снимают аренду. Если обработчик не успел
+        завершить пост, после окончания аренды его получит следующий вызов.
+        Арендованный пост возвращается в кучу со временем окончания аренды,
+        поэтому выборка не проходит по постам в работе.
+        """
+        now_ts = datetime.now().timestamp()
+        claimed = []
+
+        with self._lock:
+            heap = self._due_heap
+            while heap and heap[0][0] <= now_ts and (limit is None or len(claimed) < limit):
+                entry = heapq.heappop(heap)
+                if not self._is_due_entry_valid(entry):
+                    continue
+
+                post_id = entry[1]
+                lease_until = now_ts + lease_seconds
+                self._leases[post_id] = (worker_id, lease_until)
+                self._post_ready_ts[post_id] = lease_until
+                heapq.heappush(heap, (lease_until, post_id))
+                claimed.append(post_id)
+
+            return [self._resolve_post(self._posts_by_id[post_id]) for post_id in claimed]
+
+    def next_due_time(self) -> Optional[float]:
+        """Время (epoch), когда ближайший пост можно будет взять в аренду.
+
+        Арендованный пост лежит в куче со временем окончания аренды, иначе
+        планировщик просыпался бы ради поста, который уже обрабатывается.
+        """
+        with self._lock:
+            heap = self._due_heap
+            while heap and not self._is_due_entry_valid(heap[0]):
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    def _lease_lost(self, post_id: str, worker_id: Optional[str]) -> bool:
+        """Аренда поста перешла к другому обработчику (worker_id None — без проверки)"""
+        if worker_id is None:
+            return False
+        lease = self._leases.get(post_id)
+        return lease is None or lease[0] != worker_id
+
+    def reschedule_post(self, post_id: str, schedule_time: datetime, worker_id: Optional[str] = None) -> bool:
+        """Перенос поста на новое время (следующее срабатывание повторяющегося поста).
+
+        С worker_id перенос выполняется, только если пост всё ещё арендован
+        этим обработчиком; иначе возвращается False.
+        """
+        with self._lock:
+            post = self._posts_by_id.get(post_id)
+            if post is None or self._lease_lost(post_id, worker_id):
+                return False
+
+            self._commit("reschedule_post", {"post_id": post_id, "schedule_time": schedule_time.isoformat()})
+            self._leases.pop(post_id, None)
+            self._notify("posts", post["user_id"])
+            return True
+
+    def set_post_media(self, post_id: str, media: List[dict]) -> bool:
+        """Замена вложений поста, например ссылок на file_id после первой загрузки"""
+        with self._lock:
+            post = self._posts_by_id.get(post_id)
+            if post is None:
+                return False
+
+            self._commit("set_post_media", {"post_id": post_id, "media": media})
+            self._notify("posts", post["user_id"])
+            return True
+
+    def remove_scheduled_post(self, post_id: str, worker_id: Optional[str] = None) -> bool:
+        """Удаление запланированного поста (worker_id — как в reschedule_post)"""
+        with self._lock:
+            post = self._posts_by_id.get(post_id)
+            if post is not None and not self._lease_lost(post_id, worker_id):
+                self._commit("del_post", {"post_id": post_id})
+                self._leases.pop(post_id, None)
+                self._notify("posts", post["user_id"])
                 return True
-        
+
         return False
-    
+
     def get_user_scheduled_posts(self, user_id: int) -> List[dict]:
         """Получение запланированных постов пользователя"""
-        return [post for post in self.data["scheduled_posts"] 
-                if post["user_id"] == user_id]
+        with self._lock:
+            return [
+                self._resolve_post(self._posts_by_id[post_id])
+                for _, post_id in self._user_posts.get(user_id, [])
+            ]
+
+    def get_scheduled_post(self, user_id: int, post_id: str) -> Optional[dict]:
+        """Запланированный пост пользователя по id; None — нет такого поста у пользователя"""
+        with self._lock:
+            post = self._posts_by_id.get(post_id)
+            if post is None or post["user_id"] != user_id:
+                return None
+            return self._resolve_post(post)
+
+    def get_user_scheduled_posts_page(self, user_id: int, offset: int, limit: int) -> Tuple[List[dict], bool]:
+        """Страница постов пользователя по времени отправки и признак следующей страницы"""
+        with self._lock:
+            user_posts = self._user_posts.get(user_id, [])
+            page = user_posts[offset:offset + limit]
+            posts = [self._resolve_post(self._posts_by_id[post_id]) for _, post_id in page]
+            return posts, offset + limit < len(user_posts)
+
+    def count_scheduled_posts(self) -> int:
+        """Число запланированных постов"""
+        with self._lock:
+            return len(self._posts_by_id)
+
+    def get_all_posts(self) -> List[dict]:
+        """Все посты в публичном виде (для переноса в другое хранилище)"""
+        with self._lock:
+            return [self._resolve_post(post) for post in self._posts_by_id.values()]
+
+    # --- Очередь повторной отправки ---
+
+    def add_deliveries(self, deliveries: List[dict]) -> List[str]:
+        """Постановка доставок в очередь повторов одной записью; возвращает их id.
+
+        Доставка — словарь с user_id, channel_id, title, message, media,
+        attempts (сделано попыток), next_attempt (epoch) и last_error.
+        """
+        with self._lock:
+            created_at = datetime.now().isoformat()
+            stored = [dict(delivery, id=uuid.uuid4().hex, created_at=created_at) for delivery in deliveries]
+            if stored:
+                self._commit("add_deliveries", {"deliveries": stored})
+            return [delivery["id"] for delivery in stored]
+
+    def claim_due_deliveries(self, worker_id: str, lease_seconds: float, limit: Optional[int] = None) -> List[dict]:
+        """Аренда доставок, время повтора которых наступило (см. claim_due_posts).
+
+        Арендованная доставка возвращается в кучу со временем окончания
+        аренды, поэтому выборка не проходит по доставкам в работе.
+        """
+        now_ts = time.time()
+        claimed = []
+        with self._lock:
+            heap = self._delivery_heap
+            while heap and heap[0][0] <= now_ts and (limit is None or len(claimed) < limit):
+                ts, delivery_id = heapq.heappop(heap)
+                if self._delivery_ready_ts.get(delivery_id) != ts:
+                    continue
+
+                lease_until = now_ts + lease_seconds
+                self._delivery_leases[delivery_id] = (worker_id, lease_until)
+                self._delivery_ready_ts[delivery_id] = lease_until
+                heapq.heappush(heap, (lease_until, delivery_id))
+                claimed.append(dict(self.data["outbox"][delivery_id]))
+            return claimed
+
+    def next_delivery_time(self) -> Optional[float]:
+        """Время (epoch), когда ближайшую доставку можно будет взять в аренду"""
+        with self._lock:
+            heap = self._delivery_heap
+            while heap and self._delivery_ready_ts.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    def _delivery_lease_lost(self, delivery_id: str, worker_id: Optional[str]) -> bool:
+        """Аренда доставки перешла к другому обработчику (worker_id None — без проверки)"""
+        if worker_id is None:
+            return False
+        lease = self._delivery_leases.get(delivery_id)
+        return lease is None or lease[0] != worker_id
+
+    def retry_delivery(self, delivery_id: str, next_attempt: float, error: str,
+                       worker_id: Optional[str] = None) -> bool:
+        """Учёт неудачной попытки и перенос повтора на next_attempt (epoch).
+
+        С worker_id изменение применяется, только если доставка всё ещё
+        арендована этим обработчиком (так же в fail_delivery и remove_delivery).
+        """
+        with self._lock:
+            if delivery_id not in self.data["outbox"] or self._delivery_lease_lost(delivery_id, worker_id):
+                return False
+
+            self._commit("retry_delivery", {"delivery_id": delivery_id, "next_attempt": next_attempt, "error": error})
+            self._delivery_leases.pop(delivery_id, None)
+            return True
+
+    def fail_delivery(self, delivery_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        """Перенос доставки в недоставленные: повторов больше не будет"""
+        with self._lock:
+            if delivery_id not in self.data["outbox"] or self._delivery_lease_lost(delivery_id, worker_id):
+                return False
+
+            self._commit("fail_delivery", {
+                "delivery_id": delivery_id,
+                "error": error,
+                "failed_at": datetime.now().isoformat()
+            })
+            self._delivery_leases.pop(delivery_id, None)
+            return True
+
+    def remove_delivery(self, delivery_id: str, worker_id: Optional[str] = None) -> bool:
+        """Удаление доставки из очереди после успешной отправки"""
+        with self._lock:
+            if delivery_id not in self.data["outbox"] or self._delivery_lease_lost(delivery_id, worker_id):
+                return False
+
+            self._commit("del_delivery", {"delivery_id": delivery_id})
+            self._delivery_leases.pop(delivery_id, None)
+            return True
+
+    def purge_dead_deliveries(self, failed_before: datetime) -> int:
+        """Удаление недоставленных доставок, перенесённых в недоставленные до failed_before"""
+        cutoff = failed_before.isoformat()
+        with self._lock:
+            expired = [
+                delivery_id for delivery_id in self._dead_deliveries
+                if self.data["outbox"][delivery_id]["failed_at"] < cutoff
+            ]
+            if expired:
+                self._commit("del_deliveries", {"delivery_ids": expired})
+            return len(expired)
+
+    def get_dead_deliveries(self, user_id: Optional[int] = None) -> List[dict]:
+        """Недоставленные доставки (всех пользователей или одного)"""
+        with self._lock:
+            dead = (self.data["outbox"][delivery_id] for delivery_id in self._dead_deliveries)
+            return sorted(
+                (dict(delivery) for delivery in dead if user_id is None or delivery["user_id"] == user_id),
+                key=lambda delivery: delivery["failed_at"]
+            )
+
+    def count_deliveries(self, dead: bool = False) -> int:
+        """Число доставок, ожидающих повтора, или недоставленных (dead=True)"""
+        with self._lock:
+            return len(self._dead_deliveries) if dead else len(self._delivery_ready_ts)
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над потокобезопасным хранилищем.
+
+    Обращения к Database или SQLiteDatabase выполняются в пуле потоков,
+    чтобы запись на диск не блокировала цикл событий.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.shared = database.shared
+
+    def add_listener(self, callback: Callable[[str, int], None]):
+        """Подписка на изменения (callback вызывается из рабочего потока)"""
+        self.database.add_listener(callback)
+
+    async def add_user_channel(self, user_id: int, channel_id: str, channel_title: str) -> bool:
+        return await asyncio.to_thread(self.database.add_user_channel, user_id, channel_id, channel_title)
+
+    async def remove_user_channel(self, user_id: int, channel_id: str) -> bool:
+        return await asyncio.to_thread(self.database.remove_user_channel, user_id, channel_id)
+
+    async def get_user_channels(self, user_id: int) -> Dict[str, dict]:
+        return await asyncio.to_thread(self.database.get_user_channels, user_id)
+
+    async def get_user_channels_page(self, user_id: int, offset: int, limit: int) -> Tuple[Dict[str, dict], bool]:
+        return await asyncio.to_thread(self.database.get_user_channels_page, user_id, offset, limit)
+
+    async def get_channel_ids(self) -> List[str]:
+        return await asyncio.to_thread(self.database.get_channel_ids)
+
+    async def set_channel_status(self, channel_id: str, status: str, error: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.database.set_channel_status, channel_id, status, error)
+
+    async def get_channel_status(self, channel_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self.database.get_channel_status, channel_id)
+
+    async def get_dead_channels(self, channel_ids: Iterable[str]) -> Set[str]:
+        return await asyncio.to_thread(self.database.get_dead_channels, list(channel_ids))
+
+    async def add_scheduled_post(self, user_id: int, message: str,
+                                 schedule_time: datetime, channels: List[str],
+                                 recurrence: Optional[str] = None,
+                                 media: Optional[List[dict]] = None) -> str:
+        return await asyncio.to_thread(
+            self.database.add_scheduled_post, user_id, message, schedule_time, channels, recurrence, media
+        )
+
+    async def add_scheduled_posts(self, user_id: int, posts: List[ImportedPost]) -> List[str]:
+        return await asyncio.to_thread(self.database.add_scheduled_posts, user_id, posts)
+
+    async def get_due_posts(self) -> List[dict]:
+        return await asyncio.to_thread(self.database.get_due_posts)
+
+    async def claim_due_posts(self, worker_id: str, lease_seconds: float, limit: Optional[int] = None) -> List[dict]:
+        return await asyncio.to_thread(self.database.claim_due_posts, worker_id, lease_seconds, limit)
+
+    async def next_due_time(self) -> Optional[float]:
+        return await asyncio.to_thread(self.database.next_due_time)
+
+    async def reschedule_post(self, post_id: str, schedule_time: datetime, worker_id: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.database.reschedule_post, post_id, schedule_time, worker_id)
+
+    async def set_post_media(self, post_id: str, media: List[dict]) -> bool:
+        return await asyncio.to_thread(self.database.set_post_media, post_id, media)
+
+    async def remove_scheduled_post(self, post_id: str, worker_id: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.database.remove_scheduled_post, post_id, worker_id)
+
+    async def count_scheduled_posts(self) -> int:
+        return await asyncio.to_thread(self.database.count_scheduled_posts)
+
+    async def get_user_scheduled_posts(self, user_id: int) -> List[dict]:
+        return await asyncio.to_thread(self.database.get_user_scheduled_posts, user_id)
+
+    async def get_scheduled_post(self, user_id: int, post_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.database.get_scheduled_post, user_id, post_id)
+
+    async def get_user_scheduled_posts_page(self, user_id: int, offset: int, limit: int) -> Tuple[List[dict], bool]:
+        return await asyncio.to_thread(self.database.get_user_scheduled_posts_page, user_id, offset, limit)
+
+    async def add_deliveries(self, deliveries: List[dict]) -> List[str]:
+        return await asyncio.to_thread(self.database.add_deliveries, deliveries)
+
+    async def claim_due_deliveries(self, worker_id: str, lease_seconds: float,
+                                   limit: Optional[int] = None) -> List[dict]:
+        return await asyncio.to_thread(self.database.claim_due_deliveries, worker_id, lease_seconds, limit)
+
+    async def next_delivery_time(self) -> Optional[float]:
+        return await asyncio.to_thread(self.database.next_delivery_time)
+
+    async def retry_delivery(self, delivery_id: str, next_attempt: float, error: str,
+                             worker_id: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.database.retry_delivery, delivery_id, next_attempt, error, worker_id)
+
+    async def fail_delivery(self, delivery_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.database.fail_delivery, delivery_id, error, worker_id)
+
+    async def remove_delivery(self, delivery_id: str, worker_id: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self.database.remove_delivery, delivery_id, worker_id)
+
+    async def purge_dead_deliveries(self, failed_before: datetime) -> int:
+        return await asyncio.to_thread(self.database.purge_dead_deliveries, failed_before)
+
+    async def get_dead_deliveries(self, user_id: Optional[int] = None) -> List[dict]:
+        return await asyncio.to_thread(self.database.get_dead_deliveries, user_id)
+
+    async def count_deliveries(self, dead: bool = False) -> int:
+        return await asyncio.to_thread(self.database.count_deliveries, dead)
+
+
+def create_database():
+    """Создание хранилища согласно DATABASE_STORAGE"""
+    if DATABASE_STORAGE == "sqlite":
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(SQLITE_DATABASE_FILE, json_filename=DATABASE_FILE)
+
+    return Database(DATABASE_FILE, DATABASE_STORAGE)
@@ -0,0 +1,109 @@
+"""
+Распределение обновлений по рабочим потокам с сохранением порядка
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional
+
+from telebot.types import Update
+
+from config import UPDATE_WORKERS, UPDATE_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+def update_user_id(update: Update) -> Optional[int]:
+    """id пользователя, от которого пришло обновление"""
+    for field in ("message", "edited_message", "callback_query", "my_chat_member",
+                  "chat_member", "inline_query", "chosen_inline_result", "chat_join_request"):
+        event = getattr(update, field, None)
+        if event is not None:
+            from_user = getattr(event, "from_user", None)
+            if from_user is not None:
+                return from_user.id
+            chat = getattr(event, "chat", None)
+            if chat is not None:
+                return chat.id
+    return None
+
+class UpdateDispatcher:
+    """Пул рабочих потоков, разбитый на шарды по from_user.id.
+
+    Обновления одного пользователя всегда попадают в один шард и
+    обрабатываются строго по очереди, поэтому машина состояний
+    BotHandlers не ломается, а разные пользователи обслуживаются
+    параллельно. Когда очередь шарда заполнена, submit() ждёт
+    свободного места — так медленная обработка притормаживает приём.
+    """
+
+    def __init__(self, handle: Callable[[Update], None],
+                 workers: int = UPDATE_WORKERS,
+                 queue_size: int = UPDATE_QUEUE_SIZE):
+        self.handle = handle
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Запуск рабочих потоков"""
+        for index, shard_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._worker,
+                args=(shard_queue,),
+                name=f"update-worker-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Диспетчер обновлений запущен: потоков {len(self._queues)}")
+
+    def stop(self):
+        """Остановка рабочих потоков после обработки уже принятых обновлений"""
+        for shard_queue in self._queues:
+            shard_queue.put(None)
+        self._threads.clear()
+
+    def shard_for(self, update: Update) -> int:
+        """Номер шарда для обновления"""
+        return self._shard(update_user_id(update))
+
+    def _shard(self, user_id: Optional[int]) -> int:
+        return (user_id or 0) % len(self._queues)
+
+    def submit(self, update: Update, timeout: Optional[float] = None):
+        """Постановка обновления в очередь шарда.
+
+        Блокируется, пока в очереди нет места; при истечении timeout
+        бросает queue.Full.
+        """
+        self._queues[self.shard_for(update)].put(update, timeout=timeout)
+
+    def submit_call(self, user_id: int, func: Callable[[], object]):
+        """Выполнение func в шарде пользователя, по очереди с его обновлениями.
+
+        Нужно для работы, запущенной не обновлением, а таймером — например,
+        сборки альбома: иначе она шла бы параллельно с обработкой следующих
+        сообщений того же пользователя.
+        """
+        self._queues[self._shard(user_id)].put(func)
+
+    def queue_depths(self) -> List[int]:
+        """Текущая глубина очереди каждого шарда"""
+        return [shard_queue.qsize() for shard_queue in self._queues]
+
+    def _worker(self, shard_queue: queue.Queue):
+        """Последовательная обработка обновлений шарда"""
+        while True:
+            update = shard_queue.get()
+            if update is None:
+                break
+            if callable(update):
+                try:
+                    update()
+                except Exception as e:
+                    logger.error(f"Ошибка в задаче шарда: {e}")
+                continue
+            try:
+                self.handle(update)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
@@ -2,45 +2,97 @@
 Обработчики команд и сообщений бота
 """
 
+import io
 import logging
+import threading
 from datetime import datetime
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import telebot
 
+from broadcaster import Broadcaster, BroadcastResult
+from bulk_import import ImportResult, InvalidImportFile, parse_posts
+from chat_cache import ChatCache
 from database import Database
-from keyboards import Keyboards
-from config import MESSAGES, TIME_FORMATS
+from keyboards import KeyboardCache, Keyboards
+from media import MediaGroupCollector, MediaPublisher, extract_media, validate_media
+from outbox import Outbox
+from profiling import Profiler, ProfileCapture, StorageProbe
+from rate_limiter import REQUEST_ERRORS
+from recurrence import Recurrence, is_rule, parse_rule
+from router import CallbackRouter
+from state_store import UserState, UserStateStore
+from config import (
+    ADMIN_IDS, IMPORT_MAX_FILE_SIZE, MESSAGES, PAGE_SIZE, PROFILE_DEFAULT_SECONDS,
+    PROFILE_MAX_SECONDS, TIME_FORMATS
+)
 
 logger = logging.getLogger(__name__)
 
 class BotHandlers:
-    def __init__(self, bot):
+    def __init__(self, bot, database: Database, broadcaster: Broadcaster, chat_cache: ChatCache, outbox: Outbox):
         self.bot = bot
-        self.database = Database()
+        # Замеры обработчиков; обращения к базе учитываются как время хранилища
+        self.profiler = Profiler()
+        self.database = StorageProbe(database)
+        self.broadcaster = broadcaster
+        self.chat_cache = chat_cache
+        self.publisher = MediaPublisher(bot, broadcaster)
+        # Каналы с временной ошибкой досылает очередь повторов, не задерживая ответ
+        self.outbox = outbox
+        # Собранный альбом обрабатывается в шарде пользователя и внутри замера
+        self.media_groups = MediaGroupCollector(submit=self._submit_for_user)
+        self._handle_media_group = self.profiler.wrap("handle_media_group", self._handle_media_messages)
         self.keyboards = Keyboards()
+        # Клавиатуры пользователей сбрасываются при изменении их данных в базе
+        self.keyboard_cache = KeyboardCache(database)
+        self.router = self._register_routes()
         
-        # Состояния пользователей
-        self.user_states: Dict[int, Dict[str, Any]] = {}
+        # Состояния пользователей посреди диалога
+        self.user_states = UserStateStore()
     
-    def get_user_state(self, user_id: int) -> Dict[str, Any]:
-        """Получение состояния пользователя"""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {"state": None, "data": {}}
-        return self.user_states[user_id]
+    def _submit_for_user(self, user_id: int, func: Callable[[], object]):
+        """Выполнение работы по таймеру по очереди с обновлениями пользователя"""
+        dispatcher = getattr(self.bot, "dispatcher", None)
+        if dispatcher is None:
+            func()
+        else:
+            dispatcher.submit_call(user_id, func)
+
+    def _register_routes(self) -> CallbackRouter:
+        """Таблица маршрутов инлайн-кнопок"""
+        router = CallbackRouter(self.profiler)
+        router.route("post_now", self._handle_post_now)
+        router.route("schedule_post", self._handle_schedule_post)
+        router.route("add_channel", self._handle_add_channel)
+        router.route("remove_channel", self._handle_remove_channel)
+        router.route("list_channels", self._handle_list_channels)
+        router.route("scheduled_posts", self._handle_scheduled_posts)
+        router.route("import_posts", self._handle_import_posts)
+        router.route("back_to_main", self._handle_back_to_main)
+        router.route("cancel", self._handle_cancel)
+        router.prefix("remove_ch", self._handle_confirm_remove_channel)
+        router.prefix("scheduled_detail", self._handle_scheduled_detail)
+        router.prefix("delete_scheduled", self._handle_delete_scheduled)
+        router.prefix("remove_page", self._handle_remove_channel, int)
+        router.prefix("channels_page", self._handle_list_channels, int)
+        router.prefix("scheduled_page", self._handle_scheduled_posts, int)
+        # Кнопки из сообщений, отправленных до перехода на "route:arg"
+        router.legacy_prefix("remove_ch_", "remove_ch")
+        router.legacy_prefix("scheduled_detail_", "scheduled_detail")
+        router.legacy_prefix("delete_scheduled_", "delete_scheduled")
+        return router
+    
+    def get_user_state(self, user_id: int) -> Optional[UserState]:
+        """Получение состояния пользователя (None — не в диалоге)"""
+        return self.user_states.get(user_id)
     
     def set_user_state(self, user_id: int, state: str, data: Dict[str, Any] = None):
         """Установка состояния пользователя"""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {"state": None, "data": {}}
-        
-        self.user_states[user_id]["state"] = state
-        if data:
-            self.user_states[user_id]["data"].update(data)
+        self.user_states.set(user_id, state, data)
     
     def clear_user_state(self, user_id: int):
         """Очистка состояния пользователя"""
-        if user_id in self.user_states:
-            self.user_states[user_id] = {"state": None, "data": {}}
+        self.user_states.clear(user_id)
     
     def start_command(self, message):
         """Обработчик команды /start"""
@@ -94,6 +146,21 @@ class BotHandlers:
             reply_markup=markup
         )
     
+    def import_command(self, message):
+        """Обработчик команды /import"""
+        user_id = message.from_user.id
+        
+        if not self.database.get_user_channels(user_id):
+            self.bot.send_message(message.chat.id, MESSAGES["no_channels"])
+            return
+        
+        self.set_user_state(user_id, "waiting_import_file")
+        self.bot.send_message(
+            message.chat.id,
+            MESSAGES["enter_import_file"],
+            reply_markup=self.keyboards.cancel_keyboard()
+        )
+    
     def manage_command(self, message):
         """Обработчик команды /manage"""
         self.bot.send_message(
@@ -102,6 +169,63 @@ class BotHandlers:
             reply_markup=self.keyboards.main_menu()
         )
     
+    @staticmethod
+    def _parse_profile_seconds(text: str) -> Optional[int]:
+        """Длительность из "/profile [секунд]"; None — некорректное значение"""
+        parts = (text or "").split()
+        if len(parts) < 2:
+            return PROFILE_DEFAULT_SECONDS
+        try:
+            seconds = int(parts[1])
+        except ValueError:
+            return None
+        return seconds if 0 < seconds <= PROFILE_MAX_SECONDS else None
+
+    def _start_profile(self, message, whole_thread: bool = False) -> Tuple[str, Optional[ProfileCapture]]:
+        """Запуск снятия профиля: ответ пользователю и профиль (None — не запущен)"""
+        if message.from_user.id not in ADMIN_IDS:
+            return MESSAGES["admin_only"], None
+
+        seconds = self._parse_profile_seconds(message.text)
+        if seconds is None:
+            return MESSAGES["profile_usage"].format(max=PROFILE_MAX_SECONDS), None
+
+        capture = self.profiler.start_capture(seconds, whole_thread)
+        if capture is None:
+            return MESSAGES["profile_busy"], None
+        return MESSAGES["profile_started"].format(seconds=seconds), capture
+
+    @staticmethod
+    def _profile_document(capture: ProfileCapture) -> Tuple[io.BytesIO, str, str]:
+        """Файл отчёта, его имя и подпись"""
+        document = io.BytesIO(capture.report().encode("utf-8"))
+        filename = f"profile-{capture.started_at:%Y%m%d-%H%M%S}.txt"
+        caption = MESSAGES["profile_done"].format(seconds=capture.seconds, updates=capture.updates)
+        return document, filename, caption
+
+    def profile_command(self, message):
+        """Обработчик команды /profile: профиль следующих N секунд (для администраторов)"""
+        reply, capture = self._start_profile(message)
+        self.bot.send_message(message.chat.id, reply)
+        if capture is None:
+            return
+
+        timer = threading.Timer(capture.seconds, self._send_profile_report, args=(message.chat.id,))
+        timer.daemon = True
+        timer.start()
+
+    def _send_profile_report(self, chat_id: int):
+        """Отправка отчёта о снятом профиле файлом"""
+        capture = self.profiler.finish_capture()
+        if capture is None:
+            return
+
+        document, filename, caption = self._profile_document(capture)
+        try:
+            self.bot.send_document(chat_id, document, visible_file_name=filename, caption=caption)
+        except Exception as e:
+            logger.error(f"Не удалось отправить профиль пользователю {chat_id}: {e}")
+    
     def handle_message(self, message):
         """Обработчик текстовых сообщений"""
         user_id = message.from_user.id
@@ -118,7 +242,7 @@ class BotHandlers:
             )
             return
         
-        state = user_state.get("state")
+        state = user_state.state if user_state else None
         
         if state == "waiting_post_message":
             self._handle_post_message(message, message_text)
@@ -129,105 +253,234 @@ class BotHandlers:
         elif state == "waiting_channel_id":
             self._handle_channel_id(message, message_text)
     
-    def _handle_post_message(self, message_obj, message: str):
+    def handle_media(self, message):
+        """Обработчик фото, видео и альбомов в диалогах отправки и планирования"""
+        user_state = self.get_user_state(message.from_user.id)
+        if not user_state or user_state.state not in ("waiting_post_message", "waiting_schedule_message"):
+            return
+        
+        # Части альбома приходят отдельными сообщениями, собираем их вместе
+        if message.media_group_id:
+            self.media_groups.add(message, self._handle_media_group)
+        else:
+            self._handle_media_messages([message])
+    
+    def _handle_media_messages(self, messages: list):
+        """Пост из одного сообщения с вложением или из альбома"""
+        message_obj = messages[0]
+        user_state = self.get_user_state(message_obj.from_user.id)
+        state = user_state.state if user_state else None
+        
+        media = [item for item in map(extract_media, messages) if item]
+        caption = next((m.caption for m in messages if m.caption), "")
+        error = validate_media(media, caption)
+        if error:
+            self.bot.send_message(message_obj.chat.id, f"❌ {error}")
+            return
+        
+        if state == "waiting_post_message":
+            self._handle_post_message(message_obj, caption, media)
+        elif state == "waiting_schedule_message":
+            self._handle_schedule_message(message_obj, caption, media)
+    
+    def _handle_post_message(self, message_obj, message: str, media: Optional[List[dict]] = None):
         """Обработка сообщения для немедленной отправки"""
         user_id = message_obj.from_user.id
         channels = self.database.get_user_channels(user_id)
         
         self.clear_user_state(user_id)
         
-        # Отправляем сообщение во все каналы
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for channel_id, channel_info in channels.items():
-            try:
-                self.bot.send_message(
-                    chat_id=channel_id,
-                    text=message,
-                    parse_mode='HTML'
-                )
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                errors.append(MESSAGES["posting_error"].format(
-                    title=channel_info['title'], 
-                    error=str(e)
-                ))
-        
-        # Результат отправки
-        result_message = f"📊 Результаты отправки:\n\n"
-        result_message += f"✅ Успешно отправлено: {success_count}\n"
-        result_message += f"❌ Ошибок: {error_count}\n"
-        
-        if errors:
-            result_message += f"\nОшибки:\n" + "\n".join(errors[:3])
+        # Отправляем сообщение во все каналы параллельно
+        # Каналы, где бот больше не может публиковать, пропускаем
+        result, _ = self.publisher.publish(
+            {channel_id: channel_info['title'] for channel_id, channel_info in channels.items()},
+            message,
+            media,
+            dead=self.database.get_dead_channels(channels)
+        )
+        self.outbox.defer(result, user_id, message, media)
         
         self.bot.send_message(
             message_obj.chat.id,
-            result_message,
+            self._format_post_result(result),
             reply_markup=self.keyboards.main_menu(),
             parse_mode='HTML'
         )
     
-    def _handle_schedule_message(self, message_obj, message: str):
+    @staticmethod
+    def _format_post_result(result: BroadcastResult) -> str:
+        """Текст с результатами немедленной отправки"""
+        errors = [
+            MESSAGES["posting_error"].format(title=title, error=error)
+            for _, title, error in result.errors
+        ]
+        
+        result_message = f"📊 Результаты отправки:\n\n"
+        result_message += f"✅ Успешно отправлено: {result.success_count}\n"
+        result_message += f"❌ Ошибок: {result.error_count}\n"
+        if result.skipped:
+            result_message += f"⛔ Пропущено недоступных: {len(result.skipped)}\n"
+        if result.deferred:
+            result_message += f"⏳ Отправка повторится позже: {len(result.deferred)}\n"
+        
+        if errors:
+            result_message += f"\nОшибки:\n" + "\n".join(errors[:3])
+        
+        if result.skipped:
+            result_message += "\nБот не может публиковать в:\n" + "\n".join(
+                f"⛔ {title}" for _, title in result.skipped[:3]
+            )
+        
+        return result_message
+    
+    def _handle_schedule_message(self, message_obj, message: str, media: Optional[List[dict]] = None):
         """Обработка сообщения для планирования"""
         user_id = message_obj.from_user.id
         
-        self.set_user_state(user_id, "waiting_schedule_time", {"message": message})
+        # В посте хранятся только file_id вложений, сами файлы остаются в Telegram
+        self.set_user_state(user_id, "waiting_schedule_time", {"message": message, "media": media})
         self.bot.send_message(message_obj.chat.id, MESSAGES["enter_schedule_time"])
     
     def _handle_schedule_time(self, message_obj, time_str: str):
         """Обработка времени для планирования"""
         user_id = message_obj.from_user.id
         user_state = self.get_user_state(user_id)
-        message = user_state["data"]["message"]
+        message = user_state.data["message"]
         
-        # Парсинг времени
-        schedule_time = None
-        for time_format in TIME_FORMATS:
+        # Парсинг времени или правила повторения
+        schedule_time, rule, error = self._parse_schedule_input(time_str)
+        
+        if error:
+            self.bot.send_message(message_obj.chat.id, error)
+            return
+        
+        # Добавляем в планировщик
+        channels = list(self.database.get_user_channels(user_id).keys())
+        post_id = self.database.add_scheduled_post(
+            user_id, message, schedule_time, channels, rule.text if rule else None,
+            user_state.data.get("media")
+        )
+        
+        self.clear_user_state(user_id)
+        
+        self.bot.send_message(
+            message_obj.chat.id,
+            self._format_scheduled_confirmation(schedule_time, rule),
+            reply_markup=self.keyboards.main_menu()
+        )
+    
+    @classmethod
+    def _parse_schedule_input(cls, time_str: str) -> Tuple[Optional[datetime], Optional[Recurrence], Optional[str]]:
+        """Время первой отправки и правило повторения; третий элемент — текст ошибки"""
+        if is_rule(time_str):
             try:
-                schedule_time = datetime.strptime(time_str.strip(), time_format)
-                break
-            except ValueError:
-                continue
+                rule = parse_rule(time_str)
+                return rule.next_after(datetime.now()), rule, None
+            except ValueError as e:
+                return None, None, MESSAGES["invalid_rule"].format(error=e)
         
+        schedule_time = cls._parse_schedule_time(time_str)
         if not schedule_time:
-            self.bot.send_message(message_obj.chat.id, MESSAGES["invalid_time"])
-            return
+            return None, None, MESSAGES["invalid_time"]
         
         # Проверка, что время в будущем
         if schedule_time <= datetime.now():
-            self.bot.send_message(message_obj.chat.id, MESSAGES["time_in_past"])
+            return None, None, MESSAGES["time_in_past"]
+        
+        return schedule_time, None, None
+    
+    @staticmethod
+    def _format_scheduled_confirmation(schedule_time: datetime, rule: Optional[Recurrence]) -> str:
+        """Подтверждение планирования поста"""
+        time_str_formatted = schedule_time.strftime("%d.%m.%Y %H:%M")
+        if rule:
+            return MESSAGES["message_recurring"].format(rule=rule.describe(), time=time_str_formatted)
+        return MESSAGES["message_scheduled"].format(time=time_str_formatted)
+    
+    def handle_document(self, message):
+        """Обработчик файлов: импорт постов"""
+        user_id = message.from_user.id
+        user_state = self.get_user_state(user_id)
+        
+        if user_state and user_state.state in ("waiting_post_message", "waiting_schedule_message"):
+            self.handle_media(message)
             return
         
-        # Добавляем в планировщик
-        channels = list(self.database.get_user_channels(user_id).keys())
-        import asyncio
-        post_id = asyncio.run(self.database.add_scheduled_post(
-            user_id, message, schedule_time, channels
-        ))
+        if not user_state or user_state.state != "waiting_import_file":
+            self.bot.send_message(message.chat.id, MESSAGES["import_hint"])
+            return
+        
+        document = message.document
+        if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+            self.bot.send_message(
+                message.chat.id,
+                MESSAGES["import_too_large"].format(size=IMPORT_MAX_FILE_SIZE // 1024)
+            )
+            return
+        
+        try:
+            file_info = self.bot.get_file(document.file_id)
+            data = self.bot.download_file(file_info.file_path)
+        except REQUEST_ERRORS as e:
+            # Пользователь остаётся в диалоге импорта и может прислать файл снова
+            logger.error(f"Ошибка при загрузке файла импорта от {user_id}: {e}")
+            self.bot.send_message(message.chat.id, MESSAGES["import_download_error"])
+            return
         
+        try:
+            result = parse_posts(
+                data, document.file_name, self.database.get_user_channels(user_id), self._parse_schedule_time
+            )
+        except (InvalidImportFile, UnicodeDecodeError) as e:
+            self.bot.send_message(message.chat.id, MESSAGES["import_error"].format(error=e))
+            return
+        
+        # Все принятые строки записываются одной операцией
+        self.database.add_scheduled_posts(user_id, result.accepted)
         self.clear_user_state(user_id)
         
-        time_str_formatted = schedule_time.strftime("%d.%m.%Y %H:%M")
         self.bot.send_message(
-            message_obj.chat.id,
-            MESSAGES["message_scheduled"].format(time=time_str_formatted),
+            message.chat.id,
+            self._format_import_result(result),
             reply_markup=self.keyboards.main_menu()
         )
     
+    @staticmethod
+    def _format_import_result(result: ImportResult) -> str:
+        """Итог импорта постов из файла"""
+        text = MESSAGES["import_done"].format(
+            accepted=len(result.accepted),
+            rejected=len(result.rejected)
+        )
+        if result.rejected:
+            text += "\n\nОтклонённые строки:\n" + "\n".join(
+                f"• строка {line_no}: {reason}" for line_no, reason in result.rejected[:10]
+            )
+            if len(result.rejected) > 10:
+                text += f"\n… и ещё {len(result.rejected) - 10}"
+        return text
+    
+    @staticmethod
+    def _parse_schedule_time(time_str: str) -> Optional[datetime]:
+        """Разбор времени в одном из TIME_FORMATS"""
+        for time_format in TIME_FORMATS:
+            try:
+                return datetime.strptime(time_str.strip(), time_format)
+            except ValueError:
+                continue
+        
+        return None
+    
     def _handle_channel_id(self, message_obj, channel_id: str):
         """Обработка ID канала/группы"""
         user_id = message_obj.from_user.id
         
         try:
             # Получаем информацию о чате
-            chat = self.bot.get_chat(channel_id)
+            chat = self.chat_cache.get_chat(channel_id)
             
             # Проверяем права бота
-            member = self.bot.get_chat_member(channel_id, self.bot.get_me().id)
+            member = self.chat_cache.get_bot_member(chat.id)
             if member.status not in ['administrator', 'creator']:
                 self.bot.send_message(
                     message_obj.chat.id,
@@ -236,10 +489,9 @@ class BotHandlers:
                 return
             
             # Добавляем канал
-            import asyncio
-            success = asyncio.run(self.database.add_user_channel(
+            success = self.database.add_user_channel(
                 user_id, channel_id, chat.title
-            ))
+            )
             
             if success:
                 self.bot.send_message(
@@ -267,34 +519,7 @@ class BotHandlers:
         """Обработчик callback запросов"""
         self.bot.answer_callback_query(call.id)
         
-        user_id = call.from_user.id
-        data = call.data
-        
-        if data == "post_now":
-            self._handle_post_now(call, user_id)
-        elif data == "schedule_post":
-            self._handle_schedule_post(call, user_id)
-        elif data == "add_channel":
-            self._handle_add_channel(call, user_id)
-        elif data == "remove_channel":
-            self._handle_remove_channel(call, user_id)
-        elif data == "list_channels":
-            self._handle_list_channels(call, user_id)
-        elif data == "scheduled_posts":
-            self._handle_scheduled_posts(call, user_id)
-        elif data.startswith("remove_ch_"):
-            channel_id = data[10:]
-            self._handle_confirm_remove_channel(call, user_id, channel_id)
-        elif data.startswith("scheduled_detail_"):
-            post_id = data[17:]
-            self._handle_scheduled_detail(call, user_id, post_id)
-        elif data.startswith("delete_scheduled_"):
-            post_id = data[17:]
-            self._handle_delete_scheduled(call, user_id, post_id)
-        elif data == "back_to_main":
-            self._handle_back_to_main(call)
-        elif data == "cancel":
-            self._handle_cancel(call, user_id)
+        self.router.dispatch(call.data, call, call.from_user.id)
     
     def _handle_post_now(self, call, user_id: int):
         """Обработка немедленной отправки"""
@@ -317,6 +542,25 @@ class BotHandlers:
             reply_markup=self.keyboards.cancel_keyboard()
         )
     
+    def _handle_import_posts(self, call, user_id: int):
+        """Импорт постов из файла"""
+        if not self.database.get_user_channels(user_id):
+            self.bot.edit_message_text(
+                MESSAGES["no_channels"],
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                reply_markup=self.keyboards.main_menu()
+            )
+            return
+        
+        self.set_user_state(user_id, "waiting_import_file")
+        self.bot.edit_message_text(
+            MESSAGES["enter_import_file"],
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=self.keyboards.cancel_keyboard()
+        )
+    
     def _handle_schedule_post(self, call, user_id: int):
         """Обработка планирования поста"""
         channels = self.database.get_user_channels(user_id)
@@ -348,11 +592,13 @@ class BotHandlers:
             reply_markup=self.keyboards.cancel_keyboard()
         )
     
-    def _handle_remove_channel(self, call, user_id: int):
+    def _handle_remove_channel(self, call, user_id: int, page: int = 0):
         """Удаление канала"""
-        channels = self.database.get_user_channels(user_id)
+        markup = self.keyboard_cache.get(
+            user_id, "channels", ("remove", page), lambda: self._build_channel_list(user_id, "remove", page)
+        )
         
-        if not channels:
+        if markup is None:
             self.bot.edit_message_text(
                 MESSAGES["no_channels"],
                 chat_id=call.message.chat.id,
@@ -365,33 +611,56 @@ class BotHandlers:
             "🗑 Выберите канал/группу для удаления:",
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
-            reply_markup=self.keyboards.channel_list(channels, "remove")
+            reply_markup=markup
         )
     
-    def _handle_list_channels(self, call, user_id: int):
+    def _build_channel_list(self, user_id: int, action: str, page: int) -> Optional[str]:
+        """Страница клавиатуры каналов пользователя (None — каналов нет)"""
+        channels, has_next = self.database.get_user_channels_page(user_id, page * PAGE_SIZE, PAGE_SIZE)
+        if not channels and page > 0:
+            # Страница опустела после удаления — показываем первую
+            return self._build_channel_list(user_id, action, 0)
+        return self.keyboards.channel_list(channels, action, page, has_next) if channels else None
+    
+    def _handle_list_channels(self, call, user_id: int, page: int = 0):
         """Список каналов"""
-        channels = self.database.get_user_channels(user_id)
-        
-        if not channels:
-            message = MESSAGES["no_channels"]
-        else:
-            message = "📋 Ваши каналы и группы:\n\n"
-            for channel_id, channel_info in channels.items():
-                message += f"📢 {channel_info['title']}\n"
-                message += f"   ID: {channel_id}\n\n"
+        channels, has_next = self.database.get_user_channels_page(user_id, page * PAGE_SIZE, PAGE_SIZE)
+        if not channels and page > 0:
+            page = 0
+            channels, has_next = self.database.get_user_channels_page(user_id, 0, PAGE_SIZE)
         
         self.bot.edit_message_text(
-            message,
+            self._format_channels_list(channels),
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
-            reply_markup=self.keyboards.main_menu()
+            reply_markup=self._channels_page_markup(page, has_next)
         )
     
-    def _handle_scheduled_posts(self, call, user_id: int):
+    def _channels_page_markup(self, page: int, has_next: bool) -> str:
+        """Клавиатура под списком каналов: меню или переход между страницами"""
+        if page == 0 and not has_next:
+            return self.keyboards.main_menu()
+        return self.keyboards.page_navigation("channels_page", page, has_next)
+    
+    @staticmethod
+    def _format_channels_list(channels: Dict[str, dict]) -> str:
+        """Текст со списком каналов пользователя"""
+        if not channels:
+            return MESSAGES["no_channels"]
+        
+        message = "📋 Ваши каналы и группы:\n\n"
+        for channel_id, channel_info in channels.items():
+            message += f"📢 {channel_info['title']}\n"
+            message += f"   ID: {channel_id}\n\n"
+        return message
+    
+    def _handle_scheduled_posts(self, call, user_id: int, page: int = 0):
         """Запланированные посты"""
-        posts = self.database.get_user_scheduled_posts(user_id)
+        markup = self.keyboard_cache.get(
+            user_id, "posts", ("list", page), lambda: self._build_scheduled_posts_list(user_id, page)
+        )
         
-        if not posts:
+        if markup is None:
             self.bot.edit_message_text(
                 MESSAGES["no_scheduled"],
                 chat_id=call.message.chat.id,
@@ -404,13 +673,20 @@ class BotHandlers:
             MESSAGES["scheduled_list"],
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
-            reply_markup=self.keyboards.scheduled_posts_list(posts)
+            reply_markup=markup
         )
     
+    def _build_scheduled_posts_list(self, user_id: int, page: int) -> Optional[str]:
+        """Страница клавиатуры запланированных постов (None — постов нет)"""
+        posts, has_next = self.database.get_user_scheduled_posts_page(user_id, page * PAGE_SIZE, PAGE_SIZE)
+        if not posts and page > 0:
+            # Страница опустела после отправки или удаления — показываем первую
+            return self._build_scheduled_posts_list(user_id, 0)
+        return self.keyboards.scheduled_posts_list(posts, page, has_next) if posts else None
+    
     def _handle_confirm_remove_channel(self, call, user_id: int, channel_id: str):
         """Подтверждение удаления канала"""
-        import asyncio
-        success = asyncio.run(self.database.remove_user_channel(user_id, channel_id))
+        success = self.database.remove_user_channel(user_id, channel_id)
         
         if success:
             self.bot.edit_message_text(
@@ -429,8 +705,7 @@ class BotHandlers:
     
     def _handle_scheduled_detail(self, call, user_id: int, post_id: str):
         """Детали запланированного поста"""
-        posts = self.database.get_user_scheduled_posts(user_id)
-        post = next((p for p in posts if p["id"] == post_id), None)
+        post = self.database.get_scheduled_post(user_id, post_id)
         
         if not post:
             self.bot.edit_message_text(
@@ -441,23 +716,30 @@ class BotHandlers:
             )
             return
         
-        schedule_time = datetime.fromisoformat(post["schedule_time"])
-        message = f"⏰ Запланированный пост:\n\n"
-        message += f"📅 Время: {schedule_time.strftime('%d.%m.%Y %H:%M')}\n"
-        message += f"📝 Сообщение: {post['message'][:100]}{'...' if len(post['message']) > 100 else ''}\n"
-        message += f"📢 Каналов: {len(post['channels'])}"
-        
         self.bot.edit_message_text(
-            message,
+            self._format_scheduled_detail(post),
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             reply_markup=self.keyboards.scheduled_post_detail(post_id)
         )
     
+    @staticmethod
+    def _format_scheduled_detail(post: dict) -> str:
+        """Текст с деталями запланированного поста"""
+        schedule_time = datetime.fromisoformat(post["schedule_time"])
+        message = f"⏰ Запланированный пост:\n\n"
+        message += f"📅 Время: {schedule_time.strftime('%d.%m.%Y %H:%M')}\n"
+        if post.get("recurrence"):
+            message += f"🔁 Повтор: {parse_rule(post['recurrence']).describe()}\n"
+        if post.get("media"):
+            message += f"🖼 Вложений: {len(post['media'])}\n"
+        message += f"📝 Сообщение: {post['message'][:100]}{'...' if len(post['message']) > 100 else ''}\n"
+        message += f"📢 Каналов: {len(post['channels'])}"
+        return message
+    
     def _handle_delete_scheduled(self, call, user_id: int, post_id: str):
         """Удаление запланированного поста"""
-        import asyncio
-        success = asyncio.run(self.database.remove_scheduled_post(post_id))
+        success = self.database.remove_scheduled_post(post_id)
         
         if success:
             self.bot.edit_message_text(
@@ -474,7 +756,7 @@ class BotHandlers:
                 reply_markup=self.keyboards.main_menu()
             )
     
-    def _handle_back_to_main(self, call):
+    def _handle_back_to_main(self, call, user_id: int):
         """Возврат в главное меню"""
         self.bot.edit_message_text(
             "🛠 Главное меню управления ботом:",
@@ -0,0 +1,229 @@
+"""
+Фоновая проверка доступности каналов
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+from telebot.types import ChatMemberUpdated
+
+from config import HEALTH_CHECK_INTERVAL, HEALTH_CHECK_BATCH_SIZE, HEALTH_CHECK_BATCH_PAUSE
+from rate_limiter import API_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Состояния канала
+HEALTHY = "healthy"    # бот — администратор и может публиковать
+DEGRADED = "degraded"  # бот в чате, но без нужных прав, или проверка не удалась
+DEAD = "dead"          # бот удалён из чата или чат не существует
+
+def member_health(member) -> str:
+    """Состояние канала по статусу бота в нём"""
+    status = member.status
+    if status == "creator":
+        return HEALTHY
+    if status == "administrator":
+        # В каналах публиковать может только администратор с can_post_messages
+        return DEGRADED if getattr(member, "can_post_messages", None) is False else HEALTHY
+    if status == "member":
+        return DEGRADED
+    if status == "restricted":
+        return DEGRADED if getattr(member, "can_send_messages", False) else DEAD
+    return DEAD
+
+def error_health(error: Exception) -> Optional[str]:
+    """Состояние канала по ошибке запроса; None — ошибка не связана с каналом"""
+    if not isinstance(error, API_ERRORS):
+        return None
+    # 400 — чат не найден, 403 — бот исключён из чата
+    if error.error_code in (400, 403):
+        return DEAD
+    if error.error_code == 429 or error.error_code >= 500:
+        return None
+    return DEGRADED
+
+class ChannelHealthChecker:
+    """Периодическая проверка всех добавленных каналов.
+
+    Раз в interval секунд обходит каналы пачками по batch_size с паузой
+    batch_pause между пачками, чтобы не отнимать лимиты у рассылки.
+    Смена состояния сохраняется в базе; рассылка пропускает каналы в
+    состоянии DEAD. Обновления my_chat_member применяются сразу.
+    """
+
+    def __init__(self, database, chat_cache,
+                 interval: float = HEALTH_CHECK_INTERVAL,
+                 batch_size: int = HEALTH_CHECK_BATCH_SIZE,
+                 batch_pause: float = HEALTH_CHECK_BATCH_PAUSE):
+        self.database = database
+        self.chat_cache = chat_cache
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.running = False
+        self.thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Запуск проверки в фоновом потоке"""
+        if self.running:
+            return
+
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name="channel-health", daemon=True)
+        self.thread.start()
+        logger.info("Проверка доступности каналов запущена")
+
+    def stop(self):
+        """Остановка проверки"""
+        self.running = False
+        self._stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        logger.info("Проверка доступности каналов остановлена")
+
+    def _loop(self):
+        """Основной цикл: полный обход, затем сон до следующего"""
+        # Первый обход откладываем, чтобы не мешать запуску бота
+        if self._stop_event.wait(self.batch_pause):
+            return
+
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка при проверке каналов: {e}")
+
+            if self._stop_event.wait(self.interval):
+                break
+
+    def run_once(self) -> Dict[str, int]:
+        """Один обход всех каналов; возвращает число каналов в каждом состоянии"""
+        channel_ids = self.database.get_channel_ids()
+        counts = {HEALTHY: 0, DEGRADED: 0, DEAD: 0}
+
+        for start in range(0, len(channel_ids), self.batch_size):
+            if start and self._stop_event.wait(self.batch_pause):
+                break
+            for channel_id in channel_ids[start:start + self.batch_size]:
+                status = self.check_channel(channel_id)
+                if status:
+                    counts[status] += 1
+
+        logger.info(
+            f"Проверено каналов: {sum(counts.values())} "
+            f"(доступны {counts[HEALTHY]}, с ограничениями {counts[DEGRADED]}, недоступны {counts[DEAD]})"
+        )
+        return counts
+
+    def check_channel(self, channel_id: str) -> Optional[str]:
+        """Проверка одного канала; None — результат неизвестен (сбой сети и т.п.)"""
+        # Статус берём свежий, заодно обновляя общий кэш
+        self.chat_cache.invalidate(channel_id)
+        try:
+            status, error = member_health(self.chat_cache.get_bot_member(channel_id)), None
+        except Exception as e:
+            status, error = error_health(e), str(e)
+            if status is None:
+                logger.warning(f"Не удалось проверить канал {channel_id}: {e}")
+                return None
+
+        self._save_status(channel_id, status, error)
+        return status
+
+    def _save_status(self, channel_id: str, status: str, error: Optional[str]):
+        if self.database.set_channel_status(channel_id, status, error):
+            logger.info(f"Состояние канала {channel_id}: {status}")
+
+    @staticmethod
+    def _update_channel_ids(update: ChatMemberUpdated):
+        """Ключи, под которыми чат из обновления может храниться в базе"""
+        channel_ids = [str(update.chat.id)]
+        if getattr(update.chat, "username", None):
+            channel_ids.append(f"@{update.chat.username}")
+        return channel_ids
+
+    def on_my_chat_member(self, update: ChatMemberUpdated):
+        """Изменение статуса бота в чате (обновление my_chat_member)"""
+        status = member_health(update.new_chat_member)
+        for channel_id in self._update_channel_ids(update):
+            self._save_status(channel_id, status, None)
+
+
+class AsyncChannelHealthChecker(ChannelHealthChecker):
+    """Проверка каналов для асинхронного режима: задача на общем цикле событий"""
+
+    def __init__(self, database, chat_cache, **kwargs):
+        super().__init__(database, chat_cache, **kwargs)
+        self._task = None
+
+    def start(self):
+        """Запуск проверки (вызывается внутри цикла событий)"""
+        if self.running:
+            return
+
+        self.running = True
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        logger.info("Проверка доступности каналов запущена")
+
+    def stop(self):
+        """Остановка проверки"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+        logger.info("Проверка доступности каналов остановлена")
+
+    async def _loop(self):
+        try:
+            await asyncio.sleep(self.batch_pause)
+            while self.running:
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"Ошибка при проверке каналов: {e}")
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            pass
+
+    async def run_once(self) -> Dict[str, int]:
+        channel_ids = await self.database.get_channel_ids()
+        counts = {HEALTHY: 0, DEGRADED: 0, DEAD: 0}
+
+        for start in range(0, len(channel_ids), self.batch_size):
+            if start:
+                await asyncio.sleep(self.batch_pause)
+            for channel_id in channel_ids[start:start + self.batch_size]:
+                status = await self.check_channel(channel_id)
+                if status:
+                    counts[status] += 1
+
+        logger.info(
+            f"Проверено каналов: {sum(counts.values())} "
+            f"(доступны {counts[HEALTHY]}, с ограничениями {counts[DEGRADED]}, недоступны {counts[DEAD]})"
+        )
+        return counts
+
+    async def check_channel(self, channel_id: str) -> Optional[str]:
+        self.chat_cache.invalidate(channel_id)
+        try:
+            status, error = member_health(await self.chat_cache.get_bot_member(channel_id)), None
+        except Exception as e:
+            status, error = error_health(e), str(e)
+            if status is None:
+                logger.warning(f"Не удалось проверить канал {channel_id}: {e}")
+                return None
+
+        await self._save_status(channel_id, status, error)
+        return status
+
+    async def _save_status(self, channel_id: str, status: str, error: Optional[str]):
+        if await self.database.set_channel_status(channel_id, status, error):
+            logger.info(f"Состояние канала {channel_id}: {status}")
+
+    async def on_my_chat_member(self, update: ChatMemberUpdated):
+        status = member_health(update.new_chat_member)
+        for channel_id in self._update_channel_ids(update):
+            await self._save_status(channel_id, status, None)
@@ -2,40 +2,75 @@
 Клавиатуры для бота
 """
 
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from typing import Dict, List
-from config import BUTTONS
+from typing import Any, Callable, Dict, List, Tuple
+from config import BUTTONS, KEYBOARD_CACHE_USERS
+from router import callback_data as callback_data_for
+
+# Клавиатуры отдаются уже сериализованными в JSON: telebot передаёт строку
+# reply_markup в запрос как есть и не сериализует её заново
+Markup = str
 
 class Keyboards:
     @staticmethod
-    def main_menu() -> InlineKeyboardMarkup:
-        """Главное меню с основными функциями"""
+    @lru_cache(maxsize=None)
+    def main_menu() -> Markup:
+        """Главное меню с основными функциями (собирается один раз)"""
         keyboard = [
             [InlineKeyboardButton("📤 Отправить сообщение сейчас", callback_data="post_now")],
             [InlineKeyboardButton("⏰ Запланировать сообщение", callback_data="schedule_post")],
             [InlineKeyboardButton("➕ Добавить канал/группу", callback_data="add_channel")],
             [InlineKeyboardButton("📋 Мои каналы и группы", callback_data="list_channels")],
             [InlineKeyboardButton("⏱️ Запланированные посты", callback_data="scheduled_posts")],
+            [InlineKeyboardButton("📥 Импорт постов из файла", callback_data="import_posts")],
             [InlineKeyboardButton("🗑 Удалить канал/группу", callback_data="remove_channel")]
         ]
-        return InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard).to_json()
+    
+    @staticmethod
+    def _page_row(route: str, page: int, has_next: bool) -> List[InlineKeyboardButton]:
+        """Кнопки перехода на соседние страницы списка"""
+        row = []
+        if page > 0:
+            row.append(InlineKeyboardButton(BUTTONS["prev_page"], callback_data=callback_data_for(route, page - 1)))
+        if has_next:
+            row.append(InlineKeyboardButton(BUTTONS["next_page"], callback_data=callback_data_for(route, page + 1)))
+        return row
     
     @staticmethod
-    def channel_list(channels: Dict[str, dict], action: str = "remove") -> InlineKeyboardMarkup:
-        """Список каналов для выбора"""
+    @lru_cache(maxsize=256)
+    def page_navigation(route: str, page: int, has_next: bool) -> Markup:
+        """Переход между страницами и возврат в меню"""
+        keyboard = []
+        row = Keyboards._page_row(route, page, has_next)
+        if row:
+            keyboard.append(row)
+        keyboard.append([InlineKeyboardButton(BUTTONS["back"], callback_data="back_to_main")])
+        return InlineKeyboardMarkup(keyboard).to_json()
+    
+    @staticmethod
+    def channel_list(channels: Dict[str, dict], action: str = "remove",
+                     page: int = 0, has_next: bool = False) -> Markup:
+        """Страница списка каналов для выбора"""
         keyboard = []
         
         for channel_id, channel_info in channels.items():
             button_text = f"📢 {channel_info['title']}"
-            callback_data = f"{action}_ch_{channel_id}"
+            callback_data = callback_data_for(f"{action}_ch", channel_id)
             keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
         
+        row = Keyboards._page_row(f"{action}_page", page, has_next)
+        if row:
+            keyboard.append(row)
         keyboard.append([InlineKeyboardButton(BUTTONS["back"], callback_data="back_to_main")])
-        return InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard).to_json()
     
     @staticmethod
-    def scheduled_posts_list(posts: List[dict]) -> InlineKeyboardMarkup:
-        """Список запланированных постов"""
+    def scheduled_posts_list(posts: List[dict], page: int = 0, has_next: bool = False) -> Markup:
+        """Страница списка запланированных постов"""
         keyboard = []
         
         for post in posts:
@@ -45,40 +80,117 @@ class Keyboards:
             
             # Обрезаем сообщение для кнопки
             message_preview = post["message"][:30] + "..." if len(post["message"]) > 30 else post["message"]
-            button_text = f"⏰ {time_str} - {message_preview}"
+            icon = "🔁" if post.get("recurrence") else "⏰"
+            if post.get("media"):
+                message_preview = f"🖼 {message_preview}".rstrip()
+            button_text = f"{icon} {time_str} - {message_preview}"
             
-            callback_data = f"scheduled_detail_{post['id']}"
+            callback_data = callback_data_for("scheduled_detail", post['id'])
             keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
         
+        row = Keyboards._page_row("scheduled_page", page, has_next)
+        if row:
+            keyboard.append(row)
         keyboard.append([InlineKeyboardButton(BUTTONS["back"], callback_data="back_to_main")])
-        return InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard).to_json()
     
     @staticmethod
-    def scheduled_post_detail(post_id: str) -> InlineKeyboardMarkup:
+    @lru_cache(maxsize=1024)
+    def scheduled_post_detail(post_id: str) -> Markup:
         """Детали запланированного поста"""
         keyboard = [
-            [InlineKeyboardButton(BUTTONS["delete"], callback_data=f"delete_scheduled_{post_id}")],
+            [InlineKeyboardButton(BUTTONS["delete"], callback_data=callback_data_for("delete_scheduled", post_id))],
             [InlineKeyboardButton(BUTTONS["back"], callback_data="scheduled_posts")]
         ]
-        return InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard).to_json()
     
     @staticmethod
-    def confirm_action(action: str, target: str) -> InlineKeyboardMarkup:
+    def confirm_action(action: str, target: str) -> Markup:
         """Подтверждение действия"""
         keyboard = [
             [InlineKeyboardButton(BUTTONS["confirm"], callback_data=f"confirm_{action}_{target}")],
             [InlineKeyboardButton(BUTTONS["cancel"], callback_data="cancel")]
         ]
-        return InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard).to_json()
     
     @staticmethod
-    def cancel_keyboard() -> InlineKeyboardMarkup:
-        """Инлайн клавиатура с кнопкой отмены"""
+    @lru_cache(maxsize=None)
+    def cancel_keyboard() -> Markup:
+        """Инлайн клавиатура с кнопкой отмены (собирается один раз)"""
         keyboard = [[InlineKeyboardButton(BUTTONS["cancel"], callback_data="cancel")]]
-        return InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard).to_json()
     
     @staticmethod
     def remove_keyboard():
         """Удаление клавиатуры"""
         from telebot.types import ReplyKeyboardRemove
         return ReplyKeyboardRemove()
+
+
+class KeyboardCache:
+    """Кэш клавиатур конкретных пользователей.
+
+    Значения хранятся по пользователю и виду данных ("channels" или
+    "posts") и сбрасываются по уведомлению базы об изменении этих данных.
+    Хранится не более max_users пользователей, давно не заходившие
+    вытесняются первыми. С общей базой (database.shared) кэш выключен:
+    изменения из других экземпляров бота до него не доходят.
+    """
+
+    MISSING = object()
+
+    def __init__(self, database, max_users: int = KEYBOARD_CACHE_USERS):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        # user_id -> {"channels": {key: value}, "posts": {key: value}, "invalidated": {kind: clock}}
+        self._users: "OrderedDict[int, dict]" = OrderedDict()
+        self._clock = 0
+        self.enabled = not database.shared
+        database.add_listener(self.invalidate)
+
+    def _user_entry(self, user_id: int) -> dict:
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = {"channels": {}, "posts": {}, "invalidated": {"channels": 0, "posts": 0}}
+            self._users[user_id] = entry
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return entry
+
+    def lookup(self, user_id: int, kind: str, key: Any) -> Tuple[Any, int]:
+        """Значение из кэша (или MISSING) и метка для последующего store()"""
+        if not self.enabled:
+            return self.MISSING, 0
+        with self._lock:
+            self._clock += 1
+            entry = self._user_entry(user_id)
+            return entry[kind].get(key, self.MISSING), self._clock
+
+    def store(self, user_id: int, kind: str, key: Any, value: Any, token: int):
+        """Сохранение значения, если данные не менялись после lookup()"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # Пользователь, вытесненный после lookup(), мог пропустить сброс
+            entry = self._users.get(user_id)
+            if entry is not None and entry["invalidated"][kind] < token:
+                entry[kind][key] = value
+
+    def get(self, user_id: int, kind: str, key: Any, build: Callable[[], Any]) -> Any:
+        """Значение из кэша или результат build()"""
+        value, token = self.lookup(user_id, kind, key)
+        if value is self.MISSING:
+            value = build()
+            self.store(user_id, kind, key, value, token)
+        return value
+
+    def invalidate(self, kind: str, user_id: int):
+        """Сброс клавиатур пользователя после изменения его данных"""
+        with self._lock:
+            self._clock += 1
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry[kind].clear()
+                entry["invalidated"][kind] = self._clock
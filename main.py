@@ -5,6 +5,7 @@ Telegram Bot для постинга сообщений в каналы/груп
 
 import logging
 from bot import TelegramBot
+from config import BOT_RUNTIME
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,7 +18,11 @@ def main():
     """Основная функция запуска бота"""
     try:
         # Создаем и запускаем бота
-        bot = TelegramBot()
+        if BOT_RUNTIME == "async":
+            from async_bot import AsyncTelegramBot
+            bot = AsyncTelegramBot()
+        else:
+            bot = TelegramBot()
         bot.start()
     except KeyboardInterrupt:
         logger.info("Получен сигнал остановки...")
@@ -0,0 +1,248 @@
+"""
+Посты с фото, видео и альбомами
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Callable, Collection, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from telebot.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+import metrics
+from broadcaster import BroadcastResult
+from config import MEDIA_GROUP_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Вложение поста — словарь {"type": ..., "file_id": ...}. До первой отправки
+# вложение из импорта хранит ссылку: {"type": ..., "url": ...}
+MEDIA_TYPES = ("photo", "video", "animation", "document", "audio")
+
+# Типы, которые Telegram позволяет объединять в альбом
+ALBUM_TYPES = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio
+}
+MAX_ALBUM_SIZE = 10
+
+# Ограничение Telegram на длину подписи к вложению
+MAX_CAPTION_LENGTH = 1024
+
+# Тип вложения по расширению файла в ссылке
+EXTENSION_TYPES = {
+    ".jpg": "photo", ".jpeg": "photo", ".png": "photo", ".webp": "photo",
+    ".mp4": "video", ".mov": "video",
+    ".gif": "animation",
+    ".mp3": "audio", ".m4a": "audio", ".ogg": "audio"
+}
+
+def extract_media(message) -> Optional[dict]:
+    """Вложение сообщения; None — в сообщении нет поддерживаемого вложения"""
+    if message.photo:
+        # Последний размер фото — самый большой
+        return {"type": "photo", "file_id": message.photo[-1].file_id}
+    # У GIF заполнено и поле document, поэтому animation проверяется раньше
+    for media_type in ("video", "animation", "document", "audio"):
+        attachment = getattr(message, media_type, None)
+        if attachment:
+            return {"type": media_type, "file_id": attachment.file_id}
+    return None
+
+def media_from_url(url: str) -> dict:
+    """Вложение по ссылке; тип определяется по расширению файла"""
+    extension = os.path.splitext(urlparse(url).path)[1].lower()
+    return {"type": EXTENSION_TYPES.get(extension, "document"), "url": url}
+
+def validate_media(media: List[dict], caption: str) -> Optional[str]:
+    """Текст ошибки, если вложения нельзя отправить одним постом"""
+    if len(media) > MAX_ALBUM_SIZE:
+        return f"в альбоме не больше {MAX_ALBUM_SIZE} вложений"
+    if len(media) > 1 and any(item["type"] not in ALBUM_TYPES for item in media):
+        return "GIF нельзя отправить в составе альбома"
+    if len(caption) > MAX_CAPTION_LENGTH:
+        return f"подпись к вложению длиннее {MAX_CAPTION_LENGTH} символов"
+    return None
+
+def needs_upload(media: Optional[List[dict]]) -> bool:
+    """Есть ли вложения, ещё не загруженные в Telegram"""
+    return any("file_id" not in item for item in media or ())
+
+def _source(item: dict) -> str:
+    return item.get("file_id") or item["url"]
+
+def _album(caption: str, media: List[dict]) -> list:
+    """Элементы send_media_group; подпись у первого элемента"""
+    return [
+        ALBUM_TYPES[item["type"]](
+            _source(item),
+            caption=(caption or None) if index == 0 else None,
+            parse_mode='HTML'
+        )
+        for index, item in enumerate(media)
+    ]
+
+def _sent_media(sent, media: List[dict]) -> List[dict]:
+    """Вложения с file_id из ответа на отправку"""
+    messages = sent if isinstance(sent, list) else [sent]
+    result = []
+    for item, message in zip(media, messages):
+        uploaded = extract_media(message)
+        result.append({"type": item["type"], "file_id": uploaded["file_id"]} if uploaded else item)
+    return result
+
+class MediaPublisher:
+    """Отправка поста — текста или вложений с подписью — во все каналы.
+
+    Вложения из сообщений пользователя уже лежат в Telegram, и их file_id
+    подходит для любого канала. Вложения по ссылке загружаются один раз:
+    пост уходит сначала в один канал, а file_id из ответа используются
+    для остальных каналов и возвращаются вызывающему, чтобы сохранить их
+    в посте для следующих срабатываний.
+    """
+
+    def __init__(self, bot, broadcaster):
+        self.bot = bot
+        self.broadcaster = broadcaster
+
+    def send(self, chat_id, text: str, media: Optional[List[dict]] = None):
+        """Отправка поста в один чат"""
+        if not media:
+            return self.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+        if len(media) == 1:
+            item = media[0]
+            send_method = getattr(self.bot, f"send_{item['type']}")
+            return send_method(chat_id, _source(item), caption=text or None, parse_mode='HTML')
+        return self.bot.send_media_group(chat_id, _album(text, media))
+
+    def publish(self, channels: Dict[str, str], text: str, media: Optional[List[dict]] = None,
+                dead: Collection[str] = ()) -> Tuple[BroadcastResult, Optional[List[dict]]]:
+        """Рассылка по каналам {channel_id: title}; возвращает итог и вложения с file_id"""
+        result, targets = BroadcastResult.with_skipped(channels, dead)
+
+        with metrics.BROADCAST_SECONDS.time():
+            # Загружаем по очереди, пока один из каналов не примет вложения
+            while targets and needs_upload(media):
+                channel_id = next(iter(targets))
+                title = targets.pop(channel_id)
+                try:
+                    media = _sent_media(self.send(channel_id, text, media), media)
+                    result.success_count += 1
+                except Exception as e:
+                    result.add_error(channel_id, title, e)
+
+            result.merge(self.broadcaster.broadcast(targets, lambda channel_id: self.send(channel_id, text, media)))
+        return result, media
+
+class AsyncMediaPublisher(MediaPublisher):
+    """MediaPublisher для AsyncTeleBot и AsyncBroadcaster"""
+
+    async def send(self, chat_id, text: str, media: Optional[List[dict]] = None):
+        if not media:
+            return await self.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+        if len(media) == 1:
+            item = media[0]
+            send_method = getattr(self.bot, f"send_{item['type']}")
+            return await send_method(chat_id, _source(item), caption=text or None, parse_mode='HTML')
+        return await self.bot.send_media_group(chat_id, _album(text, media))
+
+    async def publish(self, channels: Dict[str, str], text: str, media: Optional[List[dict]] = None,
+                      dead: Collection[str] = ()) -> Tuple[BroadcastResult, Optional[List[dict]]]:
+        result, targets = BroadcastResult.with_skipped(channels, dead)
+
+        with metrics.BROADCAST_SECONDS.time():
+            while targets and needs_upload(media):
+                channel_id = next(iter(targets))
+                title = targets.pop(channel_id)
+                try:
+                    media = _sent_media(await self.send(channel_id, text, media), media)
+                    result.success_count += 1
+                except Exception as e:
+                    result.add_error(channel_id, title, e)
+
+            result.merge(await self.broadcaster.broadcast(
+                targets, lambda channel_id: self.send(channel_id, text, media)
+            ))
+        return result, media
+
+class MediaGroupCollector:
+    """Сборка альбома из отдельных сообщений.
+
+    Telegram присылает каждое вложение альбома отдельным сообщением с общим
+    media_group_id. Сообщения копятся, пока wait секунд не придёт новое,
+    после чего on_complete получает весь альбом в исходном порядке.
+
+    submit(user_id, func) переносит вызов on_complete из потока таймера
+    туда, где обрабатываются обновления пользователя (см.
+    UpdateDispatcher.submit_call); без него альбом обрабатывается в потоке
+    таймера.
+    """
+
+    def __init__(self, wait: float = MEDIA_GROUP_WAIT,
+                 submit: Optional[Callable[[int, Callable[[], object]], None]] = None):
+        self.wait = wait
+        self.submit = submit
+        self._lock = threading.Lock()
+        # media_group_id -> (сообщения, таймер, on_complete)
+        self._groups: Dict[str, tuple] = {}
+
+    def add(self, message, on_complete: Callable[[list], object]):
+        """Добавление сообщения альбома"""
+        group_id = message.media_group_id
+        with self._lock:
+            messages, timer, _ = self._groups.get(group_id, ([], None, None))
+            if timer:
+                timer.cancel()
+            messages.append(message)
+            timer = threading.Timer(self.wait, self._flush, args=(group_id,))
+            timer.daemon = True
+            self._groups[group_id] = (messages, timer, on_complete)
+            timer.start()
+
+    def _flush(self, group_id: str):
+        with self._lock:
+            entry = self._groups.pop(group_id, None)
+        if entry is None:
+            return
+
+        messages, _, on_complete = entry
+        if self.submit is None:
+            self._complete(group_id, messages, on_complete)
+        else:
+            self.submit(messages[0].from_user.id, lambda: self._complete(group_id, messages, on_complete))
+
+    @staticmethod
+    def _complete(group_id: str, messages: list, on_complete: Callable[[list], object]):
+        try:
+            on_complete(sorted(messages, key=lambda m: m.message_id))
+        except Exception as e:
+            logger.error(f"Ошибка при обработке альбома {group_id}: {e}")
+
+class AsyncMediaGroupCollector(MediaGroupCollector):
+    """Сборка альбома на цикле событий; on_complete — корутинная функция"""
+
+    def add(self, message, on_complete: Callable[[list], object]):
+        group_id = message.media_group_id
+        messages, handle, _ = self._groups.get(group_id, ([], None, None))
+        if handle:
+            handle.cancel()
+        messages.append(message)
+        handle = asyncio.get_running_loop().call_later(
+            self.wait, lambda: asyncio.ensure_future(self._flush(group_id))
+        )
+        self._groups[group_id] = (messages, handle, on_complete)
+
+    async def _flush(self, group_id: str):
+        entry = self._groups.pop(group_id, None)
+        if entry is None:
+            return
+
+        messages, _, on_complete = entry
+        try:
+            await on_complete(sorted(messages, key=lambda m: m.message_id))
+        except Exception as e:
+            logger.error(f"Ошибка при обработке альбома {group_id}: {e}")
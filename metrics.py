@@ -0,0 +1,277 @@
+"""
+Метрики бота в формате Prometheus
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import METRICS_HOST, METRICS_PORT, METRICS_MAX_LABEL_SETS
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию, секунд
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Границы для размера записи на диск, байт
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Значение метки вместо новых, когда меток уже слишком много (например, чатов)
+OVERFLOW_LABEL = "other"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Общая часть метрик: имя, описание и значения по наборам меток"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 max_label_sets: int = METRICS_MAX_LABEL_SETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_label_sets = max_label_sets
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        """Набор значений меток; сверх max_label_sets — OVERFLOW_LABEL (под блокировкой)"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        if key not in self._values and len(self._values) >= self.max_label_sets:
+            key = tuple(OVERFLOW_LABEL for _ in self.labelnames)
+        return key
+
+    def collect(self) -> List[str]:
+        """Строки метрики в текстовом формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._sample_lines(key, value))
+        return lines
+
+    def _sample_lines(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class Counter(Metric):
+    """Монотонно растущий счётчик"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться функцией в момент запроса метрик"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение без меток, которое берётся из function() при каждом запросе"""
+        self._function = function
+
+    def collect(self) -> List[str]:
+        if self._function is not None:
+            try:
+                self.set(self._function())
+            except Exception as e:
+                logger.error(f"Не удалось получить значение метрики {self.name}: {e}")
+        return super().collect()
+
+class Histogram(Metric):
+    """Распределение значений по корзинам"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        with self._lock:
+            key = self._key(labels)
+            state = self._values.get(key)
+            if state is None:
+                # Счётчики корзин (последняя — +Inf), сумма и количество
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока with"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _sample_lines(self, key: Tuple[str, ...], value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    """Набор метрик, отдаваемых одним запросом"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+API_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "bot_api_request_seconds", "Длительность запроса к Bot API", ["method"]
+))
+SENDS = REGISTRY.register(Counter(
+    "bot_sends_total", "Успешные исходящие запросы к Bot API", ["chat"]
+))
+SEND_FAILURES = REGISTRY.register(Counter(
+    "bot_send_failures_total", "Исходящие запросы, завершившиеся ошибкой", ["chat"]
+))
+THROTTLED = REGISTRY.register(Counter(
+    "bot_throttled_total", "Ответы 429 Too Many Requests", ["chat"]
+))
+BROADCAST_SECONDS = REGISTRY.register(Histogram(
+    "broadcast_duration_seconds", "Длительность рассылки одного поста по всем каналам"
+))
+STORAGE_WRITE_SECONDS = REGISTRY.register(Histogram(
+    "storage_write_seconds", "Длительность записи в хранилище", ["backend", "op"]
+))
+STORAGE_WRITE_BYTES = REGISTRY.register(Histogram(
+    "storage_write_bytes", "Объём одной записи на диск", ["backend"], buckets=SIZE_BUCKETS
+))
+SCHEDULER_LAG_SECONDS = REGISTRY.register(Histogram(
+    "scheduler_lag_seconds", "Задержка отправки относительно schedule_time"
+))
+PENDING_POSTS = REGISTRY.register(Gauge(
+    "scheduled_posts_pending", "Запланированные посты в хранилище"
+))
+USER_STATES = REGISTRY.register(Gauge(
+    "user_states", "Незавершённые диалоги пользователей"
+))
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "handler_duration_seconds", "Длительность обработчика обновления или маршрута кнопки", ["handler"]
+))
+CALLBACK_ROUTE_ERRORS = REGISTRY.register(Counter(
+    "callback_route_errors_total", "Ошибки обработчиков инлайн-кнопок", ["route"]
+))
+UPDATE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "update_queue_depth", "Обновления, ожидающие обработки"
+))
+OUTBOX_ATTEMPTS = REGISTRY.register(Counter(
+    "outbox_attempts_total", "Повторные отправки из очереди по итогу: delivered, retried, dead", ["result"]
+))
+OUTBOX_PENDING = REGISTRY.register(Gauge(
+    "outbox_pending", "Доставки, ожидающие повтора"
+))
+OUTBOX_DEAD = REGISTRY.register(Gauge(
+    "outbox_dead", "Недоставленные доставки после всех попыток"
+))
+
+class MetricsServer:
+    """HTTP-сервер, отдающий метрики по GET /metrics в фоновом потоке"""
+
+    def __init__(self, registry: Registry = REGISTRY, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        """Фактический порт (полезно при port=0)"""
+        return self._server.server_address[1]
+
+    def _make_request_handler(self):
+        registry = self.registry
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Запросы сборщика метрик не засоряют лог
+                pass
+
+        return RequestHandler
+
+    def start(self):
+        """Запуск сервера"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        logger.info(f"Метрики доступны на http://{self._server.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        """Остановка сервера"""
+        self._server.shutdown()
+        self._server.server_close()
+
+def start_metrics_server() -> Optional[MetricsServer]:
+    """Запуск сервера метрик, если задан METRICS_PORT"""
+    if not METRICS_PORT:
+        return None
+    try:
+        server = MetricsServer()
+    except OSError as e:
+        # Занятый порт не должен мешать работе бота
+        logger.error(f"Не удалось запустить сервер метрик: {e}")
+        return None
+    server.start()
+    return server
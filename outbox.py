@@ -0,0 +1,376 @@
+"""
+Очередь повторной отправки постов в каналы
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import metrics
+from broadcaster import BroadcastResult
+from config import (
+    MESSAGES, OUTBOX_BASE_DELAY, OUTBOX_BATCH, OUTBOX_DEAD_RETENTION_DAYS, OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_DELAY,
+    SCHEDULER_CHECK_INTERVAL, SCHEDULER_LEASE_SECONDS
+)
+from rate_limiter import is_transient_error, server_retry_after
+from scheduler import default_worker_id
+
+logger = logging.getLogger(__name__)
+
+# Ошибка доставки в канал, который проверка доступности признала недоступным
+DEAD_CHANNEL_ERROR = "бот не может публиковать в канале"
+
+# Как часто удалять недоставленные доставки старше срока хранения (секунд)
+DEAD_PURGE_INTERVAL = 3600
+
+def backoff_delay(attempts: int) -> float:
+    """Пауза после attempts неудачных попыток: удвоение с разбросом от половины до целой"""
+    delay = min(OUTBOX_BASE_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_DELAY)
+    # Разброс не даёт повторам после общего сбоя уходить одной волной
+    return random.uniform(delay / 2, delay)
+
+def retry_delay(error: Exception, attempts: int) -> float:
+    """Пауза перед следующей попыткой, но не меньше retry_after из ответа 429"""
+    return max(backoff_delay(attempts), server_retry_after(error))
+
+class Outbox:
+    """Очередь доставок в каналы, не удавшихся из-за временного сбоя.
+
+    Рассылка отдаёт сюда каналы с ошибкой сети, ответом 5xx или 429 после
+    всех повторов ограничителя (defer): доставка в один канал сохраняется
+    в хранилище вместе с текстом и вложениями, поэтому переживает
+    перезапуск, а обработчик и планировщик не ждут повторов. Фоновый поток
+    повторяет доставки с экспоненциальной паузой и разбросом; после
+    OUTBOX_MAX_ATTEMPTS попыток или постоянной ошибки доставка остаётся
+    в хранилище как недоставленная, а пользователь получает уведомление;
+    через OUTBOX_DEAD_RETENTION_DAYS дней недоставленные удаляются.
+
+    Доставки берутся в аренду, как посты планировщиком, поэтому очередь
+    в общей базе SQLite могут разбирать несколько процессов.
+    """
+
+    def __init__(self, bot, database, publisher):
+        self.bot = bot
+        self.database = database
+        self.publisher = publisher
+        self.worker_id = default_worker_id()
+        self.running = False
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._next_purge = 0.0
+
+    def start(self):
+        """Запуск фоновой отправки"""
+        if self.running:
+            return
+
+        self.running = True
+        self._thread = threading.Thread(target=self._worker_loop, name="outbox", daemon=True)
+        self._thread.start()
+        logger.info("Очередь повторной отправки запущена")
+
+    def stop(self):
+        """Остановка фоновой отправки"""
+        self.running = False
+        self._wakeup.set()
+        logger.info("Очередь повторной отправки остановлена")
+
+    def wake(self):
+        """Досрочное пробуждение после постановки доставок"""
+        self._wakeup.set()
+
+    @staticmethod
+    def _deliveries(result: BroadcastResult, user_id: int, message: str,
+                    media: Optional[List[dict]]) -> List[dict]:
+        """Доставки для временных ошибок рассылки; первая попытка уже сделана"""
+        now = time.time()
+        return [
+            {
+                "user_id": user_id,
+                "channel_id": channel_id,
+                "title": title,
+                "message": message,
+                "media": media,
+                "attempts": 1,
+                "next_attempt": now + retry_delay(error, 1),
+                "last_error": str(error)
+            }
+            for channel_id, title, error in result.transient
+        ]
+
+    def defer(self, result: BroadcastResult, user_id: int, message: str, media: Optional[List[dict]] = None) -> int:
+        """Передача временных ошибок рассылки в очередь; возвращает число доставок"""
+        deliveries = self._deliveries(result, user_id, message, media)
+        if not deliveries:
+            return 0
+
+        try:
+            self.database.add_deliveries(deliveries)
+        except Exception as e:
+            # Ошибки остаются в итоге рассылки, пользователь увидит их как раньше
+            logger.error(f"Не удалось поставить доставки в очередь повторов: {e}")
+            return 0
+
+        result.defer_transient()
+        self.wake()
+        logger.info(f"В очередь повторов поставлено доставок: {len(deliveries)} (пользователь {user_id})")
+        return len(deliveries)
+
+    def _worker_loop(self):
+        """Основной цикл: отправка наступивших повторов, затем сон до ближайшего"""
+        while self.running:
+            self._wakeup.clear()
+            try:
+                self._drain()
+                if self._purge_due():
+                    self._purge_dead(self.database.purge_dead_deliveries(self._dead_cutoff()))
+                timeout = self._sleep_time(self.database.next_delivery_time())
+            except Exception as e:
+                logger.error(f"Ошибка в очереди повторной отправки: {e}")
+                timeout = SCHEDULER_CHECK_INTERVAL
+
+            self._wakeup.wait(timeout)
+
+    def _sleep_time(self, next_attempt: Optional[float]) -> Optional[float]:
+        """Время сна до ближайшего повтора; None — ждать пробуждения.
+
+        next_attempt учитывает аренду, поэтому прошедшее время означает,
+        что доставка наступила во время отправки предыдущих и её можно
+        брать сразу.
+        """
+        if next_attempt is None:
+            # Доставки в общую базу ставят и другие процессы, а их изменения не будят очередь
+            return SCHEDULER_CHECK_INTERVAL if self.database.shared else None
+
+        delay = max(next_attempt - time.time(), 0.0)
+        return min(delay, SCHEDULER_CHECK_INTERVAL) if self.database.shared else delay
+
+    def _purge_due(self) -> bool:
+        """Пора удалять устаревшие недоставленные доставки"""
+        if time.monotonic() < self._next_purge:
+            return False
+        self._next_purge = time.monotonic() + DEAD_PURGE_INTERVAL
+        return True
+
+    @staticmethod
+    def _dead_cutoff() -> datetime:
+        return datetime.now() - timedelta(days=OUTBOX_DEAD_RETENTION_DAYS)
+
+    @staticmethod
+    def _purge_dead(purged: int):
+        if purged:
+            logger.info(f"Удалено недоставленных доставок старше {OUTBOX_DEAD_RETENTION_DAYS} дн.: {purged}")
+
+    def _lease_lost(self, delivery: dict, action: str):
+        """Изменение доставки не применено: её аренду забрал другой обработчик"""
+        logger.warning(f"Доставка {delivery['id']} уже арендована другим обработчиком, {action} пропущено")
+
+    def _drain(self):
+        """Аренда и отправка наступивших повторов пачками"""
+        while self.running:
+            lease_end = time.monotonic() + SCHEDULER_LEASE_SECONDS
+            deliveries = self.database.claim_due_deliveries(self.worker_id, SCHEDULER_LEASE_SECONDS, OUTBOX_BATCH)
+
+            for delivery in deliveries:
+                if time.monotonic() >= lease_end:
+                    # Оставшиеся доставки после окончания аренды может забрать другой процесс
+                    return
+                self._deliver(delivery)
+
+            if len(deliveries) < OUTBOX_BATCH:
+                return
+
+    def _deliver(self, delivery: dict):
+        """Одна попытка доставки"""
+        channel_id = delivery["channel_id"]
+        if self.database.get_dead_channels([channel_id]):
+            self._fail(delivery, DEAD_CHANNEL_ERROR)
+            return
+
+        try:
+            self.publisher.send(channel_id, delivery["message"], delivery["media"])
+        except Exception as e:
+            next_attempt = self._next_attempt(delivery, e)
+            if next_attempt is None:
+                self._fail(delivery, str(e))
+            elif self.database.retry_delivery(delivery["id"], next_attempt, str(e), self.worker_id):
+                metrics.OUTBOX_ATTEMPTS.inc(result="retried")
+            else:
+                self._lease_lost(delivery, "перенос повтора")
+            return
+
+        if not self.database.remove_delivery(delivery["id"], self.worker_id):
+            self._lease_lost(delivery, "удаление после отправки")
+            return
+        metrics.OUTBOX_ATTEMPTS.inc(result="delivered")
+        attempts = delivery["attempts"] + 1
+        logger.info(f"Доставка {delivery['id']} в {channel_id} выполнена с {attempts}-й попытки")
+        self._notify_user(
+            delivery["user_id"],
+            MESSAGES["outbox_delivered"].format(title=delivery["title"], attempts=attempts)
+        )
+
+    def _fail(self, delivery: dict, error: str):
+        """Перенос доставки в недоставленные с уведомлением пользователя"""
+        if not self.database.fail_delivery(delivery["id"], error, self.worker_id):
+            self._lease_lost(delivery, "перенос в недоставленные")
+            return
+        logger.error(f"Доставка {delivery['id']} в {delivery['channel_id']} перенесена в недоставленные: {error}")
+        metrics.OUTBOX_ATTEMPTS.inc(result="dead")
+        self._notify_user(delivery["user_id"], self._dead_text(delivery, error))
+
+    @staticmethod
+    def _next_attempt(delivery: dict, error: Exception) -> Optional[float]:
+        """Время (epoch) следующей попытки; None — доставку больше не повторять"""
+        attempts = delivery["attempts"] + 1
+        if not is_transient_error(error) or attempts >= OUTBOX_MAX_ATTEMPTS:
+            return None
+
+        delay = retry_delay(error, attempts)
+        logger.warning(
+            f"Доставка {delivery['id']} в {delivery['channel_id']} не удалась ({attempts}-я попытка), "
+            f"повтор через {delay:.0f} с: {error}"
+        )
+        return time.time() + delay
+
+    @staticmethod
+    def _dead_text(delivery: dict, error: str) -> str:
+        """Текст уведомления о недоставленном посте"""
+        return MESSAGES["outbox_dead"].format(title=delivery["title"], attempts=delivery["attempts"] + 1, error=error)
+
+    def _notify_user(self, user_id: int, text: str):
+        try:
+            self.bot.send_message(chat_id=user_id, text=text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
+
+
+class AsyncOutbox(Outbox):
+    """Очередь повторной отправки для асинхронного режима: задача на общем цикле событий"""
+
+    def __init__(self, bot, database, publisher):
+        super().__init__(bot, database, publisher)
+        self._task = None
+        self._loop = None
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        """Запуск фоновой отправки (вызывается внутри цикла событий)"""
+        if self.running:
+            return
+
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._worker_loop())
+        logger.info("Очередь повторной отправки запущена")
+
+    def stop(self):
+        """Остановка фоновой отправки"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+        logger.info("Очередь повторной отправки остановлена")
+
+    def wake(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def defer(self, result: BroadcastResult, user_id: int, message: str,
+                    media: Optional[List[dict]] = None) -> int:
+        deliveries = self._deliveries(result, user_id, message, media)
+        if not deliveries:
+            return 0
+
+        try:
+            await self.database.add_deliveries(deliveries)
+        except Exception as e:
+            logger.error(f"Не удалось поставить доставки в очередь повторов: {e}")
+            return 0
+
+        result.defer_transient()
+        self.wake()
+        logger.info(f"В очередь повторов поставлено доставок: {len(deliveries)} (пользователь {user_id})")
+        return len(deliveries)
+
+    async def _worker_loop(self):
+        while self.running:
+            self._wakeup.clear()
+            try:
+                await self._drain()
+                if self._purge_due():
+                    self._purge_dead(await self.database.purge_dead_deliveries(self._dead_cutoff()))
+                timeout = self._sleep_time(await self.database.next_delivery_time())
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка в очереди повторной отправки: {e}")
+                timeout = SCHEDULER_CHECK_INTERVAL
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                break
+
+    async def _drain(self):
+        while self.running:
+            lease_end = time.monotonic() + SCHEDULER_LEASE_SECONDS
+            deliveries = await self.database.claim_due_deliveries(
+                self.worker_id, SCHEDULER_LEASE_SECONDS, OUTBOX_BATCH
+            )
+
+            for delivery in deliveries:
+                if time.monotonic() >= lease_end:
+                    return
+                await self._deliver(delivery)
+
+            if len(deliveries) < OUTBOX_BATCH:
+                return
+
+    async def _deliver(self, delivery: dict):
+        channel_id = delivery["channel_id"]
+        if await self.database.get_dead_channels([channel_id]):
+            await self._fail(delivery, DEAD_CHANNEL_ERROR)
+            return
+
+        try:
+            await self.publisher.send(channel_id, delivery["message"], delivery["media"])
+        except Exception as e:
+            next_attempt = self._next_attempt(delivery, e)
+            if next_attempt is None:
+                await self._fail(delivery, str(e))
+            elif await self.database.retry_delivery(delivery["id"], next_attempt, str(e), self.worker_id):
+                metrics.OUTBOX_ATTEMPTS.inc(result="retried")
+            else:
+                self._lease_lost(delivery, "перенос повтора")
+            return
+
+        if not await self.database.remove_delivery(delivery["id"], self.worker_id):
+            self._lease_lost(delivery, "удаление после отправки")
+            return
+        metrics.OUTBOX_ATTEMPTS.inc(result="delivered")
+        attempts = delivery["attempts"] + 1
+        logger.info(f"Доставка {delivery['id']} в {channel_id} выполнена с {attempts}-й попытки")
+        await self._notify_user(
+            delivery["user_id"],
+            MESSAGES["outbox_delivered"].format(title=delivery["title"], attempts=attempts)
+        )
+
+    async def _fail(self, delivery: dict, error: str):
+        if not await self.database.fail_delivery(delivery["id"], error, self.worker_id):
+            self._lease_lost(delivery, "перенос в недоставленные")
+            return
+        logger.error(f"Доставка {delivery['id']} в {delivery['channel_id']} перенесена в недоставленные: {error}")
+        metrics.OUTBOX_ATTEMPTS.inc(result="dead")
+        await self._notify_user(delivery["user_id"], self._dead_text(delivery, error))
+
+    async def _notify_user(self, user_id: int, text: str):
+        try:
+            await self.bot.send_message(chat_id=user_id, text=text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
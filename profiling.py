@@ -0,0 +1,352 @@
+"""
+Профилирование обработчиков обновлений
+"""
+
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from telebot import apihelper, asyncio_helper
+
+import metrics
+from config import PROFILE_REPORT_LINES, PROFILE_SLOW_HANDLER_MS
+
+logger = logging.getLogger(__name__)
+
+# Списки обработчиков TeleBot/AsyncTeleBot, которые оборачивает instrument_bot
+HANDLER_LISTS = (
+    "message_handlers", "edited_message_handlers", "channel_post_handlers",
+    "edited_channel_post_handlers", "inline_handlers", "chosen_inline_handlers",
+    "callback_query_handlers", "my_chat_member_handlers", "chat_member_handlers",
+    "chat_join_request_handlers"
+)
+
+class Span:
+    """Замер одного обработчика: время в Bot API и в хранилище.
+
+    Вложенный замер (маршрут кнопки внутри handle_callback) передаёт время
+    и родителю. Время API суммируется по всем запросам, включая
+    параллельные запросы рассылки, поэтому может превышать общее время.
+    """
+
+    __slots__ = ("name", "parent", "totals", "calls", "inner", "_lock")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None):
+        self.name = name
+        self.parent = parent
+        self.totals = {"api": 0.0, "storage": 0.0}
+        self.calls = Counter()
+        self.inner = []
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, elapsed: float):
+        span = self
+        while span is not None:
+            # Запросы рассылки добавляют время из потоков пула
+            with span._lock:
+                span.totals[kind] += elapsed
+                span.calls[kind] += 1
+            span = span.parent
+
+# Замер, к которому относится текущий поток или задача asyncio
+_current_span: ContextVar[Optional[Span]] = ContextVar("profiling_span", default=None)
+
+@contextmanager
+def measure(kind: str):
+    """Учёт блока with как времени kind ("api" или "storage") текущего обработчика"""
+    span = _current_span.get()
+    if span is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        span.add(kind, time.perf_counter() - started)
+
+_api_hooks_installed = False
+
+def install_api_hooks():
+    """Учёт времени всех запросов к Bot API в замерах обработчиков.
+
+    У telebot нет общей точки расширения для запросов, поэтому оборачиваются
+    функции, через которые apihelper и asyncio_helper выполняют каждый запрос.
+    """
+    global _api_hooks_installed
+    if _api_hooks_installed:
+        return
+    _api_hooks_installed = True
+
+    make_request = apihelper._make_request
+    process_request = asyncio_helper._process_request
+
+    @functools.wraps(make_request)
+    def timed_make_request(*args, **kwargs):
+        with measure("api"):
+            return make_request(*args, **kwargs)
+
+    @functools.wraps(process_request)
+    async def timed_process_request(*args, **kwargs):
+        with measure("api"):
+            return await process_request(*args, **kwargs)
+
+    apihelper._make_request = timed_make_request
+    asyncio_helper._process_request = timed_process_request
+
+class StorageProbe:
+    """Хранилище, обращения к которому учитываются в замерах обработчиков.
+
+    Подходит и для Database/SQLiteDatabase, и для AsyncDatabase: методы-корутины
+    оборачиваются корутинами.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._storage, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+            async def timed(*args, **kwargs):
+                with measure("storage"):
+                    return await attr(*args, **kwargs)
+        else:
+            def timed(*args, **kwargs):
+                with measure("storage"):
+                    return attr(*args, **kwargs)
+
+        timed = functools.wraps(attr)(timed)
+        # Следующие обращения к методу не проходят через __getattr__
+        setattr(self, name, timed)
+        return timed
+
+class HandlerStats:
+    """Сводка замеров одного обработчика за время снятия профиля"""
+
+    __slots__ = ("count", "total", "api", "storage", "other", "cpu", "max_time")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.api = 0.0
+        self.storage = 0.0
+        self.other = 0.0
+        self.cpu: Optional[float] = None
+        self.max_time = 0.0
+
+    def record(self, wall: float, api: float, storage: float, other: float, cpu: Optional[float]):
+        self.count += 1
+        self.total += wall
+        self.api += api
+        self.storage += storage
+        self.other += other
+        if cpu is not None:
+            self.cpu = (self.cpu or 0.0) + cpu
+        self.max_time = max(self.max_time, wall)
+
+    def describe(self) -> str:
+        def average(value: float) -> float:
+            return value / self.count * 1000
+
+        cpu = f", CPU потока {average(self.cpu):.1f}" if self.cpu is not None else ""
+        return (
+            f"{self.count} вызовов, среднее {average(self.total):.1f} мс "
+            f"(API {average(self.api):.1f}, хранилище {average(self.storage):.1f}, "
+            f"остальное {average(self.other):.1f}{cpu}), максимум {self.max_time * 1000:.1f} мс"
+        )
+
+class ProfileCapture:
+    """Профиль cProfile за окно времени.
+
+    В синхронном режиме обработчики выполняются в разных потоках, а cProfile
+    видит только свой поток, поэтому каждый обработчик профилируется
+    отдельно и профили складываются. В асинхронном режиме профилируется
+    весь поток цикла событий (thread_profile).
+    """
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.started_at = datetime.now()
+        self.updates = 0
+        self.skipped_profiles = 0
+        self.handlers: Dict[str, HandlerStats] = {}
+        self.thread_profile: Optional[cProfile.Profile] = None
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def record(self, span: Span, wall: float, other: float, cpu: Optional[float]):
+        with self._lock:
+            self.handlers.setdefault(span.name, HandlerStats()).record(
+                wall, span.totals["api"], span.totals["storage"], other, cpu
+            )
+            if span.parent is None:
+                self.updates += 1
+
+    def add_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def report(self) -> str:
+        """Текст отчёта: сводка по обработчикам и профиль по суммарному времени"""
+        lines = [
+            f"Профиль с {self.started_at:%H:%M:%S %d.%m.%Y}, {self.seconds} с",
+            f"Обработано обновлений: {self.updates}",
+            ""
+        ]
+        if self.skipped_profiles:
+            lines.append(f"Без профиля (профилировщик был занят): {self.skipped_profiles}")
+
+        lines.append("Обработчики:")
+        for name, stats in sorted(self.handlers.items(), key=lambda item: item[1].total, reverse=True):
+            lines.append(f"  {name}: {stats.describe()}")
+        if not self.handlers:
+            lines.append("  (нет вызовов)")
+
+        lines.append("")
+        if self._stats is None:
+            lines.append("Профиль пуст")
+        else:
+            stream = io.StringIO()
+            self._stats.stream = stream
+            self._stats.sort_stats("cumulative").print_stats(PROFILE_REPORT_LINES)
+            lines.append(stream.getvalue())
+        return "\n".join(lines)
+
+class Profiler:
+    """Замеры обработчиков и снятие профиля по запросу.
+
+    Каждый обёрнутый обработчик получает замер: общее время, время в Bot API,
+    в хранилище и остальное — CPU и ожидание лимитов Telegram, блокировок и
+    пула рассылки. В синхронном режиме CPU потока обработчика известен
+    отдельно; в асинхронном время потока делят все задачи цикла, и CPU не
+    выделяется. Обновления дольше slow_threshold секунд попадают в лог
+    с этой разбивкой.
+    """
+
+    def __init__(self, slow_threshold: float = PROFILE_SLOW_HANDLER_MS / 1000):
+        self.slow_threshold = slow_threshold
+        self.capture: Optional[ProfileCapture] = None
+        self._capture_lock = threading.Lock()
+        install_api_hooks()
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Обработчик, выполняющийся внутри замера name"""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def profiled(*args, **kwargs):
+                with self.span(name, is_async=True):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def profiled(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+        profiled.profiled = True
+        return profiled
+
+    @contextmanager
+    def span(self, name: str, is_async: bool = False):
+        """Замер блока with; вложенные замеры учитываются и во внешнем"""
+        parent = _current_span.get()
+        span = Span(name, parent)
+        token = _current_span.set(span)
+        profile = self._start_profile() if parent is None and not is_async else None
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield span
+        finally:
+            wall = time.perf_counter() - started
+            if profile:
+                profile.disable()
+            _current_span.reset(token)
+
+            cpu = None if is_async else time.thread_time() - cpu_started
+            self._finish(span, wall, cpu, profile)
+
+    def _start_profile(self) -> Optional[cProfile.Profile]:
+        """Профиль обработчика, если сейчас снимается профиль"""
+        capture = self.capture
+        if capture is None:
+            return None
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # С Python 3.12 одновременно может работать только один профилировщик
+            capture.skipped_profiles += 1
+            return None
+        return profile
+
+    def _finish(self, span: Span, wall: float, cpu: Optional[float], profile: Optional[cProfile.Profile]):
+        metrics.HANDLER_SECONDS.observe(wall, handler=span.name)
+        # Время API рассылки суммируется по параллельным запросам и может превысить wall
+        other = max(wall - span.totals["api"] - span.totals["storage"], 0.0)
+        capture = self.capture
+        if capture is not None:
+            capture.record(span, wall, other, cpu)
+            if profile:
+                capture.add_profile(profile)
+
+        if span.parent is not None:
+            span.parent.inner.append(span.name)
+        elif wall >= self.slow_threshold:
+            cpu_text = f", CPU потока {cpu * 1000:.0f} мс" if cpu is not None else ""
+            inner = f" → {', '.join(span.inner)}" if span.inner else ""
+            logger.warning(
+                f"Медленная обработка {span.name}{inner}: {wall * 1000:.0f} мс — "
+                f"API {span.totals['api'] * 1000:.0f} мс ({span.calls['api']} запр.), "
+                f"хранилище {span.totals['storage'] * 1000:.0f} мс ({span.calls['storage']} обращ.), "
+                f"остальное {other * 1000:.0f} мс{cpu_text}"
+            )
+
+    def start_capture(self, seconds: int, whole_thread: bool = False) -> Optional[ProfileCapture]:
+        """Начало снятия профиля; None — профиль уже снимается.
+
+        whole_thread — профилировать весь текущий поток (цикл событий);
+        finish_capture тогда нужно вызвать в этом же потоке.
+        """
+        with self._capture_lock:
+            if self.capture is not None:
+                return None
+            capture = ProfileCapture(seconds)
+            if whole_thread:
+                capture.thread_profile = cProfile.Profile()
+                capture.thread_profile.enable()
+            self.capture = capture
+            logger.info(f"Снятие профиля на {seconds} с")
+            return capture
+
+    def finish_capture(self) -> Optional[ProfileCapture]:
+        """Завершение снятия профиля"""
+        with self._capture_lock:
+            capture, self.capture = self.capture, None
+        if capture is not None and capture.thread_profile is not None:
+            capture.thread_profile.disable()
+            capture.add_profile(capture.thread_profile)
+        return capture
+
+def instrument_bot(bot, profiler: Profiler):
+    """Замеры для всех обработчиков, зарегистрированных в bot"""
+    for attr in HANDLER_LISTS:
+        for handler in getattr(bot, attr, ()):
+            function = handler["function"]
+            if not getattr(function, "profiled", False):
+                handler["function"] = profiler.wrap(function.__name__, function)
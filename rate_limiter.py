@@ -0,0 +1,247 @@
+"""
+Ограничение частоты запросов к Bot API
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Union
+
+from telebot import apihelper, asyncio_helper
+
+import metrics
+from config import (
+    RATE_LIMIT_GLOBAL_PER_SECOND,
+    RATE_LIMIT_PRIVATE_PER_SECOND,
+    RATE_LIMIT_GROUP_PER_MINUTE,
+    RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+# Ошибки Bot API синхронного и асинхронного клиентов
+API_ERRORS = (apihelper.ApiTelegramException, asyncio_helper.ApiTelegramException)
+
+# Ответ сервера без JSON Bot API (обычно от прокси или балансировщика)
+HTTP_ERRORS = (apihelper.ApiHTTPException, asyncio_helper.ApiHTTPException)
+INVALID_JSON_ERRORS = (apihelper.ApiInvalidJSONException, asyncio_helper.ApiInvalidJSONException)
+
+# Сбои сети: исключения requests и таймауты — подклассы OSError, ошибки
+# aiohttp asyncio_helper превращает в RequestTimeout
+NETWORK_ERRORS = (OSError, asyncio_helper.RequestTimeout)
+
+# Любой неуспешный запрос к Bot API
+REQUEST_ERRORS = API_ERRORS + HTTP_ERRORS + INVALID_JSON_ERRORS + NETWORK_ERRORS
+
+def server_retry_after(error: Exception) -> float:
+    """Пауза из ответа 429 (секунд); 0 — сервер её не указал"""
+    if not isinstance(error, API_ERRORS):
+        return 0
+    return (error.result_json or {}).get("parameters", {}).get("retry_after", 0)
+
+def is_transient_error(error: Exception) -> bool:
+    """Ошибка, после которой запрос стоит повторить позже: сбой сети, 5xx или 429"""
+    if isinstance(error, API_ERRORS):
+        return error.error_code == 429 or error.error_code >= 500
+    if isinstance(error, HTTP_ERRORS):
+        # У requests код ответа в status_code, у aiohttp — в status
+        status = getattr(error.result, "status_code", None) or getattr(error.result, "status", 0)
+        return status == 429 or status >= 500
+    return isinstance(error, INVALID_JSON_ERRORS + NETWORK_ERRORS)
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не более capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        # Пауза, выставленная сервером через retry_after
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        """Пополнение токенов за прошедшее время"""
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько ждать до появления токена"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """Списание одного токена"""
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        """Корзина полна и не заблокирована — её можно забыть"""
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+class RateLimiter:
+    """Общий ограничитель исходящих сообщений.
+
+    Каждый запрос берёт токен из глобальной корзины (~30 сообщений/с)
+    и из корзины конкретного чата: 1 сообщение/с для личных чатов и
+    20 сообщений/мин для групп и каналов. Ответ 429 ставит чат на паузу
+    на retry_after секунд, после чего запрос повторяется.
+    """
+
+    # Порог числа корзин чатов, после которого удаляются простаивающие
+    PRUNE_THRESHOLD = 10000
+
+    def __init__(self,
+                 global_per_second: float = RATE_LIMIT_GLOBAL_PER_SECOND,
+                 private_per_second: float = RATE_LIMIT_PRIVATE_PER_SECOND,
+                 group_per_minute: float = RATE_LIMIT_GROUP_PER_MINUTE,
+                 chat_burst: float = RATE_LIMIT_CHAT_BURST,
+                 max_retries: int = RATE_LIMIT_MAX_RETRIES):
+        self.private_per_second = private_per_second
+        self.group_per_second = group_per_minute / 60
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_per_second, global_per_second)
+        self._chats: Dict[str, TokenBucket] = {}
+
+        # Счётчик полученных 429
+        self.throttled_count = 0
+
+    @staticmethod
+    def _is_private_chat(chat_id: ChatId) -> bool:
+        """Личные чаты имеют положительный числовой id"""
+        if isinstance(chat_id, int):
+            return chat_id > 0
+        return str(chat_id).isdigit()
+
+    def _chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        """Корзина чата (создаётся при первом обращении)"""
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= self.PRUNE_THRESHOLD:
+                self._prune(time.monotonic())
+
+            if self._is_private_chat(chat_id):
+                rate = self.private_per_second
+            else:
+                rate = self.group_per_second
+            bucket = TokenBucket(rate, self.chat_burst)
+            self._chats[key] = bucket
+        return bucket
+
+    def _prune(self, now: float):
+        """Удаление корзин простаивающих чатов"""
+        for key in [key for key, bucket in self._chats.items() if bucket.is_idle(now)]:
+            del self._chats[key]
+
+    def _try_acquire(self, chat_id: ChatId) -> float:
+        """Попытка взять токены; 0 — успешно, иначе сколько ждать"""
+        with self._lock:
+            now = time.monotonic()
+            chat_bucket = self._chat_bucket(chat_id)
+            wait = max(self._global.wait_time(now), chat_bucket.wait_time(now))
+            if wait <= 0:
+                self._global.consume()
+                chat_bucket.consume()
+                return 0.0
+            return wait
+
+    def _retry_after(self, chat_id: ChatId, error: Exception, attempt: int) -> Optional[float]:
+        """Пауза перед повтором после ошибки или None, если повторять не нужно"""
+        if error.error_code != 429 or attempt >= self.max_retries:
+            return None
+
+        retry_after = server_retry_after(error) or 1
+        # Ответы 429 приходят из нескольких потоков рассылки одновременно
+        with self._lock:
+            self.throttled_count += 1
+        logger.warning(
+            f"Превышен лимит Bot API для чата {chat_id}, повтор через {retry_after} с"
+        )
+        self.block(chat_id, retry_after)
+        return retry_after
+
+    def acquire(self, chat_id: ChatId):
+        """Ожидание разрешения на отправку в чат"""
+        while True:
+            wait = self._try_acquire(chat_id)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def block(self, chat_id: ChatId, seconds: float):
+        """Пауза для чата по ответу 429"""
+        with self._lock:
+            bucket = self._chat_bucket(chat_id)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+
+    @staticmethod
+    def _record_attempt(chat_id: ChatId, method: str, started: float, error: Optional[Exception] = None):
+        """Учёт одной попытки в метриках: длительность по методу и ответы 429 по чату"""
+        metrics.API_REQUEST_SECONDS.observe(time.perf_counter() - started, method=method)
+        if isinstance(error, API_ERRORS) and error.error_code == 429:
+            metrics.THROTTLED.inc(chat=chat_id)
+
+    def call(self, chat_id: ChatId, func: Callable, /, *args, **kwargs):
+        """Вызов метода API с учётом лимитов и повтором после 429"""
+        attempt = 0
+        while True:
+            self.acquire(chat_id)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._record_attempt(chat_id, func.__name__, started, e)
+                if not isinstance(e, API_ERRORS) or self._retry_after(chat_id, e, attempt) is None:
+                    metrics.SEND_FAILURES.inc(chat=chat_id)
+                    raise
+                attempt += 1
+            else:
+                self._record_attempt(chat_id, func.__name__, started)
+                metrics.SENDS.inc(chat=chat_id)
+                return result
+
+class AsyncRateLimiter(RateLimiter):
+    """RateLimiter для асинхронного режима: ожидание не блокирует цикл событий"""
+
+    async def acquire(self, chat_id: ChatId):
+        """Ожидание разрешения на отправку в чат"""
+        while True:
+            wait = self._try_acquire(chat_id)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def call(self, chat_id: ChatId, func: Callable, /, *args, **kwargs):
+        """Вызов корутины API с учётом лимитов и повтором после 429"""
+        attempt = 0
+        while True:
+            await self.acquire(chat_id)
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                self._record_attempt(chat_id, func.__name__, started, e)
+                if not isinstance(e, API_ERRORS) or self._retry_after(chat_id, e, attempt) is None:
+                    metrics.SEND_FAILURES.inc(chat=chat_id)
+                    raise
+                attempt += 1
+            else:
+                self._record_attempt(chat_id, func.__name__, started)
+                metrics.SENDS.inc(chat=chat_id)
+                return result
@@ -0,0 +1,166 @@
+"""
+Правила повторения запланированных постов
+"""
+
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Optional
+
+# Дни недели в нумерации cron: 0 — воскресенье, 1 — понедельник
+WEEKDAYS = {
+    "вс": 0, "пн": 1, "вт": 2, "ср": 3, "чт": 4, "пт": 5, "сб": 6,
+    "sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6
+}
+WEEKDAY_NAMES = ["вс", "пн", "вт", "ср", "чт", "пт", "сб"]
+
+DAILY_WORDS = ("daily", "ежедневно")
+WEEKLY_WORDS = ("weekly", "еженедельно")
+
+TIME_PATTERN = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+# Сколько дней вперёд искать следующее срабатывание (покрывает 29 февраля)
+MAX_LOOKAHEAD_DAYS = 366 * 8
+
+def _parse_field(field: str, low: int, high: int) -> FrozenSet[int]:
+    """Поле cron: "*", "5", "1-5", "*/15", "1,15,30", "10-40/10" """
+    values = set()
+    for part in field.split(","):
+        value_range, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if step <= 0:
+            raise ValueError(f"некорректный шаг в поле «{field}»")
+
+        if value_range == "*":
+            start, end = low, high
+        elif "-" in value_range:
+            start, end = (int(value) for value in value_range.split("-", 1))
+        else:
+            start = int(value_range)
+            end = high if step_text else start
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"значение вне диапазона {low}-{high} в поле «{field}»")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+class Recurrence:
+    """Правило повторения в виде пяти полей cron.
+
+    text — каноническая запись правила, которая хранится в посте:
+    "daily 10:00", "weekly пн,пт 10:00" или "cron 0 10 * * 1-5".
+    """
+
+    __slots__ = ("text", "minutes", "hours", "days", "months", "weekdays", "_any_day", "_any_weekday")
+
+    def __init__(self, text: str, cron: str):
+        fields = cron.split()
+        if len(fields) != 5:
+            raise ValueError("в выражении cron должно быть 5 полей")
+
+        self.text = text
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        # 7 в cron тоже воскресенье
+        self.weekdays = frozenset(day % 7 for day in _parse_field(fields[4], 0, 7))
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, day: datetime) -> bool:
+        """Совпадение даты с полями дня месяца и дня недели (правила cron)"""
+        if day.month not in self.months:
+            return False
+        day_ok = day.day in self.days
+        weekday_ok = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return weekday_ok
+        if self._any_weekday:
+            return day_ok
+        # Если заданы оба поля, достаточно совпадения любого из них
+        return day_ok or weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """Ближайшее срабатывание строго позже after"""
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        hours = sorted(self.hours)
+        minutes = sorted(self.minutes)
+
+        for _ in range(MAX_LOOKAHEAD_DAYS):
+            if self._day_matches(day):
+                for hour in hours:
+                    for minute in minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+
+        raise ValueError(f"правило «{self.text}» никогда не срабатывает")
+
+    def describe(self) -> str:
+        """Описание правила для пользователя"""
+        kind, _, rest = self.text.partition(" ")
+        if kind == "daily":
+            return f"каждый день в {rest}"
+        if kind == "weekly":
+            days, _, time_str = rest.rpartition(" ")
+            return f"каждую неделю ({days.replace(',', ', ')}) в {time_str}"
+        return f"по расписанию cron «{rest}»"
+
+def _parse_time(time_str: str):
+    match = TIME_PATTERN.match(time_str)
+    if not match:
+        raise ValueError("время указывается как ЧЧ:ММ")
+    return int(match.group(1)), int(match.group(2))
+
+@lru_cache(maxsize=1024)
+def parse_rule(text: str) -> Recurrence:
+    """Разбор правила повторения; ValueError — правило некорректно.
+
+    Поддерживаются:
+    • "daily 10:00" / "ежедневно 10:00";
+    • "weekly пн,пт 10:00" / "еженедельно mon,fri 10:00";
+    • "cron 0 10 * * 1-5" — пять полей cron.
+    """
+    words = text.strip().lower().split()
+    if not words:
+        raise ValueError("пустое правило")
+    kind = words[0]
+
+    if kind in DAILY_WORDS and len(words) == 2:
+        hour, minute = _parse_time(words[1])
+        return Recurrence(f"daily {hour:02d}:{minute:02d}", f"{minute} {hour} * * *")
+
+    if kind in WEEKLY_WORDS and len(words) == 3:
+        hour, minute = _parse_time(words[2])
+        try:
+            days = sorted({WEEKDAYS[day] for day in words[1].split(",") if day}, key=lambda d: (d + 6) % 7)
+        except KeyError as e:
+            raise ValueError(f"неизвестный день недели {e.args[0]}")
+        if not days:
+            raise ValueError("не указаны дни недели")
+        day_names = ",".join(WEEKDAY_NAMES[day] for day in days)
+        return Recurrence(
+            f"weekly {day_names} {hour:02d}:{minute:02d}",
+            f"{minute} {hour} * * {','.join(str(day) for day in days)}"
+        )
+
+    if kind == "cron":
+        cron = " ".join(words[1:])
+        return Recurrence(f"cron {cron}", cron)
+
+    raise ValueError("неизвестный вид правила")
+
+def is_rule(text: str) -> bool:
+    """Похожа ли строка на правило повторения (а не на дату)"""
+    words = text.strip().lower().split()
+    return bool(words) and words[0] in DAILY_WORDS + WEEKLY_WORDS + ("cron",)
+
+def next_occurrence(rule_text: str, after: datetime) -> Optional[datetime]:
+    """Следующее срабатывание сохранённого правила; None — правило некорректно"""
+    try:
+        return parse_rule(rule_text).next_after(after)
+    except ValueError:
+        return None
@@ -2,25 +2,55 @@
 Планировщик сообщений
 """
 
-import asyncio
 import logging
+import os
+import socket
+import threading
+import time
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Optional
 
 if TYPE_CHECKING:
     from bot import TelegramBot
 
-from database import Database
-from config import SCHEDULER_CHECK_INTERVAL
+from broadcaster import BroadcastResult
+import metrics
+from config import SCHEDULER_CHECK_INTERVAL, SCHEDULER_CLAIM_BATCH, SCHEDULER_LEASE_SECONDS, SCHEDULER_WORKER_ID
+from media import MediaPublisher
+from recurrence import next_occurrence
 
 logger = logging.getLogger(__name__)
 
+def default_worker_id() -> str:
+    """Имя процесса для аренды постов"""
+    return SCHEDULER_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+
 class MessageScheduler:
+    """Планировщик, который спит ровно до ближайшего запланированного поста.
+
+    Добавление или удаление поста в базе будит поток досрочно, чтобы
+    пересчитать время сна; stop() прерывает ожидание сразу.
+
+    Готовые посты берутся в аренду пачками (claim_due_posts), поэтому
+    планировщики нескольких процессов на общей базе SQLite делят их без
+    повторной отправки. Пост, который процесс не успел завершить за срок
+    аренды, забирает следующий захват.
+    """
+
     def __init__(self, bot: 'TelegramBot'):
         self.bot = bot
-        self.database = Database()
+        self.database = bot.database
+        self.publisher = MediaPublisher(bot.bot, bot.broadcaster)
+        self.outbox = bot.outbox
+        self.worker_id = default_worker_id()
         self.running = False
-        self._task = None
+        self._thread = None
+        self._wakeup = threading.Event()
+
+        # Задержка срабатывания: фактическое время отправки минус schedule_time
+        self.lag_stats = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+
+        self.database.add_listener(self._on_database_change)
     
     def start(self):
         """Запуск планировщика"""
@@ -28,94 +58,201 @@ class MessageScheduler:
             return
         
         self.running = True
-        import threading
-        import time
-        
-        def scheduler_loop():
-            while self.running:
-                try:
-                    self._check_due_posts_sync()
-                    time.sleep(SCHEDULER_CHECK_INTERVAL)
-                except Exception as e:
-                    logger.error(f"Ошибка в планировщике: {e}")
-                    time.sleep(SCHEDULER_CHECK_INTERVAL)
-        
-        self._thread = threading.Thread(target=scheduler_loop, daemon=True)
+        self._thread = threading.Thread(target=self._scheduler_loop, daemon=True)
         self._thread.start()
         logger.info("Планировщик сообщений запущен")
     
     def stop(self):
         """Остановка планировщика"""
         self.running = False
+        self._wakeup.set()
         logger.info("Планировщик сообщений остановлен")
+
+    def wake(self):
+        """Досрочное пробуждение для пересчёта времени сна"""
+        self._wakeup.set()
+
+    def _on_database_change(self, kind: str, user_id: int):
+        """Реакция на изменение данных в базе"""
+        if kind == "posts":
+            self._wakeup.set()
     
-    async def _scheduler_loop(self):
+    def _scheduler_loop(self):
         """Основной цикл планировщика"""
         while self.running:
+            # Сбрасываем событие до проверки, чтобы не потерять пробуждение
+            self._wakeup.clear()
             try:
-                await self._check_due_posts()
-                await asyncio.sleep(SCHEDULER_CHECK_INTERVAL)
-            except asyncio.CancelledError:
-                break
+                self._check_due_posts_sync()
+                timeout = self._seconds_until_next_post()
             except Exception as e:
                 logger.error(f"Ошибка в планировщике: {e}")
-                await asyncio.sleep(SCHEDULER_CHECK_INTERVAL)
+                timeout = SCHEDULER_CHECK_INTERVAL
+
+            self._wakeup.wait(timeout)
+
+    def _seconds_until_next_post(self) -> Optional[float]:
+        """Время сна до ближайшего поста; None — ждать пробуждения"""
+        return self._sleep_time(self.database.next_due_time())
+
+    def _sleep_time(self, next_due: Optional[float]) -> Optional[float]:
+        """Время сна по времени ближайшего поста.
+
+        next_due учитывает аренду: пост после ошибки или в работе у другого
+        процесса ждёт её окончания, а прошедшее время означает, что пост
+        наступил во время отправки предыдущих и его можно брать сразу.
+        """
+        delay = None
+        if next_due is not None:
+            delay = max(next_due - time.time(), 0.0)
+
+        if self.database.shared:
+            # Посты в общую базу добавляют и другие процессы, а их изменения не будят планировщик
+            return SCHEDULER_CHECK_INTERVAL if delay is None else min(delay, SCHEDULER_CHECK_INTERVAL)
+        return delay
+
+    def _record_lag(self, post: dict):
+        """Учёт задержки срабатывания поста"""
+        scheduled_ts = datetime.fromisoformat(post["schedule_time"]).timestamp()
+        lag = max(time.time() - scheduled_ts, 0.0)
+
+        stats = self.lag_stats
+        stats["count"] += 1
+        stats["total"] += lag
+        stats["last"] = lag
+        stats["max"] = max(stats["max"], lag)
+        metrics.SCHEDULER_LAG_SECONDS.observe(lag)
+        logger.debug(f"Задержка срабатывания поста {post['id']}: {lag:.3f} с")
+
+    def get_lag_stats(self) -> dict:
+        """Сводка по задержке срабатывания"""
+        stats = dict(self.lag_stats)
+        stats["avg"] = stats["total"] / stats["count"] if stats["count"] else 0.0
+        return stats
     
     def _check_due_posts_sync(self):
-        """Проверка и отправка готовых к отправке постов"""
-        due_posts = self.database.get_due_posts()
+        """Аренда и отправка готовых к отправке постов пачками"""
+        while True:
+            # Отсчёт до запроса аренды, чтобы не пережить её срок в базе
+            lease_end = time.monotonic() + SCHEDULER_LEASE_SECONDS
+            due_posts = self.database.claim_due_posts(self.worker_id, SCHEDULER_LEASE_SECONDS, SCHEDULER_CLAIM_BATCH)
+
+            for post in due_posts:
+                if self._lease_expired(lease_end, post):
+                    break
+                try:
+                    self._record_lag(post)
+                    self._send_scheduled_post_sync(post)
+                    self._complete_post_sync(post)
+                except Exception as e:
+                    # Пост остаётся арендованным и будет повторён после окончания аренды
+                    logger.error(f"Ошибка при отправке запланированного поста {post['id']}: {e}")
+
+            if len(due_posts) < SCHEDULER_CLAIM_BATCH:
+                return
+
+    @staticmethod
+    def _lease_expired(lease_end: float, post: dict) -> bool:
+        """Аренда пачки истекла: оставшиеся посты может забрать другой процесс"""
+        if time.monotonic() < lease_end:
+            return False
+        logger.warning(f"Аренда истекла до отправки поста {post['id']}, пост будет захвачен заново")
+        return True
+    
+    def _complete_post_sync(self, post: dict):
+        """Удаление отправленного поста или перенос повторяющегося на следующее срабатывание"""
+        next_time = self._next_run(post)
+        if next_time is None:
+            completed = self.database.remove_scheduled_post(post["id"], self.worker_id)
+        else:
+            completed = self.database.reschedule_post(post["id"], next_time, self.worker_id)
+
+        if not completed:
+            # Аренду перехватил другой обработчик или пост удалили: его запись не трогаем
+            logger.warning(f"Пост {post['id']} отправлен, но аренда уже потеряна: завершение пропущено")
+        elif next_time is None:
+            logger.info(f"Запланированный пост {post['id']} отправлен")
+        else:
+            logger.info(f"Повторяющийся пост {post['id']} отправлен, следующий раз {next_time.isoformat()}")
+    
+    @staticmethod
+    def _next_run(post: dict) -> Optional[datetime]:
+        """Следующее срабатывание повторяющегося поста; None — пост разовый"""
+        rule = post.get("recurrence")
+        if not rule:
+            return None
         
-        for post in due_posts:
-            try:
-                self._send_scheduled_post_sync(post)
-                import asyncio
-                asyncio.run(self.database.remove_scheduled_post(post["id"]))
-                logger.info(f"Запланированный пост {post['id']} отправлен")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке запланированного поста {post['id']}: {e}")
+        # После простоя бота пропущенные срабатывания не догоняем
+        after = max(datetime.now(), datetime.fromisoformat(post["schedule_time"]))
+        next_time = next_occurrence(rule, after)
+        if next_time is None:
+            logger.error(f"Некорректное правило повторения у поста {post['id']}: {rule}")
+        return next_time
     
     def _send_scheduled_post_sync(self, post: dict):
         """Отправка запланированного поста"""
         user_id = post["user_id"]
         message = post["message"]
-        channels = post["channels"]
         
         # Получаем актуальные каналы пользователя
         user_channels = self.database.get_user_channels(user_id)
+        targets = self._scheduled_targets(post, user_channels)
         
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for channel_id in channels:
-            if channel_id not in user_channels:
-                continue
-            
-            try:
-                self.bot.bot.send_message(
-                    chat_id=channel_id,
-                    text=message,
-                    parse_mode='HTML'
-                )
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                channel_title = user_channels.get(channel_id, {}).get('title', channel_id)
-                errors.append(f"❌ {channel_title}: {str(e)}")
+        result, media = self.publisher.publish(
+            targets,
+            message,
+            post.get("media"),
+            dead=self.database.get_dead_channels(targets)
+        )
+        if self._should_save_media(post, media):
+            self.database.set_post_media(post["id"], media)
+        # Временные ошибки досылает очередь повторов: разовый пост сейчас будет удалён
+        self.outbox.defer(result, user_id, message, media)
         
         # Уведомляем пользователя о результатах
-        result_message = f"📊 Результаты отправки запланированного сообщения:\n\n"
-        result_message += f"✅ Успешно отправлено: {success_count}\n"
-        result_message += f"❌ Ошибок: {error_count}\n"
-        
-        if errors:
-            result_message += f"\nОшибки:\n" + "\n".join(errors[:5])  # Показываем первые 5 ошибок
-        
         try:
             self.bot.bot.send_message(
                 chat_id=user_id,
-                text=result_message,
+                text=self._format_result(result),
                 parse_mode='HTML'
             )
         except Exception as e:
             logger.error(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
+
+    @staticmethod
+    def _should_save_media(post: dict, media) -> bool:
+        """Нужно ли сохранить file_id, полученные при первой загрузке вложений"""
+        # Разовый пост после отправки удаляется, file_id пригодятся только повтору
+        return bool(post.get("recurrence")) and media != post.get("media")
+
+    @staticmethod
+    def _scheduled_targets(post: dict, user_channels: Dict[str, dict]) -> Dict[str, str]:
+        """Каналы поста, которые всё ещё есть у пользователя: {channel_id: title}"""
+        return {
+            channel_id: user_channels[channel_id]['title']
+            for channel_id in post["channels"]
+            if channel_id in user_channels
+        }
+
+    @staticmethod
+    def _format_result(result: BroadcastResult) -> str:
+        """Текст уведомления о результатах отправки"""
+        errors = [f"❌ {title}: {error}" for _, title, error in result.errors]
+        
+        result_message = f"📊 Результаты отправки запланированного сообщения:\n\n"
+        result_message += f"✅ Успешно отправлено: {result.success_count}\n"
+        result_message += f"❌ Ошибок: {result.error_count}\n"
+        if result.skipped:
+            result_message += f"⛔ Пропущено недоступных: {len(result.skipped)}\n"
+        if result.deferred:
+            result_message += f"⏳ Отправка повторится позже: {len(result.deferred)}\n"
+        
+        if errors:
+            result_message += f"\nОшибки:\n" + "\n".join(errors[:5])  # Показываем первые 5 ошибок
+        
+        if result.skipped:
+            result_message += "\nБот не может публиковать в:\n" + "\n".join(
+                f"⛔ {title}" for _, title in result.skipped[:5]
+            )
+        
+        return result_message
@@ -0,0 +1,781 @@
+"""
+Хранилище данных бота на SQLite
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime
+
+import metrics
+from database import ImportedPost, content_key, targets_key
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS channels (
+    user_id INTEGER NOT NULL,
+    channel_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    added_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, channel_id)
+);
+
+-- message и channels остались от старого формата и у новых постов пусты:
+-- текст и список каналов хранятся в contents и targets по ссылкам
+CREATE TABLE IF NOT EXISTS scheduled_posts (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    schedule_time TEXT NOT NULL,
+    schedule_ts REAL NOT NULL,
+    channels TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    recurrence TEXT,
+    media TEXT,
+    content_hash TEXT,
+    targets_hash TEXT,
+    lease_owner TEXT,
+    lease_until REAL
+);
+
+CREATE TABLE IF NOT EXISTS contents (
+    hash TEXT PRIMARY KEY,
+    message TEXT NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS targets (
+    hash TEXT PRIMARY KEY,
+    channels TEXT NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS channel_status (
+    channel_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    error TEXT,
+    changed_at TEXT NOT NULL
+);
+
+-- Очередь повторной отправки; next_attempt пуст у недоставленных доставок
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    channel_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    message TEXT NOT NULL,
+    media TEXT,
+    attempts INTEGER NOT NULL,
+    next_attempt REAL,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    failed_at TEXT,
+    lease_owner TEXT,
+    lease_until REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_channels_channel ON channels (channel_id);
+CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox (next_attempt);
+CREATE INDEX IF NOT EXISTS idx_outbox_lease ON outbox (lease_until) WHERE lease_until IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_outbox_failed_at ON outbox (failed_at) WHERE next_attempt IS NULL;
+CREATE INDEX IF NOT EXISTS idx_posts_schedule_time ON scheduled_posts (schedule_ts);
+CREATE INDEX IF NOT EXISTS idx_posts_user ON scheduled_posts (user_id, schedule_ts);
+"""
+
+# Счётчики ссылок на тексты и списки каналов; создаются после _upgrade_schema,
+# когда у таблицы постов точно есть столбцы content_hash и targets_hash
+REFS_SCHEMA = """
+CREATE TRIGGER IF NOT EXISTS posts_add_refs AFTER INSERT ON scheduled_posts BEGIN
+    UPDATE contents SET refs = refs + 1 WHERE hash = new.content_hash;
+    UPDATE targets SET refs = refs + 1 WHERE hash = new.targets_hash;
+END;
+
+CREATE TRIGGER IF NOT EXISTS posts_release_refs AFTER DELETE ON scheduled_posts BEGIN
+    UPDATE contents SET refs = refs - 1 WHERE hash = old.content_hash;
+    DELETE FROM contents WHERE hash = old.content_hash AND refs <= 0;
+    UPDATE targets SET refs = refs - 1 WHERE hash = old.targets_hash;
+    DELETE FROM targets WHERE hash = old.targets_hash AND refs <= 0;
+END;
+"""
+
+SELECT_DELIVERIES = """
+SELECT id, user_id, channel_id, title, message, media, attempts, next_attempt, last_error, created_at, failed_at
+FROM outbox
+"""
+
+SELECT_POSTS = """
+SELECT p.id, p.user_id, p.schedule_time, p.created_at, p.recurrence, p.media, c.message, t.channels
+FROM scheduled_posts p
+JOIN contents c ON c.hash = p.content_hash
+JOIN targets t ON t.hash = p.targets_hash
+"""
+
+class SQLiteDatabase:
+    """Хранилище с тем же API, что и Database, но на SQLite.
+
+    Все выборки идут по индексам: due-посты — диапазон по времени
+    отправки, посты пользователя — по user_id, удаление — по id.
+    Одинаковые тексты и списки каналов хранятся один раз; счётчики
+    ссылок ведут триггеры, они же удаляют записи без ссылок.
+
+    Файл базы могут одновременно использовать несколько процессов бота:
+    планировщики делят готовые посты через аренду (claim_due_posts).
+    """
+
+    shared = True
+
+    def __init__(self, filename: str, json_filename: str = None):
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._upgrade_schema()
+        self._conn.executescript(REFS_SCHEMA)
+        self._intern_legacy_posts()
+        self._listeners = []
+
+        if json_filename:
+            self._migrate_from_json(json_filename)
+
+    def _upgrade_schema(self):
+        """Добавление столбцов, появившихся после создания файла базы"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(scheduled_posts)")}
+        if "recurrence" not in columns:
+            self._conn.execute("ALTER TABLE scheduled_posts ADD COLUMN recurrence TEXT")
+        if "media" not in columns:
+            self._conn.execute("ALTER TABLE scheduled_posts ADD COLUMN media TEXT")
+        if "content_hash" not in columns:
+            self._conn.execute("ALTER TABLE scheduled_posts ADD COLUMN content_hash TEXT")
+            self._conn.execute("ALTER TABLE scheduled_posts ADD COLUMN targets_hash TEXT")
+        if "lease_owner" not in columns:
+            self._conn.execute("ALTER TABLE scheduled_posts ADD COLUMN lease_owner TEXT")
+            self._conn.execute("ALTER TABLE scheduled_posts ADD COLUMN lease_until REAL")
+        # Арендованных постов единицы, индекс нужен next_due_time
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_posts_lease ON scheduled_posts (lease_until) WHERE lease_until IS NOT NULL"
+        )
+
+    def _intern_legacy_posts(self):
+        """Перенос текстов и списков каналов старых постов в contents и targets"""
+        rows = self._conn.execute(
+            "SELECT id, message, channels FROM scheduled_posts WHERE content_hash IS NULL"
+        ).fetchall()
+        if not rows:
+            return
+
+        with self._transaction():
+            for row in rows:
+                content, targets = self._store_body(row["message"], json.loads(row["channels"]))
+                # UPDATE не запускает триггер вставки, поэтому ссылки учитываем сами
+                self._conn.execute("UPDATE contents SET refs = refs + 1 WHERE hash = ?", (content,))
+                self._conn.execute("UPDATE targets SET refs = refs + 1 WHERE hash = ?", (targets,))
+                self._conn.execute(
+                    "UPDATE scheduled_posts SET content_hash = ?, targets_hash = ?, message = '', channels = '' "
+                    "WHERE id = ?",
+                    (content, targets, row["id"])
+                )
+        logger.info(f"Тексты постов перенесены в общее хранилище: {len(rows)}")
+
+    @contextmanager
+    def _write(self, op: str):
+        """Запись под блокировкой с замером длительности"""
+        with self._lock, metrics.STORAGE_WRITE_SECONDS.time(backend="sqlite", op=op):
+            yield
+
+    @contextmanager
+    def _transaction(self, immediate: bool = False):
+        """Явная транзакция поверх режима автофиксации.
+
+        immediate захватывает блокировку записи файла сразу: чтения внутри
+        транзакции тогда не устаревают из-за записей других процессов.
+        """
+        self._conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _store_body(self, message: str, channels: List[str]) -> Tuple[str, str]:
+        """Сохранение текста и списка каналов, если их ещё нет; возвращает их ключи"""
+        content = content_key(message)
+        self._conn.execute(
+            "INSERT INTO contents (hash, message) VALUES (?, ?) ON CONFLICT (hash) DO NOTHING",
+            (content, message)
+        )
+        targets = targets_key(channels)
+        self._conn.execute(
+            "INSERT INTO targets (hash, channels) VALUES (?, ?) ON CONFLICT (hash) DO NOTHING",
+            (targets, json.dumps(channels, ensure_ascii=False))
+        )
+        return content, targets
+
+    def _migrate_from_json(self, json_filename: str):
+        """Однократный перенос данных из JSON-файла.
+
+        Отметка о переносе проверяется под BEGIN IMMEDIATE: из одновременно
+        запущенных экземпляров бота переносит данные только первый.
+        """
+        if not os.path.exists(json_filename):
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                migrated = self._conn.execute(
+                    "SELECT value FROM meta WHERE key = 'migrated_from_json'"
+                ).fetchone()
+                if migrated:
+                    self._conn.execute("COMMIT")
+                    return
+
+                from database import Database
+                json_database = Database(json_filename, storage="json")
+                data = json_database.data
+                now = datetime.now().isoformat()
+
+                for user_id_str, user in data["users"].items():
+                    user_id = int(user_id_str)
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)",
+                        (user_id, now)
+                    )
+                    for channel_id, info in user["channels"].items():
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO channels (user_id, channel_id, title, added_at) "
+                            "VALUES (?, ?, ?, ?)",
+                            (user_id, channel_id, info["title"], info["added_at"])
+                        )
+
+                for post in json_database.get_all_posts():
+                    self._insert_post(post)
+                for delivery in data["outbox"].values():
+                    self._insert_delivery(delivery)
+
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)", (now,)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            logger.info(
+                f"Данные перенесены из {json_filename}: пользователей {len(data['users'])}, "
+                f"постов {len(data['scheduled_posts'])}"
+            )
+
+    def _insert_post(self, post: dict):
+        """Вставка поста в формате словаря Database (вызывается внутри транзакции)"""
+        schedule_time = datetime.fromisoformat(post["schedule_time"])
+        content, targets = self._store_body(post["message"], post["channels"])
+        # Без OR REPLACE: замена строки не запускает триггер удаления и сбила бы счётчики
+        self._conn.execute(
+            "INSERT INTO scheduled_posts "
+            "(id, user_id, message, schedule_time, schedule_ts, channels, created_at, recurrence, media, "
+            "content_hash, targets_hash) "
+            "VALUES (?, ?, '', ?, ?, '', ?, ?, ?, ?, ?)",
+            (
+                post["id"],
+                post["user_id"],
+                post["schedule_time"],
+                schedule_time.timestamp(),
+                post["created_at"],
+                post.get("recurrence"),
+                json.dumps(post["media"], ensure_ascii=False) if post.get("media") else None,
+                content,
+                targets
+            )
+        )
+
+    def _insert_delivery(self, delivery: dict):
+        """Вставка доставки в формате словаря Database"""
+        self._conn.execute(
+            "INSERT INTO outbox "
+            "(id, user_id, channel_id, title, message, media, attempts, next_attempt, last_error, "
+            "created_at, failed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                delivery["id"],
+                delivery["user_id"],
+                delivery["channel_id"],
+                delivery["title"],
+                delivery["message"],
+                json.dumps(delivery["media"], ensure_ascii=False) if delivery.get("media") else None,
+                delivery["attempts"],
+                delivery["next_attempt"],
+                delivery.get("last_error"),
+                delivery["created_at"],
+                delivery.get("failed_at")
+            )
+        )
+
+    def add_listener(self, callback: Callable[[str, int], None]):
+        """Подписка на изменения данных (см. Database.add_listener)"""
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, user_id: int):
+        """Оповещение подписчиков об изменении"""
+        for callback in self._listeners:
+            try:
+                callback(kind, user_id)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике изменений базы данных: {e}")
+
+    @staticmethod
+    def _row_to_post(row: sqlite3.Row) -> dict:
+        """Преобразование строки таблицы в словарь поста"""
+        post = {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "message": row["message"],
+            "schedule_time": row["schedule_time"],
+            "channels": json.loads(row["channels"]),
+            "created_at": row["created_at"]
+        }
+        if row["recurrence"]:
+            post["recurrence"] = row["recurrence"]
+        if row["media"]:
+            post["media"] = json.loads(row["media"])
+        return post
+
+    @staticmethod
+    def _row_to_delivery(row: sqlite3.Row) -> dict:
+        """Преобразование строки очереди повторов в словарь доставки"""
+        delivery = dict(row)
+        delivery["media"] = json.loads(row["media"]) if row["media"] else None
+        if not delivery["failed_at"]:
+            del delivery["failed_at"]
+        return delivery
+
+    def add_user_channel(self, user_id: int, channel_id: str, channel_title: str) -> bool:
+        """Добавление канала/группы для пользователя"""
+        from config import MAX_CHANNELS_PER_USER
+
+        with self._write("set_channel"):
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM channels WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+
+            # Проверка лимита каналов
+            if count >= MAX_CHANNELS_PER_USER:
+                return False
+
+            now = datetime.now().isoformat()
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)",
+                    (user_id, now)
+                )
+                self._conn.execute(
+                    "INSERT INTO channels (user_id, channel_id, title, added_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, channel_id) DO UPDATE SET title = excluded.title, "
+                    "added_at = excluded.added_at",
+                    (user_id, channel_id, channel_title, now)
+                )
+            self._notify("channels", user_id)
+            return True
+
+    def remove_user_channel(self, user_id: int, channel_id: str) -> bool:
+        """Удаление канала/группы пользователя"""
+        with self._write("del_channel"):
+            cursor = self._conn.execute(
+                "DELETE FROM channels WHERE user_id = ? AND channel_id = ?",
+                (user_id, channel_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+
+            # Состояние храним, пока канал есть хотя бы у одного пользователя
+            self._conn.execute(
+                "DELETE FROM channel_status WHERE channel_id = ? "
+                "AND NOT EXISTS (SELECT 1 FROM channels WHERE channel_id = ?)",
+                (channel_id, channel_id)
+            )
+
+            self._notify("channels", user_id)
+            return True
+
+    def get_user_channels(self, user_id: int) -> Dict[str, dict]:
+        """Получение каналов/групп пользователя"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT channel_id, title, added_at FROM channels WHERE user_id = ? ORDER BY rowid",
+                (user_id,)
+            ).fetchall()
+
+        return {
+            row["channel_id"]: {"title": row["title"], "added_at": row["added_at"]}
+            for row in rows
+        }
+
+    def get_user_channels_page(self, user_id: int, offset: int, limit: int) -> Tuple[Dict[str, dict], bool]:
+        """Страница каналов/групп пользователя и признак следующей страницы"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT channel_id, title, added_at FROM channels WHERE user_id = ? "
+                "ORDER BY rowid LIMIT ? OFFSET ?",
+                (user_id, limit + 1, offset)
+            ).fetchall()
+
+        channels = {
+            row["channel_id"]: {"title": row["title"], "added_at": row["added_at"]}
+            for row in rows[:limit]
+        }
+        return channels, len(rows) > limit
+
+    def get_channel_ids(self) -> List[str]:
+        """Все каналы, добавленные хотя бы одним пользователем"""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT channel_id FROM channels").fetchall()
+        return [row["channel_id"] for row in rows]
+
+    def set_channel_status(self, channel_id: str, status: str, error: Optional[str] = None) -> bool:
+        """Запись состояния канала; True — состояние изменилось"""
+        with self._write("set_channel_status"):
+            cursor = self._conn.execute(
+                "INSERT INTO channel_status (channel_id, status, error, changed_at) "
+                "SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM channels WHERE channel_id = ?) "
+                "ON CONFLICT (channel_id) DO UPDATE SET status = excluded.status, "
+                "error = excluded.error, changed_at = excluded.changed_at "
+                "WHERE channel_status.status != excluded.status",
+                (channel_id, status, error, datetime.now().isoformat(), channel_id)
+            )
+            return cursor.rowcount > 0
+
+    def get_channel_status(self, channel_id: str) -> Optional[str]:
+        """Состояние канала; None — канал ещё не проверялся"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM channel_status WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        return row["status"] if row else None
+
+    def get_dead_channels(self, channel_ids: Iterable[str]) -> Set[str]:
+        """Каналы из channel_ids, в которые отправка заведомо невозможна"""
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return set()
+
+        placeholders = ", ".join("?" * len(channel_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT channel_id FROM channel_status WHERE status = 'dead' "
+                f"AND channel_id IN ({placeholders})",
+                channel_ids
+            ).fetchall()
+        return {row["channel_id"] for row in rows}
+
+    def _new_post(self, user_id: int, message: str, schedule_time: datetime,
+                  channels: List[str], taken: Set[str] = frozenset(),
+                  recurrence: Optional[str] = None, media: Optional[List[dict]] = None) -> dict:
+        """Словарь нового поста с ещё не занятым id.
+
+        Вызывается внутри _transaction(immediate=True): проверка id и вставка
+        должны идти под одной блокировкой файла, иначе другой процесс может
+        занять тот же id между ними.
+        """
+        post_id = f"{user_id}_{int(schedule_time.timestamp())}"
+
+        suffix = 1
+        base_id = post_id
+        while post_id in taken or self._conn.execute(
+            "SELECT 1 FROM scheduled_posts WHERE id = ?", (post_id,)
+        ).fetchone():
+            post_id = f"{base_id}_{suffix}"
+            suffix += 1
+
+        post = {
+            "id": post_id,
+            "user_id": user_id,
+            "message": message,
+            "schedule_time": schedule_time.isoformat(),
+            "channels": channels,
+            "created_at": datetime.now().isoformat()
+        }
+        if recurrence:
+            post["recurrence"] = recurrence
+        if media:
+            post["media"] = media
+        return post
+
+    def add_scheduled_post(self, user_id: int, message: str,
+                         schedule_time: datetime, channels: List[str],
+                         recurrence: Optional[str] = None,
+                         media: Optional[List[dict]] = None) -> str:
+        """Добавление запланированного поста (см. Database.add_scheduled_post)"""
+        with self._write("add_post"):
+            with self._transaction(immediate=True):
+                post = self._new_post(user_id, message, schedule_time, channels, recurrence=recurrence, media=media)
+                self._insert_post(post)
+            self._notify("posts", user_id)
+            return post["id"]
+
+    def add_scheduled_posts(self, user_id: int, posts: List[ImportedPost]) -> List[str]:
+        """Добавление пачки постов (message, schedule_time, channels, media) одной транзакцией"""
+        with self._write("add_posts"):
+            post_ids = []
+            taken = set()
+            with self._transaction(immediate=True):
+                for message, schedule_time, channels, media in posts:
+                    post = self._new_post(user_id, message, schedule_time, channels, taken, media=media)
+                    self._insert_post(post)
+                    taken.add(post["id"])
+                    post_ids.append(post["id"])
+
+            if post_ids:
+                self._notify("posts", user_id)
+            return post_ids
+
+    def get_due_posts(self) -> List[dict]:
+        """Получение постов, готовых к отправке и не арендованных (см. Database.get_due_posts)"""
+        now_ts = datetime.now().timestamp()
+        with self._lock:
+            rows = self._conn.execute(
+                SELECT_POSTS + "WHERE p.schedule_ts <= ? AND (p.lease_until IS NULL OR p.lease_until <= ?) "
+                "ORDER BY p.schedule_ts",
+                (now_ts, now_ts)
+            ).fetchall()
+
+        return [self._row_to_post(row) for row in rows]
+
+    def claim_due_posts(self, worker_id: str, lease_seconds: float, limit: Optional[int] = None) -> List[dict]:
+        """Аренда готовых к отправке постов (см. Database.claim_due_posts).
+
+        Выбор свободных постов и запись аренды — один UPDATE, который SQLite
+        выполняет атомарно под блокировкой записи файла, поэтому каждый пост
+        достаётся ровно одному процессу.
+        """
+        now_ts = datetime.now().timestamp()
+        with self._write("claim_posts"):
+            claimed = [row["id"] for row in self._conn.execute(
+                "UPDATE scheduled_posts SET lease_owner = ?, lease_until = ? "
+                "WHERE id IN ("
+                "SELECT id FROM scheduled_posts "
+                "WHERE schedule_ts <= ? AND (lease_until IS NULL OR lease_until <= ?) "
+                "ORDER BY schedule_ts LIMIT ?"
+                ") RETURNING id",
+                (worker_id, now_ts + lease_seconds, now_ts, now_ts, -1 if limit is None else limit)
+            ).fetchall()]
+            if not claimed:
+                return []
+
+            placeholders = ", ".join("?" * len(claimed))
+            rows = self._conn.execute(
+                SELECT_POSTS + f"WHERE p.id IN ({placeholders}) ORDER BY p.schedule_ts",
+                claimed
+            ).fetchall()
+
+        return [self._row_to_post(row) for row in rows]
+
+    def next_due_time(self) -> Optional[float]:
+        """Время (epoch), когда ближайший пост можно будет взять в аренду (см. Database.next_due_time)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(due) FROM ("
+                "SELECT * FROM (SELECT schedule_ts AS due FROM scheduled_posts "
+                "WHERE lease_until IS NULL ORDER BY schedule_ts LIMIT 1) "
+                "UNION ALL "
+                "SELECT MAX(schedule_ts, lease_until) FROM scheduled_posts WHERE lease_until IS NOT NULL"
+                ")"
+            ).fetchone()[0]
+
+    def reschedule_post(self, post_id: str, schedule_time: datetime, worker_id: Optional[str] = None) -> bool:
+        """Перенос поста на новое время (см. Database.reschedule_post)"""
+        with self._write("reschedule_post"):
+            row = self._conn.execute(
+                "UPDATE scheduled_posts SET schedule_time = ?, schedule_ts = ?, lease_owner = NULL, lease_until = NULL "
+                "WHERE id = ? AND (? IS NULL OR lease_owner = ?) RETURNING user_id",
+                (schedule_time.isoformat(), schedule_time.timestamp(), post_id, worker_id, worker_id)
+            ).fetchone()
+            if row is None:
+                return False
+
+            self._notify("posts", row["user_id"])
+            return True
+
+    def set_post_media(self, post_id: str, media: List[dict]) -> bool:
+        """Замена вложений поста (см. Database.set_post_media)"""
+        with self._write("set_post_media"):
+            row = self._conn.execute(
+                "UPDATE scheduled_posts SET media = ? WHERE id = ? RETURNING user_id",
+                (json.dumps(media, ensure_ascii=False), post_id)
+            ).fetchone()
+            if row is None:
+                return False
+
+            self._notify("posts", row["user_id"])
+            return True
+
+    def remove_scheduled_post(self, post_id: str, worker_id: Optional[str] = None) -> bool:
+        """Удаление запланированного поста (worker_id — как в Database.reschedule_post)"""
+        with self._write("del_post"):
+            row = self._conn.execute(
+                "DELETE FROM scheduled_posts WHERE id = ? AND (? IS NULL OR lease_owner = ?) RETURNING user_id",
+                (post_id, worker_id, worker_id)
+            ).fetchone()
+            if row is None:
+                return False
+
+            self._notify("posts", row["user_id"])
+            return True
+
+    def count_scheduled_posts(self) -> int:
+        """Число запланированных постов"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM scheduled_posts").fetchone()[0]
+
+    def get_user_scheduled_posts(self, user_id: int) -> List[dict]:
+        """Получение запланированных постов пользователя"""
+        with self._lock:
+            rows = self._conn.execute(
+                SELECT_POSTS + "WHERE p.user_id = ? ORDER BY p.schedule_ts",
+                (user_id,)
+            ).fetchall()
+
+        return [self._row_to_post(row) for row in rows]
+
+    def get_scheduled_post(self, user_id: int, post_id: str) -> Optional[dict]:
+        """Запланированный пост пользователя по id; None — нет такого поста у пользователя"""
+        with self._lock:
+            row = self._conn.execute(
+                SELECT_POSTS + "WHERE p.id = ? AND p.user_id = ?",
+                (post_id, user_id)
+            ).fetchone()
+
+        return self._row_to_post(row) if row else None
+
+    def get_user_scheduled_posts_page(self, user_id: int, offset: int, limit: int) -> Tuple[List[dict], bool]:
+        """Страница постов пользователя по времени отправки и признак следующей страницы"""
+        with self._lock:
+            rows = self._conn.execute(
+                SELECT_POSTS + "WHERE p.user_id = ? ORDER BY p.schedule_ts, p.id LIMIT ? OFFSET ?",
+                (user_id, limit + 1, offset)
+            ).fetchall()
+
+        return [self._row_to_post(row) for row in rows[:limit]], len(rows) > limit
+
+    def add_deliveries(self, deliveries: List[dict]) -> List[str]:
+        """Постановка доставок в очередь повторов (см. Database.add_deliveries)"""
+        with self._write("add_deliveries"):
+            created_at = datetime.now().isoformat()
+            stored = [dict(delivery, id=uuid.uuid4().hex, created_at=created_at) for delivery in deliveries]
+            with self._transaction():
+                for delivery in stored:
+                    self._insert_delivery(delivery)
+            return [delivery["id"] for delivery in stored]
+
+    def claim_due_deliveries(self, worker_id: str, lease_seconds: float, limit: Optional[int] = None) -> List[dict]:
+        """Аренда доставок, время повтора которых наступило (см. claim_due_posts)"""
+        now_ts = time.time()
+        with self._write("claim_deliveries"):
+            claimed = [row["id"] for row in self._conn.execute(
+                "UPDATE outbox SET lease_owner = ?, lease_until = ? "
+                "WHERE id IN ("
+                "SELECT id FROM outbox "
+                "WHERE next_attempt <= ? AND (lease_until IS NULL OR lease_until <= ?) "
+                "ORDER BY next_attempt LIMIT ?"
+                ") RETURNING id",
+                (worker_id, now_ts + lease_seconds, now_ts, now_ts, -1 if limit is None else limit)
+            ).fetchall()]
+            if not claimed:
+                return []
+
+            placeholders = ", ".join("?" * len(claimed))
+            rows = self._conn.execute(
+                SELECT_DELIVERIES + f"WHERE id IN ({placeholders}) ORDER BY next_attempt",
+                claimed
+            ).fetchall()
+
+        return [self._row_to_delivery(row) for row in rows]
+
+    def next_delivery_time(self) -> Optional[float]:
+        """Время (epoch), когда ближайшую доставку можно будет взять в аренду"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(ready) FROM ("
+                "SELECT * FROM (SELECT next_attempt AS ready FROM outbox "
+                "WHERE next_attempt IS NOT NULL AND lease_until IS NULL ORDER BY next_attempt LIMIT 1) "
+                "UNION ALL "
+                "SELECT MAX(next_attempt, lease_until) FROM outbox "
+                "WHERE lease_until IS NOT NULL AND next_attempt IS NOT NULL"
+                ")"
+            ).fetchone()[0]
+
+    def retry_delivery(self, delivery_id: str, next_attempt: float, error: str,
+                       worker_id: Optional[str] = None) -> bool:
+        """Учёт неудачной попытки и перенос повтора (см. Database.retry_delivery)"""
+        with self._write("retry_delivery"):
+            cursor = self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ?, "
+                "lease_owner = NULL, lease_until = NULL WHERE id = ? AND (? IS NULL OR lease_owner = ?)",
+                (next_attempt, error, delivery_id, worker_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def fail_delivery(self, delivery_id: str, error: str, worker_id: Optional[str] = None) -> bool:
+        """Перенос доставки в недоставленные: повторов больше не будет"""
+        with self._write("fail_delivery"):
+            cursor = self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = NULL, last_error = ?, failed_at = ?, "
+                "lease_owner = NULL, lease_until = NULL WHERE id = ? AND (? IS NULL OR lease_owner = ?)",
+                (error, datetime.now().isoformat(), delivery_id, worker_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def remove_delivery(self, delivery_id: str, worker_id: Optional[str] = None) -> bool:
+        """Удаление доставки из очереди после успешной отправки"""
+        with self._write("del_delivery"):
+            cursor = self._conn.execute(
+                "DELETE FROM outbox WHERE id = ? AND (? IS NULL OR lease_owner = ?)",
+                (delivery_id, worker_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def purge_dead_deliveries(self, failed_before: datetime) -> int:
+        """Удаление недоставленных доставок, перенесённых в недоставленные до failed_before"""
+        with self._write("purge_deliveries"):
+            cursor = self._conn.execute(
+                "DELETE FROM outbox WHERE next_attempt IS NULL AND failed_at < ?",
+                (failed_before.isoformat(),)
+            )
+            return cursor.rowcount
+
+    def get_dead_deliveries(self, user_id: Optional[int] = None) -> List[dict]:
+        """Недоставленные доставки (всех пользователей или одного)"""
+        query = SELECT_DELIVERIES + "WHERE next_attempt IS NULL"
+        params = ()
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params = (user_id,)
+
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY failed_at", params).fetchall()
+        return [self._row_to_delivery(row) for row in rows]
+
+    def count_deliveries(self, dead: bool = False) -> int:
+        """Число доставок, ожидающих повтора, или недоставленных (dead=True)"""
+        condition = "IS NULL" if dead else "IS NOT NULL"
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM outbox WHERE next_attempt {condition}").fetchone()[0]
@@ -0,0 +1,171 @@
+"""
+Хранилище состояний диалогов пользователей
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import USER_STATE_FILE, USER_STATE_MAX_USERS, USER_STATE_PURGE_INTERVAL, USER_STATE_TTL
+
+logger = logging.getLogger(__name__)
+
+class UserState:
+    """Состояние диалога одного пользователя"""
+
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: str, data: Optional[Dict[str, Any]] = None, updated_at: float = 0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+
+class UserStateStore:
+    """Состояния пользователей, которые сейчас находятся в диалоге.
+
+    Запись есть только у пользователя посреди диалога: очистка состояния
+    удаляет её целиком. Записи упорядочены по времени последнего
+    изменения, поэтому брошенные диалоги старше ttl и самые старые
+    записи сверх max_users снимаются с начала без полного обхода.
+    Если задан filename, состояния сохраняются при остановке бота и
+    восстанавливаются при запуске. Диалоги пользователей, которые больше
+    не пишут боту, снимает фоновая очистка (start_purging).
+    """
+
+    def __init__(self, ttl: float = USER_STATE_TTL,
+                 max_users: int = USER_STATE_MAX_USERS,
+                 filename: str = USER_STATE_FILE):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[int, UserState]" = OrderedDict()
+        self._purge_stop = threading.Event()
+        self._purge_thread: Optional[threading.Thread] = None
+
+        if self.filename:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _is_expired(self, user_state: UserState, now: float) -> bool:
+        return now - user_state.updated_at > self.ttl
+
+    def _evict(self, now: float):
+        """Удаление просроченных и лишних записей (вызывается под блокировкой)"""
+        states = self._states
+        while states:
+            user_state = next(iter(states.values()))
+            if len(states) <= self.max_users and not self._is_expired(user_state, now):
+                break
+            states.popitem(last=False)
+
+    def get(self, user_id: int) -> Optional[UserState]:
+        """Состояние пользователя; None — пользователь не в диалоге"""
+        now = time.time()
+        with self._lock:
+            user_state = self._states.get(user_id)
+            if user_state is None:
+                return None
+            if self._is_expired(user_state, now):
+                del self._states[user_id]
+                return None
+            return user_state
+
+    def set(self, user_id: int, state: str, data: Optional[Dict[str, Any]] = None):
+        """Переход пользователя в состояние state с дополнением данных"""
+        now = time.time()
+        with self._lock:
+            user_state = self._states.pop(user_id, None)
+            if user_state is None or self._is_expired(user_state, now):
+                user_state = UserState(state)
+            else:
+                user_state.state = state
+
+            if data:
+                user_state.data.update(data)
+            user_state.updated_at = now
+            self._states[user_id] = user_state
+            self._evict(now)
+
+    def clear(self, user_id: int):
+        """Выход пользователя из диалога"""
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def purge_expired(self) -> int:
+        """Удаление брошенных диалогов; возвращает число удалённых"""
+        with self._lock:
+            before = len(self._states)
+            self._evict(time.time())
+            return before - len(self._states)
+
+    def start_purging(self, interval: float = USER_STATE_PURGE_INTERVAL):
+        """Запуск периодической очистки брошенных диалогов в фоновом потоке"""
+        if self._purge_thread:
+            return
+
+        self._purge_stop.clear()
+        self._purge_thread = threading.Thread(
+            target=self._purge_loop, args=(interval,), name="user-state-purge", daemon=True
+        )
+        self._purge_thread.start()
+
+    def stop_purging(self):
+        """Остановка периодической очистки"""
+        self._purge_stop.set()
+        if self._purge_thread:
+            self._purge_thread.join(timeout=5)
+            self._purge_thread = None
+
+    def _purge_loop(self, interval: float):
+        while not self._purge_stop.wait(interval):
+            purged = self.purge_expired()
+            if purged:
+                logger.info(f"Удалено брошенных диалогов: {purged}")
+
+    def save(self):
+        """Сохранение незавершённых диалогов в файл"""
+        if not self.filename:
+            return
+
+        with self._lock:
+            self._evict(time.time())
+            payload = {
+                str(user_id): [user_state.state, user_state.data, user_state.updated_at]
+                for user_id, user_state in self._states.items()
+            }
+
+        tmp_filename = f"{self.filename}.tmp"
+        try:
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_filename, self.filename)
+            logger.info(f"Сохранено состояний пользователей: {len(payload)}")
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении состояний пользователей: {e}")
+
+    def load(self):
+        """Восстановление диалогов, сохранённых при прошлой остановке"""
+        if not os.path.exists(self.filename):
+            return
+
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Ошибка при загрузке состояний пользователей: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            # Порядок записей должен совпадать с порядком изменения
+            for user_id, (state, data, updated_at) in sorted(payload.items(), key=lambda item: item[1][2]):
+                self._states[int(user_id)] = UserState(state, data, updated_at)
+            self._evict(now)
+        logger.info(f"Восстановлено состояний пользователей: {len(self._states)}")
@@ -0,0 +1,109 @@
+"""
+Приём обновлений через диспетчер: смещение getUpdates и порядок по пользователям
+"""
+
+import threading
+import time
+
+import pytest
+from telebot.types import Update
+
+from bot_client import BotClient
+from dispatcher import UpdateDispatcher
+from rate_limiter import RateLimiter
+
+def make_update(update_id: int, user_id: int = 1) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "text": f"message {update_id}"
+        }
+    })
+
+class PollingBot(BotClient):
+    """BotClient, у которого getUpdates отдаёт неподтверждённые обновления из списка"""
+
+    def __init__(self, pending):
+        super().__init__("123:token", RateLimiter(), threaded=False)
+        self.pending = pending
+        self.offsets = []
+
+    def get_updates(self, offset=None, **kwargs):
+        self.offsets.append(offset)
+        return [update for update in self.pending if update.update_id >= offset]
+
+    def poll_once(self):
+        self._TeleBot__retrieve_updates()
+
+@pytest.fixture
+def polling():
+    """Бот с диспетчером; обработанные обновления — в handled"""
+    created = []
+
+    def make(pending, workers: int = 2):
+        bot = PollingBot(pending)
+        bot.handled = []
+        bot.handled_lock = threading.Lock()
+
+        @bot.message_handler(func=lambda message: True)
+        def record(message):
+            with bot.handled_lock:
+                bot.handled.append((message.from_user.id, message.message_id))
+
+        bot.dispatcher_under_test = UpdateDispatcher(bot.process_update_now, workers=workers, queue_size=100)
+        bot.set_dispatcher(bot.dispatcher_under_test)
+        created.append(bot)
+        return bot
+
+    yield make
+    for bot in created:
+        bot.dispatcher_under_test.stop()
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+def test_polling_advances_offset_before_updates_are_processed(polling):
+    bot = polling([make_update(update_id) for update_id in (1, 2, 3)])
+
+    # Рабочие потоки ещё не запущены: обновления ждут в очередях шардов
+    for _ in range(3):
+        bot.poll_once()
+    assert bot.offsets == [1, 4, 4]
+
+    bot.dispatcher_under_test.start()
+    wait_for(lambda: len(bot.handled) == 3)
+    time.sleep(0.05)
+    assert sorted(bot.handled) == [(1, 1), (1, 2), (1, 3)]
+
+def test_workers_keep_offset_and_per_user_order(polling):
+    updates = [make_update(update_id, user_id=update_id % 3 + 1) for update_id in range(1, 61)]
+    bot = polling(updates, workers=3)
+    bot.dispatcher_under_test.start()
+
+    bot.poll_once()
+    wait_for(lambda: len(bot.handled) == 60)
+
+    assert bot.last_update_id == 60
+    bot.poll_once()
+    assert bot.offsets == [1, 61]
+    for user_id in (1, 2, 3):
+        message_ids = [message_id for handled_user, message_id in bot.handled if handled_user == user_id]
+        assert message_ids == sorted(message_ids) and len(message_ids) == 20
+
+def test_submit_call_runs_after_queued_updates_of_user(polling):
+    bot = polling([make_update(1), make_update(2)], workers=2)
+    bot.poll_once()
+    order = []
+    bot.dispatcher_under_test.submit_call(1, lambda: order.append(list(bot.handled)))
+
+    bot.dispatcher_under_test.start()
+    wait_for(lambda: order)
+
+    assert order == [[(1, 1), (1, 2)]]
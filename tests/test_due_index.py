@@ -0,0 +1,104 @@
+"""
+Индекс времени отправки: куча с ленивым удалением и выборка наступивших постов
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Database
+from sqlite_database import SQLiteDatabase
+
+@pytest.fixture(params=["json", "sqlite"])
+def database(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteDatabase(str(tmp_path / "bot.db"))
+    return Database(str(tmp_path / "data.json"), storage="json")
+
+@pytest.fixture
+def json_database(tmp_path):
+    return Database(str(tmp_path / "data.json"), storage="json")
+
+def at(seconds: float) -> datetime:
+    return datetime.now() + timedelta(seconds=seconds)
+
+def due_ids(database) -> list:
+    return [post["id"] for post in database.get_due_posts()]
+
+def valid_entries(database: Database) -> list:
+    return sorted(entry for entry in database._due_heap if database._is_due_entry_valid(entry))
+
+def test_due_posts_in_schedule_order(database):
+    late = database.add_scheduled_post(1, "late", at(-10), ["@one"])
+    early = database.add_scheduled_post(2, "early", at(-60), ["@one"])
+    database.add_scheduled_post(1, "future", at(60), ["@one"])
+
+    assert due_ids(database) == [early, late]
+    assert database.next_due_time() == pytest.approx(at(-60).timestamp(), abs=1)
+
+def test_rescheduled_and_removed_posts_leave_due_posts(database):
+    moved = database.add_scheduled_post(1, "moved", at(-10), ["@one"])
+    removed = database.add_scheduled_post(1, "removed", at(-20), ["@one"])
+    kept = database.add_scheduled_post(1, "kept", at(-30), ["@one"])
+
+    assert database.reschedule_post(moved, at(3600))
+    assert database.remove_scheduled_post(removed)
+    assert due_ids(database) == [kept]
+
+    assert database.reschedule_post(moved, at(-5))
+    assert due_ids(database) == [kept, moved]
+
+def test_leased_posts_are_not_due_until_lease_ends(database):
+    claimed = database.add_scheduled_post(1, "claimed", at(-20), ["@one"])
+    free = database.add_scheduled_post(1, "free", at(-10), ["@one"])
+
+    assert [post["id"] for post in database.claim_due_posts("a", 60, limit=1)] == [claimed]
+    # Пост, который не удалось отправить, не выдаётся снова, пока он в аренде
+    assert due_ids(database) == [free]
+
+def test_get_due_posts_does_not_touch_the_heap(json_database):
+    for seconds in range(-52, 50, 5):
+        json_database.add_scheduled_post(1, "text", at(seconds), ["@one"])
+    heap = list(json_database._due_heap)
+
+    assert len(json_database.get_due_posts()) == 11
+    assert json_database._due_heap == heap
+
+def test_reschedule_leaves_one_valid_entry(json_database):
+    post_id = json_database.add_scheduled_post(1, "text", at(-10), ["@one"])
+    for minutes in range(1, 6):
+        json_database.reschedule_post(post_id, at(minutes * 60))
+
+    # Старые записи остаются в куче, но действительна только последняя
+    assert len(json_database._due_heap) == 6
+    assert valid_entries(json_database) == [(json_database._post_due_ts[post_id], post_id)]
+    assert json_database.next_due_time() == json_database._post_due_ts[post_id]
+    assert due_ids(json_database) == []
+
+def test_removed_post_entry_is_skipped_lazily(json_database):
+    removed = json_database.add_scheduled_post(1, "removed", at(10), ["@one"])
+    kept = json_database.add_scheduled_post(1, "kept", at(20), ["@one"])
+    json_database.remove_scheduled_post(removed)
+
+    assert len(json_database._due_heap) == 2
+    # next_due_time снимает устаревшую вершину
+    assert json_database.next_due_time() == json_database._post_due_ts[kept]
+    assert json_database._due_heap == [(json_database._post_due_ts[kept], kept)]
+
+def test_heap_is_rebuilt_when_stale_entries_pile_up(json_database):
+    post_ids = [json_database.add_scheduled_post(1, f"text {i}", at(60 + i), ["@one"]) for i in range(200)]
+    moved = post_ids[:10]
+    for post_id in moved:
+        json_database.reschedule_post(post_id, at(-1))
+    for post_id in post_ids[10:150]:
+        json_database.remove_scheduled_post(post_id)
+
+    # Куча перестроена по живым постам и не держит мусор сверх порога
+    remaining = len(json_database._post_ready_ts)
+    assert remaining == 60
+    assert len(json_database._due_heap) <= 2 * remaining + 64
+    assert valid_entries(json_database) == sorted(
+        (ts, post_id) for post_id, ts in json_database._post_ready_ts.items()
+    )
+    assert sorted(due_ids(json_database)) == sorted(moved)
+    assert json_database.next_due_time() == min(json_database._post_due_ts[post_id] for post_id in moved)
@@ -0,0 +1,137 @@
+"""
+Журнал изменений: восстановление после аварийной остановки и сжатие в снимок
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import database as database_module
+from database import Database
+
+def open_journal(tmp_path) -> Database:
+    return Database(str(tmp_path / "data.json"), storage="journal")
+
+def fill(db: Database) -> list:
+    """Набор изменений всех видов; возвращает id оставшихся постов"""
+    db.add_user_channel(1, "@one", "One")
+    db.add_user_channel(1, "@two", "Two")
+    db.add_user_channel(2, "@one", "One")
+    db.remove_user_channel(1, "@two")
+    db.set_channel_status("@one", "dead", "Forbidden")
+
+    when = datetime.now() + timedelta(hours=1)
+    kept = db.add_scheduled_post(1, "text", when, ["@one"])
+    removed = db.add_scheduled_post(1, "text", when, ["@one"])
+    recurring = db.add_scheduled_post(2, "другой текст", when, ["@one"], recurrence="daily")
+    db.reschedule_post(recurring, when + timedelta(days=1))
+    db.remove_scheduled_post(removed)
+
+    delivery_id, = db.add_deliveries([{
+        "user_id": 1, "channel_id": "@one", "title": "One",
+        "message": "text", "media": None, "attempts": 1, "next_attempt": time.time()
+    }])
+    db.retry_delivery(delivery_id, time.time() + 60, "timeout")
+    return [kept, recurring]
+
+def state(db: Database) -> dict:
+    """Содержимое хранилища через публичный API"""
+    return {
+        "channels": {user_id: db.get_user_channels(user_id) for user_id in (1, 2)},
+        "status": db.get_channel_status("@one"),
+        "posts": sorted(db.get_all_posts(), key=lambda post: post["id"]),
+        "next_due": db.next_due_time(),
+        "outbox": db.count_deliveries(),
+        "next_delivery": db.next_delivery_time()
+    }
+
+def test_replay_restores_all_changes(tmp_path):
+    db = open_journal(tmp_path)
+    fill(db)
+    expected = state(db)
+
+    assert state(open_journal(tmp_path)) == expected
+
+def test_replay_stops_at_truncated_last_line(tmp_path):
+    db = open_journal(tmp_path)
+    post_ids = fill(db)
+    expected = state(db)
+    db.add_user_channel(3, "@three", "Three")
+
+    # Аварийная остановка посреди записи последней строки
+    journal = db.journal_filename
+    with open(journal, "rb") as f:
+        content = f.read()
+    with open(journal, "wb") as f:
+        f.write(content[:-10])
+
+    restored = open_journal(tmp_path)
+    assert state(restored) == expected
+    assert restored.get_user_channels(3) == {}
+
+    # Новые записи после восстановления не склеиваются с оборванной строкой
+    restored.remove_scheduled_post(post_ids[0])
+    expected = state(restored)
+    assert state(open_journal(tmp_path)) == expected
+
+def test_compaction_preserves_state(tmp_path):
+    db = open_journal(tmp_path)
+    fill(db)
+    expected = state(db)
+
+    db._compact()
+
+    assert os.path.getsize(db.journal_filename) == 0
+    assert not os.path.exists(db._compacting_filename)
+    assert state(db) == expected
+    assert state(open_journal(tmp_path)) == expected
+    assert state(Database(str(tmp_path / "data.json"), storage="json")) == expected
+
+def test_changes_during_background_compaction_survive(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_module, "JOURNAL_COMPACT_THRESHOLD", 2048)
+    db = open_journal(tmp_path)
+    when = datetime.now() + timedelta(hours=1)
+    for index in range(100):
+        db.add_scheduled_post(1, f"post {index}", when, ["@one"])
+
+    deadline = time.monotonic() + 5
+    while db._compacting and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    expected = state(db)
+    assert len(expected["posts"]) == 100
+    assert state(open_journal(tmp_path)) == expected
+
+def test_interrupted_compaction_is_replayed(tmp_path):
+    db = open_journal(tmp_path)
+    fill(db)
+    expected = state(db)
+
+    # Сжатие прервалось после переноса журнала, но до записи снимка
+    os.replace(db.journal_filename, db._compacting_filename)
+
+    restored = open_journal(tmp_path)
+    assert state(restored) == expected
+    assert not os.path.exists(restored._compacting_filename)
+
+@pytest.mark.parametrize("storage", ["json", "journal"])
+def test_switching_storage_keeps_data(tmp_path, storage):
+    other = "json" if storage == "journal" else "journal"
+    db = Database(str(tmp_path / "data.json"), storage=storage)
+    fill(db)
+    expected = state(db)
+
+    assert state(Database(str(tmp_path / "data.json"), storage=other)) == expected
+
+@pytest.mark.parametrize("storage", ["json", "journal"])
+def test_snapshot_stores_posts_as_list(tmp_path, storage):
+    db = Database(str(tmp_path / "data.json"), storage=storage)
+    post_ids = fill(db)
+    db._write_snapshot()
+
+    with open(db.filename, encoding="utf-8") as f:
+        stored = json.load(f)["scheduled_posts"]
+    assert sorted(post["id"] for post in stored) == sorted(post_ids)
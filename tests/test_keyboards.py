@@ -0,0 +1,62 @@
+"""
+Кэш клавиатур: сброс по уведомлениям базы и выключение при общей базе
+"""
+
+from keyboards import KeyboardCache
+
+class FakeDatabase:
+    """Минимальная база: только подписка на изменения"""
+
+    def __init__(self, shared: bool = False):
+        self.shared = shared
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, kind: str, user_id: int):
+        for listener in self.listeners:
+            listener(kind, user_id)
+
+def test_cached_value_is_dropped_on_change():
+    database = FakeDatabase()
+    cache = KeyboardCache(database)
+
+    assert cache.get(1, "posts", 0, lambda: "old") == "old"
+    assert cache.get(1, "posts", 0, lambda: "new") == "old"
+    database.notify("posts", 1)
+    assert cache.get(1, "posts", 0, lambda: "new") == "new"
+
+def test_change_of_uncached_user_does_not_take_a_slot():
+    database = FakeDatabase()
+    cache = KeyboardCache(database, max_users=2)
+    cache.get(1, "channels", 0, lambda: "first")
+
+    for user_id in range(100, 200):
+        database.notify("channels", user_id)
+
+    assert list(cache._users) == [1]
+    assert cache.get(1, "channels", 0, lambda: "rebuilt") == "first"
+
+def test_value_built_before_change_is_not_stored():
+    database = FakeDatabase()
+    cache = KeyboardCache(database)
+
+    value, token = cache.lookup(1, "posts", 0)
+    assert value is cache.MISSING
+    database.notify("posts", 1)
+    cache.store(1, "posts", 0, "stale", token)
+    assert cache.lookup(1, "posts", 0)[0] is cache.MISSING
+
+    # Пользователь вытеснен между lookup() и store(): значение тоже не сохраняется
+    value, token = cache.lookup(2, "posts", 0)
+    cache._users.clear()
+    cache.store(2, "posts", 0, "stale", token)
+    assert 2 not in cache._users
+
+def test_cache_is_disabled_for_shared_database():
+    cache = KeyboardCache(FakeDatabase(shared=True))
+
+    assert cache.get(1, "posts", 0, lambda: "first") == "first"
+    assert cache.get(1, "posts", 0, lambda: "second") == "second"
+    assert not cache._users
@@ -0,0 +1,124 @@
+"""
+Аренда запланированных постов: захват, истечение и завершение только владельцем
+"""
+
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Database
+from sqlite_database import SQLiteDatabase
+
+LEASE = 0.2
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(params=["json", "journal", "sqlite"])
+def database(request, tmp_path):
+    """Хранилище каждого вида в отдельном каталоге"""
+    if request.param == "sqlite":
+        return SQLiteDatabase(str(tmp_path / "bot.db"))
+    return Database(str(tmp_path / "data.json"), storage=request.param)
+
+def add_post(database, seconds: float = -1.0) -> str:
+    """Пост, который наступает через seconds секунд (по умолчанию уже наступил)"""
+    return database.add_scheduled_post(
+        1, "text", datetime.now() + timedelta(seconds=seconds), ["@channel"]
+    )
+
+def test_claimed_post_is_not_claimed_again_until_lease_expires(database):
+    post_id = add_post(database)
+
+    assert [post["id"] for post in database.claim_due_posts("a", LEASE)] == [post_id]
+    assert database.claim_due_posts("b", LEASE) == []
+
+    time.sleep(LEASE * 1.5)
+    assert [post["id"] for post in database.claim_due_posts("b", LEASE)] == [post_id]
+
+def test_future_post_is_not_claimed(database):
+    add_post(database, seconds=60)
+
+    assert database.claim_due_posts("a", LEASE) == []
+
+def test_claim_respects_limit(database):
+    for _ in range(3):
+        add_post(database)
+
+    assert len(database.claim_due_posts("a", LEASE, limit=2)) == 2
+    assert len(database.claim_due_posts("b", LEASE, limit=2)) == 1
+
+def test_next_due_time_waits_for_lease_end(database):
+    add_post(database)
+    later_id = add_post(database, seconds=60)
+    database.claim_due_posts("a", LEASE, limit=1)
+
+    # Наступивший пост арендован: раньше окончания аренды будить планировщик незачем
+    due_time = database.next_due_time()
+    assert time.time() < due_time <= time.time() + LEASE
+
+    database.remove_scheduled_post(later_id)
+    assert database.next_due_time() == pytest.approx(due_time)
+
+def test_completion_requires_lease_owner(database):
+    post_id = add_post(database)
+    database.claim_due_posts("a", LEASE)
+
+    assert not database.reschedule_post(post_id, datetime.now() + timedelta(hours=1), "b")
+    assert not database.remove_scheduled_post(post_id, "b")
+    assert database.remove_scheduled_post(post_id, "a")
+    assert database.count_scheduled_posts() == 0
+
+def test_reschedule_releases_lease(database):
+    post_id = add_post(database)
+    database.claim_due_posts("a", LEASE)
+
+    new_time = datetime.now() - timedelta(seconds=1)
+    assert database.reschedule_post(post_id, new_time, "a")
+    assert database.next_due_time() == pytest.approx(new_time.timestamp())
+    assert [post["id"] for post in database.claim_due_posts("b", LEASE)] == [post_id]
+
+def test_stale_completion_from_second_process_is_dropped(tmp_path):
+    filename = str(tmp_path / "bot.db")
+    first, second = SQLiteDatabase(filename), SQLiteDatabase(filename)
+    post_id = add_post(first)
+
+    assert [post["id"] for post in first.claim_due_posts("a", LEASE)] == [post_id]
+    time.sleep(LEASE * 1.5)
+    assert [post["id"] for post in second.claim_due_posts("b", LEASE)] == [post_id]
+
+    # Первый процесс закончил отправку после истечения аренды: его перенос не применяется
+    assert not first.reschedule_post(post_id, datetime.now() + timedelta(hours=1), "a")
+    assert second.remove_scheduled_post(post_id, "b")
+    assert first.count_scheduled_posts() == 0
+
+def test_json_file_is_refused_to_second_process(tmp_path):
+    filename = str(tmp_path / "data.json")
+    Database(filename, storage="journal")
+
+    script = (
+        "import sys\n"
+        "from database import Database, DatabaseInUse\n"
+        "try:\n"
+        "    Database(sys.argv[1], storage='journal')\n"
+        "except DatabaseInUse:\n"
+        "    sys.exit(3)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script, filename], cwd=ROOT)
+    assert result.returncode == 3
+
+def test_leased_posts_leave_the_due_heap_until_lease_ends(tmp_path):
+    database = Database(str(tmp_path / "data.json"), storage="json")
+    for _ in range(50):
+        add_post(database)
+    later = add_post(database, seconds=60)
+
+    claimed = database.claim_due_posts("a", 60)
+    assert len(claimed) == 50
+    # Арендованные посты стоят в куче по окончании аренды, а не по времени отправки
+    valid = [entry for entry in database._due_heap if database._is_due_entry_valid(entry)]
+    assert len(valid) == 51
+    assert database.next_due_time() == pytest.approx(database._post_due_ts[later])
+    assert database.claim_due_posts("b", LEASE) == []
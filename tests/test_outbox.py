@@ -0,0 +1,242 @@
+"""
+Очередь повторной отправки: паузы между попытками и перенос в недоставленные
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+import outbox as outbox_module
+from broadcaster import BroadcastResult
+from config import OUTBOX_BASE_DELAY, OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_DELAY
+from database import AsyncDatabase, Database
+from outbox import AsyncOutbox, Outbox, backoff_delay, retry_delay
+from sqlite_database import SQLiteDatabase
+
+def api_error(code: int, retry_after: int = 0) -> ApiTelegramException:
+    result_json = {"ok": False, "error_code": code, "description": "error"}
+    if retry_after:
+        result_json["parameters"] = {"retry_after": retry_after}
+    return ApiTelegramException("sendMessage", None, result_json)
+
+class FakeBot:
+    """Уведомления пользователю"""
+
+    def __init__(self):
+        self.notifications = []
+
+    def send_message(self, chat_id, text):
+        self.notifications.append((chat_id, text))
+
+class FailingPublisher:
+    """Отправка в канал, которая падает с заданными ошибками, затем проходит"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send(self, chat_id, text, media=None):
+        self.sent.append(chat_id)
+        if self.errors:
+            raise self.errors.pop(0)
+
+@pytest.fixture(params=["json", "sqlite"])
+def database(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteDatabase(str(tmp_path / "bot.db"))
+    return Database(str(tmp_path / "data.json"), storage="json")
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """Повтор сразу, чтобы прогнать все попытки без ожидания"""
+    monkeypatch.setattr(outbox_module, "retry_delay", lambda error, attempts: 0.0)
+
+def make_outbox(database, errors) -> Outbox:
+    outbox = Outbox(FakeBot(), database, FailingPublisher(errors))
+    # Цикл не запускаем: попытки выполняются вызовами _drain из теста
+    outbox.running = True
+    return outbox
+
+def defer_one(outbox: Outbox, error: Exception) -> BroadcastResult:
+    result = BroadcastResult()
+    result.add_error("@channel", "Channel", error)
+    assert outbox.defer(result, 1, "text") == 1
+    return result
+
+@pytest.mark.parametrize("attempts", range(1, 16))
+def test_backoff_stays_within_bounds(attempts):
+    random.seed(attempts)
+    cap = min(OUTBOX_BASE_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_DELAY)
+
+    delays = [backoff_delay(attempts) for _ in range(200)]
+
+    assert all(cap / 2 <= delay <= cap for delay in delays)
+    assert max(delays) <= OUTBOX_MAX_DELAY
+
+def test_backoff_grows_until_cap():
+    random.seed(0)
+    means = [sum(backoff_delay(attempts) for _ in range(200)) / 200 for attempts in range(1, 16)]
+
+    assert means[1] > means[0]
+    assert means[-1] == pytest.approx(0.75 * OUTBOX_MAX_DELAY, rel=0.1)
+
+def test_retry_delay_honours_retry_after():
+    retry_after = OUTBOX_MAX_DELAY * 2
+
+    assert retry_delay(api_error(429, retry_after), 1) == retry_after
+    assert retry_delay(api_error(429), 1) <= OUTBOX_BASE_DELAY
+    assert retry_delay(ConnectionError("reset"), 1) <= OUTBOX_BASE_DELAY
+
+def test_deferred_delivery_waits_for_retry_after(database):
+    outbox = make_outbox(database, [])
+    before = time.time()
+    result = defer_one(outbox, api_error(429, retry_after=600))
+
+    assert result.transient == [] and result.deferred == [("@channel", "Channel")]
+    assert database.next_delivery_time() >= before + 600
+    outbox._drain()
+    assert outbox.publisher.sent == []
+
+def test_transient_errors_move_to_dead_after_max_attempts(database, no_backoff):
+    outbox = make_outbox(database, [ConnectionError("reset")] * OUTBOX_MAX_ATTEMPTS)
+    defer_one(outbox, api_error(502))
+
+    # Первая попытка сделана рассылкой, остальные — очередью
+    for _ in range(OUTBOX_MAX_ATTEMPTS - 1):
+        assert database.count_deliveries() == 1
+        outbox._drain()
+
+    assert len(outbox.publisher.sent) == OUTBOX_MAX_ATTEMPTS - 1
+    assert database.count_deliveries() == 0
+    dead, = database.get_dead_deliveries(1)
+    assert dead["attempts"] == OUTBOX_MAX_ATTEMPTS
+    assert dead["last_error"] == "reset"
+    assert database.next_delivery_time() is None
+    assert outbox.bot.notifications == [
+        (1, outbox._dead_text(dict(dead, attempts=OUTBOX_MAX_ATTEMPTS - 1), "reset"))
+    ]
+
+def test_permanent_error_moves_to_dead_at_once(database, no_backoff):
+    outbox = make_outbox(database, [api_error(403)])
+    defer_one(outbox, api_error(502))
+
+    outbox._drain()
+
+    assert database.count_deliveries() == 0
+    assert database.count_deliveries(dead=True) == 1
+    assert len(outbox.bot.notifications) == 1
+
+def test_dead_channel_is_not_retried(database, no_backoff):
+    outbox = make_outbox(database, [])
+    defer_one(outbox, api_error(502))
+    database.add_user_channel(1, "@channel", "Channel")
+    assert database.set_channel_status("@channel", "dead", "Forbidden")
+
+    outbox._drain()
+
+    assert outbox.publisher.sent == []
+    assert database.count_deliveries(dead=True) == 1
+
+def test_successful_retry_removes_delivery(database, no_backoff):
+    outbox = make_outbox(database, [ConnectionError("reset")])
+    defer_one(outbox, api_error(502))
+
+    outbox._drain()
+    outbox._drain()
+
+    assert outbox.publisher.sent == ["@channel", "@channel"]
+    assert database.count_deliveries() == 0
+    assert database.count_deliveries(dead=True) == 0
+    assert len(outbox.bot.notifications) == 1
+
+class AsyncFakeBot(FakeBot):
+    async def send_message(self, chat_id, text):
+        super().send_message(chat_id, text)
+
+class AsyncFailingPublisher(FailingPublisher):
+    async def send(self, chat_id, text, media=None):
+        super().send(chat_id, text, media)
+
+def test_async_outbox_moves_to_dead_after_max_attempts(database, no_backoff):
+    async def run():
+        async_database = AsyncDatabase(database)
+        outbox = AsyncOutbox(
+            AsyncFakeBot(), async_database, AsyncFailingPublisher([ConnectionError("reset")] * OUTBOX_MAX_ATTEMPTS)
+        )
+        outbox.running = True
+        result = BroadcastResult()
+        result.add_error("@channel", "Channel", api_error(502))
+        assert await outbox.defer(result, 1, "text") == 1
+
+        for _ in range(OUTBOX_MAX_ATTEMPTS - 1):
+            await outbox._drain()
+        return outbox
+
+    outbox = asyncio.run(run())
+
+    assert len(outbox.publisher.sent) == OUTBOX_MAX_ATTEMPTS - 1
+    assert database.count_deliveries(dead=True) == 1
+    assert len(outbox.bot.notifications) == 1
+
+def add_delivery(database, next_attempt: float) -> str:
+    delivery_id, = database.add_deliveries([{
+        "user_id": 1, "channel_id": "@channel", "title": "Channel", "message": "text",
+        "media": None, "attempts": 1, "next_attempt": next_attempt, "last_error": "timeout"
+    }])
+    return delivery_id
+
+def test_claim_skips_leased_and_future_deliveries(database):
+    now = time.time()
+    first, second = add_delivery(database, now - 2), add_delivery(database, now - 1)
+    add_delivery(database, now + 600)
+
+    assert [delivery["id"] for delivery in database.claim_due_deliveries("a", 60, limit=1)] == [first]
+    assert [delivery["id"] for delivery in database.claim_due_deliveries("b", 60)] == [second]
+    assert database.claim_due_deliveries("c", 60) == []
+    assert database.next_delivery_time() == pytest.approx(now + 60, abs=1)
+
+def test_expired_lease_makes_delivery_claimable_again(database):
+    delivery_id = add_delivery(database, time.time() - 1)
+    database.claim_due_deliveries("a", 0.1)
+
+    time.sleep(0.2)
+    assert database.next_delivery_time() <= time.time()
+    assert [delivery["id"] for delivery in database.claim_due_deliveries("b", 60)] == [delivery_id]
+
+def test_stale_worker_cannot_change_delivery(database):
+    delivery_id = add_delivery(database, time.time() - 1)
+    database.claim_due_deliveries("a", 0.1)
+    time.sleep(0.2)
+    database.claim_due_deliveries("b", 60)
+
+    assert not database.retry_delivery(delivery_id, time.time() + 60, "late", "a")
+    assert not database.fail_delivery(delivery_id, "late", "a")
+    assert not database.remove_delivery(delivery_id, "a")
+    assert database.remove_delivery(delivery_id, "b")
+    assert database.count_deliveries() == 0
+
+def test_outbox_drops_completion_after_losing_lease(database, no_backoff):
+    outbox = make_outbox(database, [])
+    add_delivery(database, time.time() - 1)
+    delivery, = database.claim_due_deliveries("someone-else", 60)
+
+    outbox._deliver(delivery)
+
+    assert database.count_deliveries() == 1
+    assert outbox.bot.notifications == []
+
+def test_purge_removes_only_old_dead_deliveries(database, no_backoff):
+    for _ in range(3):
+        add_delivery(database, time.time() - 1)
+    for delivery in database.claim_due_deliveries("a", 60, limit=2):
+        database.fail_delivery(delivery["id"], "forbidden", "a")
+
+    assert database.purge_dead_deliveries(datetime.now() - timedelta(days=1)) == 0
+    assert database.purge_dead_deliveries(datetime.now() + timedelta(seconds=1)) == 2
+    assert database.count_deliveries(dead=True) == 0
+    assert database.count_deliveries() == 1
+    assert database.next_delivery_time() is not None
@@ -0,0 +1,170 @@
+"""
+Ограничитель запросов к Bot API: корзины токенов, пауза по 429 и повторы
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from telebot.apihelper import ApiHTTPException, ApiInvalidJSONException, ApiTelegramException
+from telebot.asyncio_helper import RequestTimeout
+
+import rate_limiter as rate_limiter_module
+from rate_limiter import RateLimiter, is_transient_error, server_retry_after
+
+def api_error(code: int, retry_after: int = 0) -> ApiTelegramException:
+    result_json = {"ok": False, "error_code": code, "description": "error"}
+    if retry_after:
+        result_json["parameters"] = {"retry_after": retry_after}
+    return ApiTelegramException("sendMessage", None, result_json)
+
+def http_error(status: int) -> ApiHTTPException:
+    return ApiHTTPException("sendMessage", SimpleNamespace(status_code=status, reason="error", text=""))
+
+class FakeClock:
+    """Монотонные часы, которые двигает только sleep()"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter_module.time, "sleep", clock.sleep)
+    return clock
+
+def make_limiter(**kwargs) -> RateLimiter:
+    options = dict(global_per_second=30, private_per_second=1, group_per_minute=20, chat_burst=3, max_retries=2)
+    options.update(kwargs)
+    return RateLimiter(**options)
+
+def test_private_chat_waits_after_burst(clock):
+    limiter = make_limiter()
+
+    for _ in range(3):
+        limiter.acquire(1)
+    assert clock.sleeps == []
+
+    limiter.acquire(1)
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+def test_group_chat_gets_twenty_messages_per_minute(clock):
+    limiter = make_limiter()
+
+    for _ in range(4):
+        limiter.acquire(-100123)
+    assert clock.sleeps == [pytest.approx(3.0)]
+
+def test_global_bucket_limits_all_chats(clock):
+    limiter = make_limiter(global_per_second=2)
+
+    limiter.acquire(1)
+    limiter.acquire(2)
+    assert clock.sleeps == []
+
+    # Корзина нового чата полна, ждать приходится глобальную
+    limiter.acquire(3)
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+def test_retry_after_blocks_chat_and_retries(clock):
+    limiter = make_limiter()
+    errors = [api_error(429, retry_after=7)]
+    calls = []
+
+    def send():
+        calls.append(clock.now)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert limiter.call(1, send) == "ok"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] == pytest.approx(7)
+    assert limiter.throttled_count == 1
+
+    # Другой чат пауза не задевает
+    started = clock.now
+    limiter.acquire(2)
+    assert clock.now == started
+
+def test_retries_stop_after_max_retries(clock):
+    limiter = make_limiter(max_retries=2)
+    calls = []
+
+    def send():
+        calls.append(clock.now)
+        raise api_error(429)
+
+    with pytest.raises(ApiTelegramException):
+        limiter.call(1, send)
+    # Первая попытка и два повтора; без retry_after пауза — одна секунда
+    assert len(calls) == 3
+    assert limiter.throttled_count == 2
+
+def test_other_errors_are_not_retried(clock):
+    limiter = make_limiter()
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise api_error(400)
+
+    with pytest.raises(ApiTelegramException):
+        limiter.call(1, send)
+    assert calls == [1]
+    assert limiter.throttled_count == 0
+
+def test_prune_forgets_idle_chats_only(clock):
+    limiter = make_limiter()
+    limiter.acquire(1)
+    limiter.acquire(2)
+    limiter.block(3, 60)
+
+    # Через 3 секунды корзины чатов 1 и 2 снова полны
+    clock.now += 3
+    limiter._prune(clock.now)
+    assert list(limiter._chats) == ["3"]
+
+    clock.now += 60
+    limiter._prune(clock.now)
+    assert limiter._chats == {}
+
+def test_prune_runs_when_threshold_is_reached(clock, monkeypatch):
+    monkeypatch.setattr(RateLimiter, "PRUNE_THRESHOLD", 5)
+    limiter = make_limiter(global_per_second=1000)
+    for chat_id in range(1, 6):
+        limiter.acquire(chat_id)
+
+    clock.now += 10
+    limiter.acquire(6)
+    assert list(limiter._chats) == ["6"]
+
+def test_server_retry_after():
+    assert server_retry_after(api_error(429, retry_after=15)) == 15
+    assert server_retry_after(api_error(429)) == 0
+    assert server_retry_after(OSError("reset")) == 0
+
+@pytest.mark.parametrize("error, transient", [
+    (api_error(429), True),
+    (api_error(502), True),
+    (api_error(400), False),
+    (api_error(403), False),
+    (http_error(503), True),
+    (http_error(429), True),
+    (http_error(404), False),
+    (ApiInvalidJSONException("sendMessage", SimpleNamespace(text="<html>")), True),
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (RequestTimeout(), True),
+    (ValueError("bad"), False),
+])
+def test_is_transient_error(error, transient):
+    assert is_transient_error(error) == transient
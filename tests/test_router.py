@@ -0,0 +1,43 @@
+"""
+Маршруты инлайн-кнопок: новый формат "route:arg" и старые префиксы
+"""
+
+import pytest
+
+import metrics
+from router import CallbackRouter
+
+@pytest.fixture
+def router():
+    calls = []
+    router = CallbackRouter()
+    router.route("remove_channel", lambda call, user_id: calls.append(("remove_channel",)))
+    router.prefix("remove_ch", lambda call, user_id, arg: calls.append(("remove_ch", arg)))
+    router.prefix("remove_page", lambda call, user_id, page: calls.append(("remove_page", page)), int)
+    router.legacy_prefix("remove_ch_", "remove_ch")
+    router.calls = calls
+    return router
+
+def test_routes_and_legacy_prefix(router):
+    for data in ("remove_channel", "remove_ch:-100123", "remove_ch_-100456", "remove_page:2"):
+        assert router.dispatch(data, None, 1)
+
+    assert router.calls == [
+        ("remove_channel",), ("remove_ch", "-100123"), ("remove_ch", "-100456"), ("remove_page", 2)
+    ]
+
+def test_unknown_and_malformed_data(router):
+    assert not router.dispatch("remove_chx", None, 1)
+    assert not router.dispatch("remove_page:x", None, 1)
+    assert router.calls == []
+
+def test_legacy_prefix_requires_registered_route(router):
+    with pytest.raises(ValueError):
+        router.legacy_prefix("delete_scheduled_", "delete_scheduled")
+
+def test_handler_errors_are_counted(router):
+    router.prefix("fail", lambda call, user_id, arg: 1 / 0)
+
+    with pytest.raises(ZeroDivisionError):
+        router.dispatch("fail:1", None, 1)
+    assert 'callback_route_errors_total{route="fail"} 1' in metrics.REGISTRY.render()
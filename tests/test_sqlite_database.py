@@ -0,0 +1,147 @@
+"""
+Хранилище SQLite: перенос из JSON, счётчики ссылок и обновление старых файлов
+"""
+
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from database import Database, content_key, targets_key
+from sqlite_database import SQLiteDatabase
+
+# Таблица постов в первой версии файла базы
+OLD_POSTS_SCHEMA = """
+CREATE TABLE scheduled_posts (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    schedule_time TEXT NOT NULL,
+    schedule_ts REAL NOT NULL,
+    channels TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+WHEN = datetime.now().replace(microsecond=0) + timedelta(hours=1)
+
+def body_refs(database: SQLiteDatabase) -> dict:
+    """Счётчики ссылок: {"contents": {hash: refs}, "targets": {hash: refs}}"""
+    return {
+        table: {row["hash"]: row["refs"] for row in database._conn.execute(f"SELECT hash, refs FROM {table}")}
+        for table in ("contents", "targets")
+    }
+
+def fill_json(filename: str) -> dict:
+    """JSON-база с каналами, постами и доставкой; возвращает её содержимое"""
+    db = Database(filename, storage="json")
+    db.add_user_channel(1, "@one", "One")
+    db.add_user_channel(2, "@two", "Two")
+    db.add_scheduled_post(1, "text", WHEN, ["@one"])
+    db.add_scheduled_post(2, "другой текст", WHEN, ["@two"], recurrence="daily",
+                          media=[{"type": "photo", "url": "https://example.com/1.jpg"}])
+    db.add_deliveries([{
+        "user_id": 1, "channel_id": "@one", "title": "One",
+        "message": "text", "media": None, "attempts": 1, "next_attempt": time.time() + 60
+    }])
+    return {
+        "channels": {user_id: db.get_user_channels(user_id) for user_id in (1, 2)},
+        # Ключи общих текстов и списков каналов есть только у постов Database
+        "posts": {
+            user_id: [
+                {key: value for key, value in post.items() if key not in ("content", "targets")}
+                for post in db.get_user_scheduled_posts(user_id)
+            ]
+            for user_id in (1, 2)
+        },
+        "outbox": db.count_deliveries()
+    }
+
+def test_migration_from_json_copies_all_data(tmp_path):
+    json_filename = str(tmp_path / "data.json")
+    expected = fill_json(json_filename)
+
+    database = SQLiteDatabase(str(tmp_path / "bot.db"), json_filename=json_filename)
+
+    assert {user_id: database.get_user_channels(user_id) for user_id in (1, 2)} == expected["channels"]
+    assert {user_id: database.get_user_scheduled_posts(user_id) for user_id in (1, 2)} == expected["posts"]
+    assert database.count_deliveries() == expected["outbox"]
+    assert body_refs(database) == {
+        "contents": {content_key("text"): 1, content_key("другой текст"): 1},
+        "targets": {targets_key(["@one"]): 1, targets_key(["@two"]): 1}
+    }
+
+def test_migration_runs_only_once(tmp_path):
+    json_filename = str(tmp_path / "data.json")
+    fill_json(json_filename)
+    filename = str(tmp_path / "bot.db")
+
+    database = SQLiteDatabase(filename, json_filename=json_filename)
+    post_id = database.get_user_scheduled_posts(1)[0]["id"]
+    assert database.remove_scheduled_post(post_id)
+
+    # Повторный запуск с тем же JSON-файлом не возвращает удалённый пост
+    reopened = SQLiteDatabase(filename, json_filename=json_filename)
+    assert reopened.get_user_scheduled_posts(1) == []
+    assert reopened.count_scheduled_posts() == 1
+
+def test_shared_bodies_are_released_with_the_last_post(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / "bot.db"))
+    first = database.add_scheduled_post(1, "text", WHEN, ["@one", "@two"])
+    second = database.add_scheduled_post(1, "text", WHEN + timedelta(minutes=1), ["@one", "@two"])
+    other = database.add_scheduled_post(2, "text", WHEN, ["@three"])
+
+    content, targets = content_key("text"), targets_key(["@one", "@two"])
+    refs = body_refs(database)
+    assert refs["contents"] == {content: 3}
+    assert refs["targets"] == {targets: 2, targets_key(["@three"]): 1}
+
+    assert database.remove_scheduled_post(first)
+    refs = body_refs(database)
+    assert refs["contents"] == {content: 2}
+    assert refs["targets"][targets] == 1
+
+    assert database.remove_scheduled_post(second)
+    assert body_refs(database)["targets"] == {targets_key(["@three"]): 1}
+
+    assert database.remove_scheduled_post(other)
+    assert body_refs(database) == {"contents": {}, "targets": {}}
+
+def test_old_file_is_upgraded_and_legacy_posts_interned(tmp_path):
+    filename = str(tmp_path / "bot.db")
+    conn = sqlite3.connect(filename)
+    conn.executescript(OLD_POSTS_SCHEMA)
+    for post_id, message, channels in (
+        ("1_a", "text", ["@one"]),
+        ("1_b", "text", ["@one"]),
+        ("1_c", "другой текст", ["@one", "@two"])
+    ):
+        conn.execute(
+            "INSERT INTO scheduled_posts VALUES (?, 1, ?, ?, ?, ?, ?)",
+            (post_id, message, WHEN.isoformat(), WHEN.timestamp(), json.dumps(channels), WHEN.isoformat())
+        )
+    conn.commit()
+    conn.close()
+
+    database = SQLiteDatabase(filename)
+
+    columns = {row["name"] for row in database._conn.execute("PRAGMA table_info(scheduled_posts)")}
+    assert {"recurrence", "media", "content_hash", "targets_hash", "lease_owner", "lease_until"} <= columns
+    assert database._conn.execute(
+        "SELECT COUNT(*) FROM scheduled_posts WHERE content_hash IS NULL OR message != ''"
+    ).fetchone()[0] == 0
+    assert body_refs(database) == {
+        "contents": {content_key("text"): 2, content_key("другой текст"): 1},
+        "targets": {targets_key(["@one"]): 2, targets_key(["@one", "@two"]): 1}
+    }
+
+    posts = {post["id"]: post for post in database.get_user_scheduled_posts(1)}
+    assert posts["1_a"]["message"] == "text" and posts["1_a"]["channels"] == ["@one"]
+    assert posts["1_c"]["channels"] == ["@one", "@two"]
+
+    # После переноса удаление освобождает ссылки так же, как у новых постов
+    assert database.remove_scheduled_post("1_c")
+    assert body_refs(database)["contents"] == {content_key("text"): 2}
+
+    # Повторное открытие обновлённого файла ничего не меняет
+    assert body_refs(SQLiteDatabase(filename)) == body_refs(database)
@@ -0,0 +1,68 @@
+"""
+Проверка секрета и ограниченной очереди webhook-сервера
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from webhook import WebhookServer
+
+SECRET = "test_secret-1"
+
+@pytest.fixture
+def make_server():
+    """Сервер на свободном порту; рабочих потоков нет, очередь не разбирается"""
+    servers = []
+
+    def make(secret: str = SECRET, queue_size: int = 10) -> WebhookServer:
+        server = WebhookServer(lambda updates: None, host="127.0.0.1", port=0, path="/hook",
+                               secret=secret, queue_size=queue_size, workers=0)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+def post(server: WebhookServer, update_id: int, token=None) -> int:
+    """Код ответа на POST одного обновления"""
+    headers = {"Content-Type": "application/json"}
+    if token is not None:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = token
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.port}/hook",
+        data=json.dumps({"update_id": update_id}).encode("utf-8"),
+        headers=headers,
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def test_rejects_missing_and_wrong_token(make_server):
+    server = make_server()
+
+    assert post(server, 1) == 403
+    assert post(server, 2, token="wrong") == 403
+    assert post(server, 3, token=SECRET) == 200
+    assert server.updates.qsize() == 1
+
+def test_generates_secret_when_not_configured(make_server):
+    server = make_server(secret="")
+
+    assert server.secret
+    assert post(server, 1) == 403
+    assert post(server, 2, token="") == 403
+    assert post(server, 3, token=server.secret) == 200
+
+def test_full_queue_answers_503(make_server):
+    server = make_server(queue_size=2)
+
+    assert [post(server, update_id, token=SECRET) for update_id in range(3)] == [200, 200, 503]
+    assert server.updates.qsize() == 2
@@ -0,0 +1,138 @@
+"""
+Приём обновлений через webhook
+"""
+
+import hmac
+import json
+import logging
+import queue
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+from telebot.types import Update
+
+from config import (
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер тела запроса с обновлением
+MAX_BODY_SIZE = 1024 * 1024
+
+class WebhookServer:
+    """HTTP-сервер, принимающий обновления от Telegram.
+
+    Запрос проверяется по пути и заголовку X-Telegram-Bot-Api-Secret-Token,
+    без которого любой мог бы прислать обновление от чужого имени; если
+    WEBHOOK_SECRET не задан, секрет генерируется при запуске и передаётся
+    Telegram в set_webhook (см. secret). Обновление кладётся в ограниченную очередь и сразу подтверждается.
+    Рабочие потоки передают обновления в process(updates). Если очередь
+    заполнена, сервер отвечает 503 и Telegram повторит доставку позже.
+    """
+
+    def __init__(self, process: Callable[[List[Update]], None],
+                 host: str = WEBHOOK_HOST,
+                 port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH,
+                 secret: str = WEBHOOK_SECRET,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS):
+        self.process = process
+        self.path = path
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.workers = workers
+        self.updates = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._server = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def port(self) -> int:
+        """Фактический порт (полезно при port=0)"""
+        return self._server.server_address[1]
+
+    def _make_request_handler(self):
+        """Класс обработчика HTTP-запросов, привязанный к этому серверу"""
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+
+                token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+                if not hmac.compare_digest(token, server.secret):
+                    self._reply(403)
+                    return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                if length <= 0 or length > MAX_BODY_SIZE:
+                    self._reply(400)
+                    return
+
+                try:
+                    update = Update.de_json(json.loads(self.rfile.read(length)))
+                except (ValueError, KeyError, TypeError):
+                    self._reply(400)
+                    return
+
+                try:
+                    server.updates.put_nowait(update)
+                except queue.Full:
+                    logger.warning("Очередь webhook переполнена, обновление отклонено")
+                    self._reply(503)
+                    return
+
+                self._reply(200)
+
+            def _reply(self, status: int):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(f"webhook: {format % args}")
+
+        return RequestHandler
+
+    def _worker(self):
+        """Передача обновлений из очереди в обработчики"""
+        while True:
+            update = self.updates.get()
+            if update is None:
+                break
+            try:
+                self.process([update])
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+            finally:
+                self.updates.task_done()
+
+    def start(self):
+        """Запуск рабочих потоков и HTTP-сервера в фоне"""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"webhook-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        server_thread = threading.Thread(target=self._server.serve_forever, name="webhook-server", daemon=True)
+        server_thread.start()
+        self._threads.append(server_thread)
+        logger.info(f"Webhook-сервер слушает порт {self.port}, путь {self.path}")
+
+    def stop(self):
+        """Остановка сервера и рабочих потоков"""
+        self._server.shutdown()
+        self._server.server_close()
+        for _ in range(self.workers):
+            self.updates.put(None)
+        logger.info("Webhook-сервер остановлен")